@@ -1,10 +1,55 @@
 from flask import Flask, render_template, jsonify, request
 from flask_socketio import SocketIO
+import os
+import time
 from audio_manager import AudioManager
+from rigs import RigEngine
+from telemetry import TelemetryPublisher, STREAMS, VERSION
+from presets import PresetStore
+from recorder import DiskRecorder
+from latency import LatencyController
+from backends import default_backend
 
 app = Flask(__name__)
 socketio = SocketIO(app, cors_allowed_origins="*") 
-audio_mgr = AudioManager()
+# Stan serwera budowany na backendzie: karta (sounddevice) albo urządzenie
+# wirtualne (soak.py przekazuje własne); handlery czytają globalne nazwy modułu
+def setup(device_backend=None):
+    global backend, audio_mgr, rig_engine, telemetry, presets, latency
+    backend = device_backend or default_backend()
+    audio_mgr = AudioManager(backend=backend)
+    # Silnik wielu rigów powstaje dopiero przy pierwszym użyciu (patrz rigs())
+    rig_engine = None
+    # Mierniki i tuner: binarne ramki co tick monitora, tylko do subskrybentów
+    telemetry = TelemetryPublisher(audio_mgr.meter_points, lambda sid, frame: socketio.emit('telemetry', frame, to=sid))
+    presets = PresetStore(os.environ.get('VTL_PRESET_DIR', 'presets'))
+    audio_mgr.recorder = DiskRecorder()
+    # Rozmiar bloku: najmniejszy, przy którym p99 obciążenia callbacku < progu (VTL_MAX_LOAD)
+    latency = LatencyController(audio_mgr, float(os.environ.get('VTL_MAX_LOAD', 0.7)))
+    # Próg ciszy [dBFS]: poniżej niego wygasłe efekty nie są liczone (szumiące wejście -> wyżej)
+    audio_mgr.idle_floor = 10 ** (float(os.environ.get('VTL_IDLE_FLOOR_DB', AudioManager.IDLE_FLOOR_DB)) / 20)
+    # Potok wielordzeniowy: do VTL_PIPELINE segmentów łańcucha (blok opóźnienia na segment)
+    audio_mgr.set_pipeline(int(os.environ.get('VTL_PIPELINE', 1)))
+
+# Silnik wielu rigów (jeden kanał = jeden gracz), liczba rigów z VTL_RIGS;
+# budowany przy pierwszym /api/rigs albo zdarzeniu z 'rig', nie przy imporcie
+def rigs():
+    global rig_engine
+    if rig_engine is None: rig_engine = RigEngine(int(os.environ.get('VTL_RIGS', 4)), backend=backend)
+    return rig_engine
+
+# Numer rigu ze zdarzenia Socket.IO; None = brak takiego rigu
+NO_RIG = {'status': 'error', 'message': 'no such rig'}
+def rig_of(data):
+    try: rig = int(data['rig'])
+    except (TypeError, ValueError): return None
+    return rig if 0 <= rig < rigs().rigs else None
+
+# Odpowiedzi impulsowe kolumn (WAV) do wyboru w UI
+IR_DIR = os.environ.get('VTL_IR_DIR', 'irs')
+# Nagrania sesji (DI + wyjście), zapis w tle poza callbackiem
+RECORD_DIR = os.environ.get('VTL_RECORD_DIR', 'recordings')
+setup()
 
 @app.route('/')
 def index():
@@ -21,54 +66,224 @@ def get_devices():
 # NOWOŚĆ: Synchronizacja stanu pedalboardu
 @app.route('/api/get_state')
 def get_state():
-    state = {}
-    for name, effect in audio_mgr.chain.items():
-        state[name] = {
-            'active': effect.active,
-            'params': effect.params
-        }
+    state = audio_mgr.get_state()
+    del state['amp']
     return jsonify(state)
 
+# Metryki silnika audio: czasy etapów (p50/p99/max), xruny, błędy efektów
+@app.route('/api/metrics')
+def get_metrics():
+    return jsonify(audio_mgr.metrics.snapshot())
+
+# Układ ramek telemetrii (nazwy punktów pomiaru, id strumieni)
+@app.route('/api/telemetry')
+def get_telemetry_layout():
+    return jsonify({'version': VERSION, 'streams': STREAMS, 'points': audio_mgr.meter_points,
+                    'rate': audio_mgr.monitor.rate})
+
+# Opóźnienie w obie strony (sterownik + łańcuch), rozmiar bloku i wyniki próby
+@app.route('/api/latency')
+def get_latency():
+    return jsonify(latency.report())
+
+# {threshold: 0..1} - maksymalne p99 obciążenia callbacku, {pipeline: 1..8} - maks. segmentów potoku
+@app.route('/api/latency', methods=['POST'])
+def set_latency():
+    data = request.get_json(silent=True) or {}
+    threshold = float(data.get('threshold', latency.threshold))
+    if not 0.05 <= threshold <= 1.0: return jsonify({'status': 'error', 'message': 'threshold poza 0.05..1'}), 400
+    latency.set_threshold(threshold)
+    if 'pipeline' in data:
+        stages = int(data['pipeline'])
+        if not 1 <= stages <= 8: return jsonify({'status': 'error', 'message': 'pipeline poza 1..8'}), 400
+        audio_mgr.set_pipeline(stages)
+    return jsonify({'status': 'success'})
+
+# --- PRESETY ---
+@app.route('/api/presets')
+def list_presets():
+    return jsonify(presets.list())
+
+# Czasy ostatniej zmiany presetu: przygotowanie, odbiór przez callback, przejście
+@app.route('/api/presets/switch')
+def get_switch_report():
+    return jsonify(audio_mgr.switch_report())
+
+@app.route('/api/presets/<name>')
+def get_preset(name):
+    try:
+        return jsonify(presets.load(name))
+    except (OSError, ValueError) as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 404
+
+# Zapis: stan z body albo bieżący stan łańcucha
+@app.route('/api/presets/<name>', methods=['POST'])
+def save_preset(name):
+    data = request.get_json(silent=True) or {}
+    try:
+        presets.save(name, data.get('state') or audio_mgr.get_state(), data.get('label'))
+        return jsonify({'status': 'success'})
+    except (OSError, ValueError) as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+@app.route('/api/presets/<name>/load', methods=['POST'])
+def load_preset(name):
+    try:
+        audio_mgr.switch_state(presets.load(name))
+    except (OSError, ValueError) as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 404
+    socketio.emit('preset_loaded', {'name': name})
+    return jsonify({'status': 'success', 'switch': audio_mgr.switch_report()})
+
+# --- NAGRYWANIE I LOOPER ---
+# dropped_blocks > 0 = dysk nie nadążył (bloki pominięte, callback nie czekał)
+@app.route('/api/recorder')
+def get_recorder():
+    return jsonify(audio_mgr.recorder.status())
+
+@app.route('/api/recorder/start', methods=['POST'])
+def start_recording():
+    name = (request.get_json(silent=True) or {}).get('name') or time.strftime('%Y%m%d-%H%M%S')
+    path = os.path.join(RECORD_DIR, os.path.basename(name) + '.wav')
+    try:
+        audio_mgr.recorder.start(path, audio_mgr.fs)
+    except OSError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+    return jsonify({'status': 'success', 'path': path})
+
+@app.route('/api/recorder/stop', methods=['POST'])
+def stop_recording():
+    return jsonify(audio_mgr.recorder.stop())
+
+@app.route('/api/looper')
+def get_looper():
+    return jsonify(audio_mgr.looper.status())
+
+@app.route('/api/cabinets')
+def get_cabinets():
+    files = sorted(f for f in os.listdir(IR_DIR) if f.lower().endswith('.wav')) if os.path.isdir(IR_DIR) else []
+    current = os.path.basename(audio_mgr.cabinet.ir) if audio_mgr.cabinet.ir else None
+    return jsonify({'cabinets': files, 'current': current, 'latency': audio_mgr.cabinet.latency})
+
 @app.route('/api/select_devices', methods=['POST'])
 def select_devices():
     data = request.json
     selected_id = data.get('id')
     
-    def send_data_to_socket(volume, tuner_data):
-        # Wysyłamy paczkę danych: głośność + tuner (jeśli dostępny)
-        payload = {'level': volume}
-        if tuner_data:
-            payload['tuner'] = tuner_data
-            
-        socketio.emit('audio_update', payload) # Zmieniona nazwa eventu na 'audio_update'
-    # ---------------------------------------
-    
     try:
-        audio_mgr.start_streaming(selected_id, send_data_to_socket)
+        latency.start(selected_id, telemetry.publish)
         return jsonify({'status': 'success'})
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
     
+# --- RIGI (silnik batch) ---
+@app.route('/api/rigs')
+def get_rigs():
+    engine = rigs()
+    return jsonify({'rigs': engine.rigs, 'fs': engine.fs, 'streaming': engine.stream is not None})
+
+@app.route('/api/rigs/<int:rig>/get_state')
+def get_rig_state(rig):
+    if not 0 <= rig < rigs().rigs: return jsonify(NO_RIG), 404
+    return jsonify(rigs().get_state(rig))
+
+@app.route('/api/rigs/metrics')
+def get_rig_metrics():
+    return jsonify(rigs().metrics.snapshot())
+
+@app.route('/api/rigs/select_device', methods=['POST'])
+def select_rig_device():
+    try:
+        rigs().start_streaming(request.json.get('id'))
+        return jsonify({'status': 'success'})
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+# --- TELEMETRIA: {streams: ['levels', 'stages', 'tuner']} ---
+@socketio.on('subscribe')
+def handle_subscribe(data):
+    telemetry.subscribe(request.sid, data.get('streams', []))
+    audio_mgr.meter_stages = telemetry.wants('stages')
+
+@socketio.on('disconnect')
+def handle_disconnect():
+    telemetry.unsubscribe(request.sid)
+    audio_mgr.meter_stages = telemetry.wants('stages')
+
+@socketio.on('get_metrics')
+def handle_get_metrics():
+    socketio.emit('metrics', audio_mgr.metrics.snapshot(), to=request.sid)
+
 # --- AMP CONTROLS ---
 @socketio.on('change_gain')
 def handle_gain(data):
-    audio_mgr.set_gain(data.get('value', 1.0))
+    if 'rig' in data:
+        rig = rig_of(data)
+        if rig is None: return NO_RIG
+        rigs().set_gain(rig, data.get('value', 1.0))
+    else: audio_mgr.set_gain(data.get('value', 1.0))
 
 @socketio.on('update_param')
 def handle_param(data):
     param = data.get('param')
     val = data.get('value')
-    if param == 'gain': audio_mgr.set_gain(val)
+    if 'rig' in data:
+        rig = rig_of(data)
+        if rig is None: return NO_RIG
+        if param == 'gain': rigs().set_gain(rig, val)
+        elif param in rigs().eq_params[rig]: rigs().eq_params[rig][param] = val / 10.0
+    elif param == 'gain': audio_mgr.set_gain(val)
     elif param in audio_mgr.eq_params: audio_mgr.eq_params[param] = val / 10.0
 
 # --- PEDALBOARD CONTROLS ---
+@socketio.on('load_preset')
+def handle_load_preset(data):
+    name = data.get('name') if isinstance(data, dict) else None
+    if not isinstance(name, str) or not name:
+        return {'status': 'error', 'message': 'brak nazwy presetu'}
+    try:
+        audio_mgr.switch_state(presets.load(name))
+    except (OSError, ValueError) as e:
+        print(f"!!! Preset {name}: {e}")
+        return {'status': 'error', 'message': str(e)}
+    socketio.emit('preset_loaded', {'name': name})
+
 @socketio.on('toggle_effect')
 def handle_toggle(data):
-    audio_mgr.set_effect_state(data.get('name'), data.get('active'))
+    if 'rig' in data:
+        rig = rig_of(data)
+        if rig is None: return NO_RIG
+        rigs().set_effect_state(rig, data.get('name'), data.get('active'))
+    else: audio_mgr.set_effect_state(data.get('name'), data.get('active'))
 
 @socketio.on('update_effect')
 def handle_update(data):
-    audio_mgr.set_effect_param(data.get('name'), data.get('param'), float(data.get('value')))
+    if 'rig' in data:
+        rig = rig_of(data)
+        if rig is None: return NO_RIG
+        rigs().set_effect_param(rig, data.get('name'), data.get('param'), float(data.get('value')))
+    else: audio_mgr.set_effect_param(data.get('name'), data.get('param'), float(data.get('value')))
+
+# Looper: {action: press/record/play/overdub/stop/clear} i/lub {level: 0..1}
+@socketio.on('looper')
+def handle_looper(data):
+    looper = audio_mgr.looper
+    if 'level' in data: looper.params['level'] = float(data['level'])
+    try:
+        if data.get('action'): looper.command(data['action'])
+    except ValueError as e:
+        print(f"!!! {e}")
+
+# Kolumna: nazwa pliku z IR_DIR, pusta = bez kolumny
+@socketio.on('set_cabinet')
+def handle_cabinet(data):
+    name = data.get('name')
+    audio_mgr.set_cabinet(os.path.join(IR_DIR, os.path.basename(name)) if name else None)
+
+# Nadpróbkowanie nieliniowości: 1/2/4/8x dla waveshaperów i 'amp'
+@socketio.on('set_oversample')
+def handle_oversample(data):
+    audio_mgr.set_oversample(data.get('name'), int(data.get('factor', 1)))
 
 if __name__ == '__main__':
     socketio.run(app, debug=True)
\ No newline at end of file
@@ -1,42 +1,129 @@
-import sounddevice as sd
+import threading
 import numpy as np
+from functools import partial
+from time import perf_counter, sleep
+from backends import default_backend
 from effects import (
     BossTU3, BossCS3, BossPS6, BossDS1, BossOD1, BossFZ5, 
-    BossBF3, BossBP1W, BossCE2W, BossDM2W, BossRV6
+    BossBF3, BossBP1W, BossCE2W, BossDM2W, BossRV6, BossRC1
 )
+from dsp import (
+    Workspace, TransferTable, Oversampler, GainRamp, PartitionedConvolver, SOSCascade, SerialState, biquad,
+    OVERSAMPLE_FACTORS
+)
+from metrics import CallbackMetrics
+from params import Params
+from monitor import AudioMonitor
+from ringbuffer import SPSCRing
+from pipeline import ChainPipeline
+
+# --- PEDALBOARD (kolejność w łańcuchu) ---
+PEDALBOARD = [
+    ('tuner', BossTU3),
+    ('comp', BossCS3),
+    ('pitch', BossPS6),
+    ('dist', BossDS1),
+    ('drive', BossOD1),
+    ('fuzz', BossFZ5),
+    ('boost', BossBP1W),
+    ('flanger', BossBF3),
+    ('chorus', BossCE2W),
+    ('delay', BossDM2W),
+    ('reverb', BossRV6),
+]
+DEFAULT_EQ = {'treble': 0.5, 'middle': 0.5, 'bass': 0.5, 'presence': 0.5, 'master': 0.5}
+# Stos barwy (JCM 900): gałka -> (typ, f0 [Hz], zakres [dB], Q), 0.5 = płasko
+TONE_STACK = [
+    ('bass', 'low', 100.0, 12.0, 0.707),
+    ('middle', 'peak', 650.0, 12.0, 0.8),
+    ('treble', 'high', 3200.0, 12.0, 0.707),
+    ('presence', 'high', 6000.0, 6.0, 0.707),
+]
 
 class AudioManager:
-    def __init__(self):
-        self.refresh_devices()
+    FUSE_MIN = 3
+    # Zmiana presetu: stan łańcucha podmieniany po przejściu (patrz switch_state)
+    CHAIN_STATE = ('chain', 'gain', 'eq_params', 'input_gain', 'amp_volume', 'tone_stack', 'cabinet',
+                   'amp_oversampler', 'amp_key', 'amp_cache', 'amp_run', 'tables', 'table_oversamplers', 'plan_key', 'plan_latency',
+                   'plan_idle', 'idle_all', 'idle_armed', 'pipeline')
+    FADE_MS = 30.0
+    # Ile czekać, aż callback odbierze poprzedni preset w drodze
+    SWITCH_TIMEOUT = 2.0
+    # Próg ciszy: wejście etapu i jego stan poniżej -> etap wygasł (patrz _process)
+    IDLE_FLOOR_DB = -80.0
+
+    def __init__(self, devices=True, backend=None):
+        # Karta (sounddevice) albo urządzenie wirtualne - patrz backends.py
+        self.backend = backend or default_backend()
+        if devices: self.refresh_devices()
+        else: self.devices = []
         self.stream = None
+        self.stream_devices = (None, None)
         self.fs = 44100 # Bezpieczny start
-        self.callback_function = None
         self.gain = 1.0 
-        self.eq_params = {'treble': 0.5, 'middle': 0.5, 'bass': 0.5, 'presence': 0.5, 'master': 0.5}
-        self.tuner_timer = 0 
+        self.eq_params = Params(DEFAULT_EQ)
+        self.amp_key = self.amp_cache = None
+        # Indeks sklejonego ciągu kończącego się wzmacniaczem, None = tanh osobno
+        self.amp_run = None
+        # Rampy gałek głośności (wejście, master) - bez trzasków przy kręceniu
+        self.input_gain = GainRamp()
+        self.amp_volume = GainRamp()
+        self.tone_stack = SOSCascade(len(TONE_STACK))
 
         # --- PEDALBOARD ---
-        self.chain = {
-            'tuner': BossTU3(self.fs),
-            'comp':  BossCS3(self.fs),
-            'pitch': BossPS6(self.fs),
-            'dist':  BossDS1(self.fs),
-            'drive': BossOD1(self.fs),
-            'fuzz':  BossFZ5(self.fs),
-            'boost': BossBP1W(self.fs),
-            'flanger': BossBF3(self.fs),
-            'chorus': BossCE2W(self.fs),
-            'delay':  BossDM2W(self.fs),
-            'reverb': BossRV6(self.fs)
-        }
-        self.order = ['tuner', 'comp', 'pitch', 'dist', 'drive', 'fuzz', 'boost', 'flanger', 'chorus', 'delay', 'reverb']
+        self.chain = {name: cls(self.fs) for name, cls in PEDALBOARD}
+        self.order = [name for name, _ in PEDALBOARD]
+        # Kolumna (splot z IR), włączona po wczytaniu IR - patrz set_cabinet
+        self.cabinet = PartitionedConvolver()
+        # Looper za całym łańcuchem (poza CHAIN_STATE): pętla gra dalej po zmianie presetu
+        self.looper = BossRC1(self.fs)
+        # Nagrywanie DI + wyjścia (recorder.DiskRecorder), podpinane przez aplikację
+        self.recorder = None
+        # Etapy: wejście, efekty w kolejności self.order, wzmacniacz, kolumna
+        self.metrics = CallbackMetrics(['input'] + self.order + ['amp', 'cab'])
+        # Mierniki -> wątek monitora (FFT tunera i Socket.IO poza callbackiem).
+        # Wiersz na blok: peak każdego punktu, suma kwadratów, liczba próbek.
+        # Punkty pośrednie (po krokach planu) tylko gdy ktoś je subskrybuje.
+        self.meter_points = self.metrics.stages + ['output']
+        self.meter_row = np.zeros((1, 2 * len(self.meter_points) + 1), dtype=np.float32)
+        self.meter_ring = SPSCRing(256, channels=self.meter_row.shape[1])
+        self.meter_stages = False
+        self.monitor = AudioMonitor(self)
+        # Bloki mono float32 należące do managera (ping-pong między efektami)
+        self.ws = Workspace()
+        # Skompilowany plan łańcucha (sklejone waveshapery), patrz _compile
+        self.plan = []
+        self.plan_key = None
+        # Opóźnienie planu w próbkach (nadpróbkowanie + kolumna)
+        self.plan_latency = 0
+        # Na krok planu: [stan (tail/energy/reset), próbki ciszy na wejściu,
+        # szczyt ostatniego wyjścia, wygasły, zegar skip(n) albo None];
+        # ujemny próg wyłącza pomijanie
+        self.plan_idle = []
+        self.idle_floor = 10 ** (self.IDLE_FLOOR_DB / 20)
+        self.idle_all = self.idle_armed = False
+        # Potok wielordzeniowy (pipeline.py), None = cały plan w callbacku
+        self.pipeline = None
+        # Zakres etapów planu (od, do) do renderu fragmentu łańcucha offline
+        # (tonematch.py); None = cały łańcuch
+        self.span = None
+        self.tables = []
+        self.table_oversamplers = []
+        self.amp_oversampler = Oversampler(1)
+        # Preset w drodze (przygotowany manager) i ten, który właśnie zszedł
+        self.incoming = None
+        self.retired = None
+        self.switch_lock = threading.Lock()
+        self.fade_pos = 0
+        self.last_frames = 0
+        self.switch_times = np.zeros(4) # żądanie, gotowy, start przejścia, koniec
         self.lp_memory = 0.0
         self.hp_memory_in = 0.0
         self.hp_memory_out = 0.0
 
     def refresh_devices(self):
         try:
-            self.devices = sd.query_devices()
+            self.devices = self.backend.query_devices()
         except:
             self.devices = []
 
@@ -46,7 +133,7 @@ class AudioManager:
         input_devices = []
         print("\n--- DOSTĘPNE STEROWNIKI ---")
         for i, dev in enumerate(self.devices):
-            hostapi_name = sd.query_hostapis(dev['hostapi'])['name']
+            hostapi_name = self.backend.query_hostapis(dev['hostapi'])['name']
             
             # BLOKUJEMY TYLKO WDM-KS (Bo on u Ciebie nie działa)
             if "WDM-KS" in dev['name'] or "KS" in hostapi_name:
@@ -66,7 +153,7 @@ class AudioManager:
 
     def _find_matching_output(self, input_id):
         try:
-            in_info = sd.query_devices(input_id)
+            in_info = self.backend.query_devices(input_id)
             target_api = in_info['hostapi']
             # Szukamy Focusrite na tym samym API
             for i, dev in enumerate(self.devices):
@@ -77,9 +164,116 @@ class AudioManager:
             for i, dev in enumerate(self.devices):
                 if dev['hostapi'] == target_api and dev['max_output_channels'] > 0:
                     return i
-            return sd.default.device[1]
+            return self.backend.default_output()
         except:
-            return sd.default.device[1]
+            return self.backend.default_output()
+
+    def set_samplerate(self, fs):
+        # Przed otwarciem strumienia: efekty budują bufory pod nowe fs
+        self.fs = fs
+        for ef in self.chain.values(): ef.prepare(fs)
+        self.looper.prepare(fs)
+        # IR przepróbkowana do nowego fs (z cache, jeśli już była)
+        if self.cabinet.ir: self.cabinet.load(self.cabinet.ir, fs)
+
+    def set_cabinet(self, path):
+        # Ścieżka do IR w WAV; None / '' wyłącza kolumnę
+        if path: self.cabinet.load(path, self.fs)
+        else: self.cabinet.unload()
+
+    def load_state(self, state):
+        # Format jak /api/get_state + opcjonalnie 'amp': {'gain': .., 'eq': {..}, 'cab': ..}
+        for name, cfg in state.items():
+            if name == 'amp':
+                self.set_gain(cfg.get('gain', self.gain))
+                self.eq_params.update(cfg.get('eq', {}))
+                self.set_oversample(name, int(cfg.get('oversample', 1)))
+                if 'cab' in cfg: self.set_cabinet(cfg['cab'])
+            elif name in self.chain:
+                self.set_effect_state(name, cfg.get('active', False))
+                for param, value in cfg.get('params', {}).items():
+                    self.set_effect_param(name, param, float(value))
+                self.set_oversample(name, int(cfg.get('oversample', 1)))
+
+    def get_state(self):
+        # Format load_state / presetów
+        state = {name: {'active': fx.active, 'params': dict(fx.params), 'oversample': fx.oversampler.factor}
+                 for name, fx in self.chain.items()}
+        state['amp'] = {'gain': self.gain, 'eq': dict(self.eq_params), 'oversample': self.amp_oversampler.factor}
+        if self.cabinet.ir: state['amp']['cab'] = self.cabinet.ir
+        return state
+
+    # --- ZMIANA PRESETU (przejście bez trzasków) ---
+    # Nowy łańcuch powstaje poza wątkiem audio jako osobny manager: efekty
+    # z gałkami, współczynniki, plan, tablice przejścia i bufory robocze pod
+    # bieżący rozmiar bloku (jeden blok ciszy na rozgrzewkę). Callback liczy
+    # przez FADE_MS oba łańcuchy i miesza je krzywymi równej mocy (sin/cos),
+    # po czym zamienia się z przygotowanym managerem atrybutami CHAIN_STATE -
+    # bez alokacji i bez kompilacji planu. Kroki planu związane z managerem
+    # (wzmacniacz, stos barwy) są przepięte na nas już przy przygotowaniu.
+    # Stary łańcuch zostaje w self.retired, żeby nie zwalniać buforów w callbacku.
+    def switch_state(self, state, blocksize=None, immediate=None):
+        # Jedna zmiana naraz: równoległe żądania (HTTP, Socket.IO) czekają w kolejce
+        with self.switch_lock:
+            self._switch_state(state, blocksize, immediate)
+
+    def _streaming(self):
+        return self.stream is not None and getattr(self.stream, 'active', True)
+
+    def _switch_state(self, state, blocksize, immediate):
+        requested = perf_counter()
+        # Poprzedni preset w drodze: odbiera go callback; gdy strumień nie gra
+        # (zatrzymany, nigdy nie wystartował), nikt go nie odbierze - bierzemy go sami
+        deadline = requested + self.SWITCH_TIMEOUT
+        while self.incoming is not None and self._streaming():
+            if perf_counter() > deadline: raise TimeoutError("callback nie odebrał poprzedniego presetu")
+            sleep(0.001)
+        if self.incoming is not None: self._adopt(self.incoming)
+        if self.retired is not None and self.retired.pipeline: self.retired.pipeline.close()
+        self.retired = None
+
+        incoming = AudioManager(devices=False)
+        incoming.set_samplerate(self.fs)
+        if self.cabinet.ir: incoming.set_cabinet(self.cabinet.ir)
+        incoming.load_state(state)
+        # Ten sam potok (i opóźnienie) co bieżący łańcuch, żeby przejście było wyrównane
+        if self.pipeline: incoming.set_pipeline(self.pipeline.stages, self.pipeline.cuts)
+        incoming.process_block(np.zeros((blocksize or self.last_frames or 512, 2), dtype=np.float32))
+        incoming.handover = [(i, step.__func__.__get__(self) if getattr(step, '__self__', None) is incoming else step)
+                             for i, step in incoming.plan]
+        fade = max(1, int(self.fs * self.FADE_MS / 1000))
+        t = (np.arange(fade) + 0.5) / fade * (np.pi / 2)
+        incoming.fade_in = np.sin(t).astype(np.float32)
+        incoming.fade_out = np.cos(t).astype(np.float32)
+
+        self.switch_times[:] = (requested, perf_counter(), 0.0, 0.0)
+        if immediate is None: immediate = not self._streaming()
+        if immediate:
+            # Bez strumienia nie ma czego przenikać
+            self._adopt(incoming)
+            self.switch_times[2:] = perf_counter()
+        else:
+            self.fade_pos = 0
+            self.incoming = incoming
+
+    def _adopt(self, incoming):
+        for name in self.CHAIN_STATE:
+            mine = getattr(self, name)
+            setattr(self, name, getattr(incoming, name))
+            setattr(incoming, name, mine)
+        self.plan, incoming.plan = incoming.handover, self.plan
+        self.retired = incoming
+        self.incoming = None
+
+    def switch_report(self):
+        requested, ready, started, done = self.switch_times
+        if not done: return {'pending': self.incoming is not None}
+        return {
+            'prepare_ms': (ready - requested) * 1e3,
+            'pickup_ms': (started - ready) * 1e3,
+            'fade_ms': (done - started) * 1e3,
+            'total_ms': (done - requested) * 1e3,
+        }
 
     def set_effect_state(self, name, is_active):
         if name in self.chain: self.chain[name].active = is_active
@@ -88,122 +282,385 @@ class AudioManager:
         if name in self.chain and param in self.chain[name].params:
             self.chain[name].params[param] = value
 
-    def apply_amp_sim(self, signal):
+    # --- POTOK (opcjonalny, patrz pipeline.py) ---
+    def set_pipeline(self, stages, cuts=()):
+        # stages = maks. liczba segmentów (wątek callbacku + stages - 1 wątków); 1 = wyłączony
+        old = self.pipeline
+        self.pipeline = ChainPipeline(stages) if stages > 1 else None
+        if self.pipeline: self.pipeline.cuts = tuple(cuts)
+        if old: old.close()
+
+    def rebalance(self, window=256):
+        # Podział planu wg mediany czasu etapów z ostatnich bloków (poza callbackiem);
+        # True = nowy podział, callback przełoży kroki przy następnym bloku
+        pipe, m = self.pipeline, self.metrics
+        n = min(m.count, m.capacity, window)
+        if pipe is None or n == 0: return False
+        groups = sorted({i for i, _ in self.plan})
+        if not groups: return False
+        costs = np.median(m.times[groups][:, (m.pos - np.arange(1, n + 1)) % m.capacity], axis=1)
+        return pipe.rebalance(groups, costs)
+
+    def set_oversample(self, name, factor):
+        # Nadpróbkowanie tylko dla nieliniowości (waveshapery + wzmacniacz)
+        if factor not in OVERSAMPLE_FACTORS: return
+        if name == 'amp':
+            if factor != self.amp_oversampler.factor: self.amp_oversampler = Oversampler(factor)
+        elif name in self.chain and self.chain[name].shaper:
+            self.chain[name].set_oversample(factor)
+
+    @staticmethod
+    def _amp_derive(p):
         # --- WERSJA "SAFE MODE" (GWARANCJA DŹWIĘKU) ---
         
         # 1. Pobierz ustawienia gałek
-        master = self.eq_params.get('master', 0.5)
-        bass = self.eq_params.get('bass', 0.5)
-        mid = self.eq_params.get('middle', 0.5)
-        treble = self.eq_params.get('treble', 0.5)
-        gain = self.eq_params.get('preamp', 0.5)
+        master = p.get('master', 0.5)
+        gain = p.get('preamp', 0.5)
 
         # 2. Zabezpieczenie: Jeśli Master jest 0, ustaw na połowę (dla testu)
         if master <= 0.05: 
             master = 0.5
 
-        # 3. Prosta symulacja EQ (zamiast filtrów)
-        # Podbijamy sygnał w zależności od ustawień EQ
-        eq_factor = 0.8 + (bass * 0.2) + (mid * 0.4) + (treble * 0.3)
-        
-        # 4. Dodajemy lekki "brud" (przester) od Preampu
+        # 3. Dodajemy lekki "brud" (przester) od Preampu, 4. Wyjście: mnożymy
+        # przez Master. 2.5 to zapas głośności (EQ robi stos barwy, patrz _tone_stack).
+        return 1.0 + gain * 5.0, master * 2.5
+
+    @staticmethod
+    def _tone_stack(p, fs):
+        # Sekcje SOS (4 x 6) dla gałek EQ przy danym fs
+        return np.array([biquad(kind, f0, (p.get(knob, 0.5) - 0.5) * 2.0 * span, q, fs)
+                         for knob, kind, f0, span, q in TONE_STACK])
+
+    def amp_coefs(self):
+        # Jak Effect.coefs: przeliczane tylko po zmianie wersji gałek albo fs
+        key = (self.eq_params.version, self.fs)
+        if key != self.amp_key:
+            p = self.eq_params.snapshot()
+            self.amp_cache = self._amp_derive(p) + (self._tone_stack(p, self.fs),)
+            self.amp_key = key
+        return self.amp_cache
+
+    def amp_curve(self, x):
+        drive, volume, _ = self.amp_coefs()
+        return np.tanh(x * drive) * volume
+
+    def apply_amp_shape(self, signal, out):
         # Tanh tworzy miękkie obcinanie (tube sound)
-        drive_signal = np.tanh(signal * (1.0 + gain * 5.0))
+        drive, volume, _ = self.amp_coefs()
+        np.multiply(signal, drive, out=out)
+        np.tanh(out, out=out)
+        return self.amp_volume.apply(out, volume)
 
-        # 5. Wyjście
-        # Mnożymy przez Master i EQ. 2.0 to zapas głośności.
-        output = drive_signal * master * eq_factor * 2.0
-        
-        return output
+    def apply_tone_stack(self, signal, out):
+        # Liniowy i z pamięcią: za tanh, przy fs strumienia (bez nadpróbkowania)
+        return self.tone_stack.process(signal, out, self.amp_coefs()[2])
+
+    def apply_amp_sim(self, signal, out):
+        # Cały wzmacniacz w jednym kroku planu: przester (nadpróbkowany albo
+        # sklejony z pedałami w tablicę przejścia amp_run, patrz _compile),
+        # za nim stos barwy
+        shaped = self.ws.get('amp', len(signal))
+        k = self.amp_run
+        if k is None: self.amp_oversampler.process(signal, shaped, self.apply_amp_shape)
+        else: self.table_oversamplers[k].process(signal, shaped, self.tables[k].process)
+        return self.apply_tone_stack(shaped, out)
+
+    # --- KOMPILACJA ŁAŃCUCHA ---
+    # Kolejne aktywne etapy bez pamięci (OD-1, FZ-5, BP-1W, clipping DS-1,
+    # tanh wzmacniacza) są sklejane w jedną tablicę przejścia: przejście po
+    # bloku kosztuje tyle samo, ile pedałów by nie stało obok siebie.
+    # Odczyt z tablicy to ~11 przejść numpy, a np. tanh wzmacniacza tylko 3,
+    # więc krótsze ciągi (< FUSE_MIN) liczymy dokładnie, bez tablicy. Sklejony
+    # ciąg jest nadpróbkowany najwyższym współczynnikiem spośród swoich etapów.
+    # Plan jest przebudowywany tylko wtedy, gdy zmieni się włączenie efektu,
+    # nadpróbkowanie albo wersja parametrów któregoś z waveshaperów.
+    def _plan_key(self):
+        key = [self.eq_params.version, self.amp_oversampler.factor, self.cabinet.ir, self.span]
+        for name in self.order:
+            fx = self.chain[name]
+            shaper = fx.active and fx.shaper
+            key.append((fx.active, fx.params.version if shaper else None,
+                        fx.oversampler.factor if shaper else None, fx.active and fx.latency))
+        return tuple(key)
+
+    def _run_step(self, k, run):
+        # Tablica (i oversampler) k-tego sklejonego ciągu - używane ponownie
+        if k == len(self.tables):
+            self.tables.append(TransferTable())
+            self.table_oversamplers.append(Oversampler(1))
+        table = self.tables[k]
+        table.build([curve for _, curve, *_ in run])
+        factor = max(f for _, _, _, f, *_ in run)
+        if factor == 1: return table.process
+        if self.table_oversamplers[k].factor != factor:
+            self.table_oversamplers[k] = Oversampler(factor)
+        return partial(self.table_oversamplers[k].process, shaper=table.process)
+
+    def _compile(self):
+        plan = []
+        states = [] # obiekt z tail/energy/reset dla każdego kroku planu
+        run = [] # (etap, krzywa, dokładne shape, nadpróbkowanie, opóźnienie, stan)
+        runs = latency = 0
+        amp = len(self.order) + 1
+        self.amp_run = None
+
+        def flush():
+            nonlocal runs, latency
+            if len(run) < self.FUSE_MIN:
+                plan.extend((i, shape) for i, _, shape, *_ in run)
+                states.extend(state for *_, state in run)
+                latency += sum(lat for *_, lat, _ in run)
+            else:
+                step = self._run_step(runs, run)
+                # Sklejony ciąg ma jeden oversampler o największym współczynniku
+                state = self.table_oversamplers[runs]
+                if run[-1][0] == amp:
+                    # Ciąg kończy wzmacniacz: tablica i stos barwy w apply_amp_sim
+                    self.amp_run, step = runs, self.apply_amp_sim
+                    state = SerialState(state, self.tone_stack)
+                plan.append((run[0][0], step))
+                states.append(state)
+                latency += max(lat for *_, lat, _ in run)
+                runs += 1
+            run.clear()
+
+        lo, hi = self.span or (1, len(self.order) + 2)
+        for i, name in enumerate(self.order, 1):
+            fx = self.chain[name]
+            if not fx.active or not lo <= i <= hi: continue
+            if fx.shaper:
+                run.append((i, fx.curve, fx.shape, fx.oversampler.factor, fx.oversampler.latency, fx))
+            if fx.shaper == 'pre':
+                flush()
+                plan.append((i, fx.apply_post))
+                states.append(fx)
+            elif not fx.shaper:
+                flush()
+                plan.append((i, fx.process))
+                states.append(fx)
+                latency += fx.latency
+        if lo <= amp <= hi:
+            run.append((amp, self.amp_curve, self.apply_amp_sim, self.amp_oversampler.factor, self.amp_oversampler.latency,
+                        SerialState(self.amp_oversampler, self.tone_stack)))
+        flush()
+        if self.cabinet.ir and lo <= amp + 1 <= hi:
+            plan.append((amp + 1, self.cabinet.process))
+            states.append(self.cabinet)
+            latency += self.cabinet.latency
+        self.plan = plan
+        self.plan_latency = latency
+        self.plan_idle = [[state, 0, np.inf, False, getattr(state, 'skip', None)] for state in states]
+        self.idle_all = self.idle_armed = False
+
+    def process_block(self, indata):
+        incoming = self.incoming
+        out = self._process(indata) if incoming is None else self._crossfade(indata, incoming)
+        out = self.looper.process(out, self.ws.get('looper', len(out)))
+        self._meter(len(self.meter_points) - 1, out)
+        # Widok na bufor managera - ważny do następnego wywołania
+        return out
+
+    def _crossfade(self, indata, incoming):
+        # Przejście między łańcuchami: stary * cos + nowy * sin
+        old = self._process(indata)
+        if self.fade_pos == 0: self.switch_times[2] = perf_counter()
+        new = incoming._process(indata)
+        pos = self.fade_pos
+        m = min(len(new), len(incoming.fade_in) - pos)
+        new[:m] *= incoming.fade_in[pos:pos + m]
+        old[:m] *= incoming.fade_out[pos:pos + m]
+        new[:m] += old[:m]
+        self.fade_pos = pos + m
+        if self.fade_pos == len(incoming.fade_in):
+            self._adopt(incoming)
+            self.switch_times[3] = perf_counter()
+        # Bufor przygotowanego managera (teraz self.retired) - ważny do następnego wywołania
+        return new
+
+    def _process(self, indata):
+        metrics = self.metrics
+        metrics.begin_block()
+        t_start = t_prev = perf_counter()
+
+        # Dwa prealokowane bloki: efekt czyta z signal i pisze do spare
+        n = len(indata)
+        self.last_frames = n
+        signal = self.ws.get('block_a', n)
+        spare = self.ws.get('block_b', n)
 
-    def audio_callback(self, indata, outdata, frames, time, status):
         # 1. Wejście (Suma kanałów)
         if indata.shape[1] >= 2:
-            signal = (indata[:, 0:1] + indata[:, 1:2]) * 0.5
+            np.add(indata[:, 0], indata[:, 1], out=signal)
+            self.input_gain.apply(signal, 0.5 * self.gain)
         else:
-            signal = indata[:, 0:1]
-
-        signal = signal * self.gain
-        
-        # --- POMIAR 1: WEJŚCIE ---
-        vol_in = float(np.abs(signal).mean() * 100)
+            signal[:] = indata[:, 0]
+            self.input_gain.apply(signal, self.gain)
+        row = self.meter_row[0]
+        row[:-1] = np.nan
+        row[-1] = n
+        self._meter(0, signal)
+        t = perf_counter(); metrics.record_stage(0, t - t_prev); t_prev = t
 
-        # 2. PĘTLA EFEKTÓW (Tu może ginąć dźwięk)
-        for name in self.order:
-            # ZABEZPIECZENIE: Jeśli któryś efekt zwraca błędy, zignoruj go
+        # 2. PĘTLA EFEKTÓW + WZMACNIACZ (plan przebudowany tylko po zmianach)
+        key = self._plan_key()
+        if key != self.plan_key:
+            self._compile()
+            self.plan_key = key
+        pipe = self.pipeline
+        piped = pipe.run(self, signal, self.plan) if pipe is not None else None
+        if piped is not None:
+            signal = piped
+            t = perf_counter()
+        # Cisza na wejściu łańcucha (szczyt z miernika wejścia)
+        quiet = piped is None and row[0] <= self.idle_floor
+        if quiet and self.idle_all:
+            # Wszystkie etapy wygasłe: gotowa cisza, liczą się tylko zegary (LFO)
+            signal.fill(0.0)
+            for idle in self.plan_idle:
+                if idle[4] is not None: idle[4](n)
+            t = perf_counter()
+        elif not quiet and self.idle_armed:
+            # Sygnał: wszystkie etapy liczą już ten blok (pobudka bez opóźnienia)
+            for idle in self.plan_idle: idle[1:4] = 0, np.inf, False
+            self.idle_all = self.idle_armed = False
+        skipped = 0
+        for k, (i, step) in enumerate(self.plan) if piped is None and not (quiet and self.idle_all) else ():
+            if quiet and self._idle(k, signal, n):
+                skipped += 1
+                continue
+            # ZABEZPIECZENIE: Jeśli któryś efekt zwraca błędy, pomiń go (i policz)
             try:
-                signal = self.chain[name].process(signal)
-            except:
-                pass # Ignoruj błędy efektów
+                result = step(signal, spare)
+                if result is spare: signal, spare = spare, signal
+            except Exception as e:
+                metrics.record_error(i, e)
+            if self.meter_stages: self._meter(i, signal)
+            # Czas sklejonych etapów idzie na konto pierwszego z nich
+            t = perf_counter(); metrics.record_stage(i, t - t_prev); t_prev = t
+        if quiet and not self.idle_all:
+            self.idle_armed = True
+            if self.plan_idle: self.plan_idle[-1][2] = max(signal.max(), -signal.min())
+            self.idle_all = skipped == len(self.plan)
+            if self.idle_all: signal.fill(0.0)
+            t = perf_counter()
 
-        # --- POMIAR 2: PO EFEKTACH ---
-        vol_loop = float(np.abs(signal).mean() * 100)
+        metrics.end_block(t - t_start, n / self.fs)
+        return signal
 
-        # 3. WZMACNIACZ (Tu też może ginąć)
-        final_signal = self.apply_amp_sim(signal)
-        
-        # --- POMIAR 3: WYJŚCIE ---
-        vol_out = float(np.abs(final_signal).mean() * 100)
+    # --- POMIJANIE WYGASŁYCH ETAPÓW ---
+    # Przy ciszy na wejściu łańcucha (szczyt <= idle_floor) każdy krok sprawdza
+    # swoje wejście. Krok wygasa, gdy wejście było ciche co najmniej przez jego
+    # ogon (tail), ostatnie wyjście też było pod progiem (np. FZ-5 robi z ciszy
+    # stałą składową, więc nie wygasa nigdy), a energia stanu jest pod progiem -
+    # wtedy stan jest zerowany (bez denormali w pętlach sprzężenia) i krok
+    # przepuszcza swoje (ciche) wejście bez liczenia. Gdy wygasną wszystkie,
+    # callback oddaje ciszę bez przechodzenia po planie. Pierwszy blok
+    # z sygnałem na wejściu budzi wszystkie kroki jeszcze w tym samym bloku.
+    # Potok (pipeline.py) liczy zawsze wszystko.
+    def _idle(self, k, signal, n):
+        # True = krok k wygasł i nie trzeba go liczyć; wołane tylko przy ciszy na wejściu łańcucha
+        idle = self.plan_idle[k]
+        level = max(signal.max(), -signal.min())
+        if k: self.plan_idle[k - 1][2] = level
+        floor = self.idle_floor
+        if level > floor:
+            idle[1:4] = 0, np.inf, False
+            return False
+        if not idle[3]:
+            state, quiet_for, last = idle[:3]
+            if quiet_for < state.tail(floor) or last > floor or state.energy() > floor * floor:
+                idle[1] += n
+                return False
+            state.reset()
+            idle[3] = True
+        idle[1] += n
+        if idle[4] is not None: idle[4](n)
+        return True
+
+    def _meter(self, k, x):
+        # Peak i suma kwadratów (dot nie alokuje bloku jak x ** 2)
+        row = self.meter_row[0]
+        row[k] = max(x.max(), -x.min())
+        row[len(self.meter_points) + k] = np.dot(x, x)
 
-        # DIAGNOSTYKA W KONSOLI (Klucz do zagadki)
-        #if vol_in > 0.1:
-           # print(f"IN: {vol_in:.1f} -> EFEKTY: {vol_loop:.1f} -> AMP: {vol_out:.1f}")
+    def audio_callback(self, indata, outdata, frames, time, status):
+        if status: self.metrics.record_status(status)
+        final_signal = self.process_block(indata)
 
         # Przypisanie na wyjście
-        outdata[:, 0] = final_signal[:, 0]
-        outdata[:, 1] = final_signal[:, 0]
+        outdata[:, 0] = final_signal
+        outdata[:, 1] = final_signal
 
-       # UI Updates
-        if self.callback_function:
-            vol = float(np.abs(final_signal).mean() * 20)
-            
-            # Zwolnij odświeżanie tunera (co ok. 10 ramek), żeby nie mrugał jak szalony
-            self.tuner_timer += 1
-            tuner_info = None
-            
-            if self.tuner_timer > 4: # Zmniejszyłem z 6 na 4 dla płynności
-                self.tuner_timer = 0
-                
-                # Pobieramy dane TYLKO jeśli Tuner jest włączony (Active)
-                if self.chain['tuner'].active:
-                    tuner_info = self.chain['tuner'].get_tuner_data()
-                else:
-                    # Jeśli wyłączony, wyślij null, żeby zgasić diody w JS
-                    tuner_info = None 
-
-            self.callback_function(vol, tuner_info)
-
-    def start_streaming(self, device_id, callback):
+        # UI: tylko wrzucamy mierniki do bufora, resztę robi wątek monitora
+        self.meter_ring.push(self.meter_row)
+        # Nagrywanie: kopia do bufora, na dysk pisze wątek recordera
+        if self.recorder is not None: self.recorder.record(indata, final_signal)
+
+    def select_device(self, device_id):
+        # fs i para wejście/wyjście dla open_stream
+        in_info = self.backend.query_devices(device_id)
+        native_sr = int(in_info['default_samplerate'])
+        
+        # Bezpiecznik: jeśli sterownik zgłasza dziwne wartości, weź 44100
+        if native_sr < 44100: native_sr = 44100
+        self.set_samplerate(native_sr)
+
+        self.stream_devices = (device_id, self._find_matching_output(device_id))
+        print(f"CONNECTING: {in_info['name']} | SR: {self.fs}")
+
+    def open_stream(self, blocksize=0, latency=None):
+        # (Ponowne) otwarcie strumienia na wybranych urządzeniach - też przy
+        # zmianie rozmiaru bloku (latency.LatencyController). 0 / None = wybór sterownika.
+        if self.stream:
+            try: self.stream.stop(); self.stream.close()
+            except: pass
+        # Obciążenie i czasy etapów liczone od nowa dla nowego rozmiaru bloku
+        self.metrics.reset()
+        self.stream = self.backend.open_stream(
+            device=self.stream_devices,
+            channels=(2, 2),
+            samplerate=self.fs,
+            callback=self.audio_callback,
+            blocksize=blocksize,
+            latency=latency
+        )
+        self.stream.start()
+
+    def start_streaming(self, device_id, callback, blocksize=0, latency=None):
         self.stop_streaming()
-        self.callback_function = callback
         try:
-            in_info = sd.query_devices(device_id)
-            native_sr = int(in_info['default_samplerate'])
-            
-            # Bezpiecznik: jeśli sterownik zgłasza dziwne wartości, weź 44100
-            if native_sr < 44100: native_sr = 44100
-            self.fs = native_sr
-            
-            for ef in self.chain.values(): ef.fs = self.fs
-
-            output_id = self._find_matching_output(device_id)
-            print(f"CONNECTING: {in_info['name']} | SR: {self.fs}")
-
-            self.stream = sd.Stream(
-                device=(device_id, output_id),
-                channels=(2, 2),
-                samplerate=self.fs,
-                callback=self.audio_callback,
-                blocksize=0, # Auto-size (Najbezpieczniejsze)
-                latency=None # Auto-latency (Najbezpieczniejsze)
-            )
-            self.stream.start()
+            self.select_device(device_id)
+            self.open_stream(blocksize, latency)
+            self.monitor.start(callback)
             print(">>> AUDIO POŁĄCZONE <<<")
         except Exception as e:
             print(f"!!! BŁĄD KRYTYCZNY: {e}")
             raise e
 
+    def latency_report(self):
+        # Opóźnienie w obie strony: to, co zgłasza sterownik (wejście + wyjście,
+        # razem z buforami bloku), plus opóźnienie samego łańcucha (filtry
+        # nadpróbkowania, bufor kolumny) - patrz _compile
+        dev_in, dev_out = self.stream.latency if self.stream else (0.0, 0.0)
+        dsp = self.plan_latency / self.fs
+        block = getattr(self.stream, 'blocksize', 0) or self.last_frames
+        # Potok: stałe opóźnienie o blok na każdy dodatkowy segment
+        stages = self.pipeline.active if self.pipeline else 1
+        pipe = (stages - 1) * block / self.fs
+        return {
+            'fs': self.fs,
+            'blocksize': block,
+            'block_ms': block / self.fs * 1e3,
+            'input_ms': dev_in * 1e3,
+            'output_ms': dev_out * 1e3,
+            'dsp_ms': dsp * 1e3,
+            'pipeline_stages': stages,
+            'pipeline_ms': pipe * 1e3,
+            'round_trip_ms': (dev_in + dev_out + dsp + pipe) * 1e3,
+        }
+
     def stop_streaming(self):
+        self.monitor.stop()
         if self.stream:
             try: self.stream.stop(); self.stream.close()
             except: pass
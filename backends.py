@@ -0,0 +1,216 @@
+import os
+import threading
+from time import perf_counter, sleep
+
+import numpy as np
+from metrics import CallbackMetrics, XRUN_FLAGS
+try:
+    import sounddevice as sd
+except (ImportError, OSError):
+    # Brak PortAudio (np. serwer bez karty dźwiękowej) - zostaje urządzenie wirtualne
+    sd = None
+
+# --- BACKENDY AUDIO ---
+# AudioManager / RigEngine widzą tylko ten interfejs (nazwy jak w sounddevice):
+#   query_devices(device=None)  lista urządzeń (dict: name, hostapi, max_*_channels,
+#                               default_samplerate) albo jedno urządzenie
+#   query_hostapis(index)       {'name': ...}
+#   default_output()            indeks domyślnego wyjścia
+#   open_stream(**kwargs)       obiekt jak sd.Stream (start/stop/close, latency, blocksize)
+# VTL_BACKEND=virtual wymusza urządzenie wirtualne (testy, serwer bez karty).
+
+class SoundDeviceBackend:
+    name = 'sounddevice'
+
+    def query_devices(self, device=None):
+        return sd.query_devices(device)
+
+    def query_hostapis(self, index):
+        return sd.query_hostapis(index)
+
+    def default_output(self):
+        return sd.default.device[1]
+
+    def open_stream(self, **kwargs):
+        return sd.Stream(**kwargs)
+
+# --- FLAGI CALLBACKU (jak sd.CallbackFlags) ---
+class CallbackFlags:
+    FLAGS = XRUN_FLAGS
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        for flag in self.FLAGS: setattr(self, flag, False)
+
+    def __bool__(self):
+        return any(getattr(self, flag) for flag in self.FLAGS)
+
+    def __repr__(self):
+        return ', '.join(flag for flag in self.FLAGS if getattr(self, flag)) or 'ok'
+
+# --- SYNTETYCZNA GITARA (wejście urządzenia wirtualnego) ---
+# Szarpnięte struny (alikwoty z wykładniczym wygaszaniem) w losowym tempie
+# i wysokości, plus szum wejścia. Nowa nuta zaczyna się na granicy bloku.
+class GuitarSource:
+    NOTES = 82.41 * 2 ** (np.arange(0, 37) / 12) # E2..E5
+
+    def __init__(self, fs, seed=0, level=0.5):
+        self.fs = fs
+        self.level = level
+        self.rng = np.random.default_rng(seed)
+        self.harmonics = np.array([1.0, 0.5, 0.25, 0.12, 0.06])
+        self.age = 0
+        self.length = 0
+        self.freq = self.NOTES[0]
+
+    def fill(self, out):
+        # out: (n, kanały) - gitara w kanale 0, reszta cisza (jak wejście Inst)
+        n = len(out)
+        if self.age >= self.length:
+            self.freq = self.rng.choice(self.NOTES)
+            self.length = int(self.fs * self.rng.uniform(0.2, 1.0))
+            self.age = 0
+        t = (self.age + np.arange(n)) / self.fs
+        k = np.arange(1, len(self.harmonics) + 1)[:, None]
+        tone = self.harmonics @ np.sin(2 * np.pi * self.freq * k * t)
+        tone *= np.exp(-t * 6.0) * self.level
+        out[:, 0] = tone + 0.003 * self.rng.standard_normal(n)
+        out[:, 1:] = 0.0
+        self.age += n
+
+# --- URZĄDZENIE WIRTUALNE ---
+# Strumień jak sd.Stream. realtime=True: własny wątek woła callback w tempie
+# zegara (blok co blocksize / fs), z opcjonalnym jitterem wybudzenia (ms),
+# jak sterownik. Blok k musi być gotowy przed końcem następnego okresu
+# (podwójne buforowanie wyjścia); spóźnienie = output_underflow w flagach
+# następnego callbacku i licznik misses. Spóźnienie o więcej niż okres
+# gubi bloki wejścia (input_overflow, skipped) i zegar dogania czas.
+# realtime=False: callback woła run(n) - deterministycznie, bez zegara.
+class VirtualStream:
+    def __init__(self, device=None, channels=(2, 2), samplerate=48000, callback=None, blocksize=0,
+                 latency=None, realtime=True, jitter_ms=0.0, source=None, safety=0.001, seed=0, capacity=4096):
+        channels = channels if isinstance(channels, tuple) else (channels, channels)
+        self.device = device
+        self.samplerate = samplerate
+        self.callback = callback
+        self.blocksize = blocksize or 512
+        self.realtime = realtime
+        self.jitter = jitter_ms / 1000
+        block = self.blocksize / samplerate
+        # Jak typowy sterownik: blok wejścia i dwa bloki wyjścia plus margines
+        self.latency = (block + safety, 2 * block + safety)
+        self.indata = np.zeros((self.blocksize, channels[0]), dtype=np.float32)
+        self.outdata = np.zeros((self.blocksize, channels[1]), dtype=np.float32)
+        self.source = source if source is not None else GuitarSource(samplerate, seed)
+        self.rng = np.random.default_rng(seed)
+        self.status = CallbackFlags()
+        self.active = False
+        self.thread = None
+        self.frames = 0
+        # Statystyki (prealokowane, jak CallbackMetrics)
+        self.blocks = self.misses = self.skipped = 0
+        self.capacity = capacity
+        self.lateness = np.zeros(capacity)
+        self.durations = np.zeros(capacity)
+
+    def start(self):
+        self.active = True
+        if self.realtime:
+            self.thread = threading.Thread(target=self._run, name='virtual-audio', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.active = False
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+
+    def close(self):
+        self.stop()
+
+    def _block(self, woke):
+        if callable(getattr(self.source, 'fill', None)):
+            self.source.fill(self.indata)
+        else:
+            idx = (self.frames + np.arange(self.blocksize)) % len(self.source)
+            self.indata[:] = self.source[idx]
+        self.callback(self.indata, self.outdata, self.blocksize, None, self.status)
+        self.status.clear()
+        self.frames += self.blocksize
+        k = self.blocks % self.capacity
+        self.durations[k] = perf_counter() - woke
+        self.blocks += 1
+
+    def run(self, blocks):
+        # Tryb krokowy (realtime=False)
+        for _ in range(blocks): self._block(perf_counter())
+
+    def _run(self):
+        period = self.blocksize / self.samplerate
+        due = perf_counter() + period
+        while self.active:
+            # Blok wejścia gotowy w chwili due (+ jitter sterownika / systemu)
+            delay = due - perf_counter() + (self.rng.uniform(0, self.jitter) if self.jitter else 0.0)
+            if delay > 0: sleep(delay)
+            woke = perf_counter()
+            self.lateness[self.blocks % self.capacity] = max(0.0, woke - due)
+            self._block(woke)
+            # Termin: koniec następnego okresu (wtedy karta gra ten blok)
+            late = perf_counter() - (due + period)
+            if late > 0:
+                self.misses += 1
+                self.status.output_underflow = True
+                if late > period:
+                    lost = int(late // period)
+                    self.skipped += lost
+                    self.status.input_overflow = True
+                    due += lost * period
+            due += period
+
+    def stats(self):
+        n = min(self.blocks, self.capacity)
+        return {
+            'blocks': self.blocks,
+            'misses': self.misses,
+            'skipped': self.skipped,
+            'deadline_us': self.blocksize / self.samplerate * 1e6,
+            'lateness_us': CallbackMetrics._summary(self.lateness[:n]),
+            'callback_us': CallbackMetrics._summary(self.durations[:n]),
+        }
+
+class VirtualBackend:
+    name = 'virtual'
+    HOSTAPIS = [{'name': 'Virtual'}]
+
+    def __init__(self, samplerate=48000, channels=2, **stream_options):
+        # stream_options: realtime, jitter_ms, source, seed - dla każdego strumienia
+        self.devices = [{'name': 'VTL Virtual Guitar', 'hostapi': 0, 'max_input_channels': channels,
+                         'max_output_channels': channels, 'default_samplerate': float(samplerate)}]
+        self.stream_options = stream_options
+        self.streams = []
+
+    def query_devices(self, device=None):
+        return self.devices if device is None else self.devices[device or 0]
+
+    def query_hostapis(self, index):
+        return self.HOSTAPIS[index]
+
+    def default_output(self):
+        return 0
+
+    def open_stream(self, **kwargs):
+        # Strumienie zostają na liście: soak.py sumuje ich statystyki przez
+        # kolejne zmiany rozmiaru bloku
+        stream = VirtualStream(**kwargs, **self.stream_options)
+        self.streams.append(stream)
+        return stream
+
+    def totals(self):
+        return {key: sum(getattr(s, key) for s in self.streams) for key in ('blocks', 'misses', 'skipped')}
+
+def default_backend():
+    if sd is None or os.environ.get('VTL_BACKEND') == 'virtual':
+        return VirtualBackend()
+    return SoundDeviceBackend()
@@ -0,0 +1,420 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from scipy.io import wavfile
+import kernels
+from audio_manager import AudioManager
+from dsp import OVERSAMPLE_FACTORS
+from presets import PresetStore
+from rigs import RigEngine
+
+# --- BENCHMARK EFEKTÓW (budżet callbacku) ---
+# Każdy efekt osobno i cały łańcuch, na deterministycznym sygnale, dla różnych
+# rozmiarów bloku i częstotliwości próbkowania. Wynik: czas na blok względem
+# terminu callbacku (block / fs), współczynnik realtime i bajty alokowane
+# w trakcie jednego bloku. JSON można porównać między commitami (--compare).
+# Cel 'nazwa@N' liczy nieliniowość z nadpróbkowaniem N (np. 'fuzz@4', 'amp@8');
+# --oversample dokłada takie pomiary dla wszystkich waveshaperów i wzmacniacza.
+# Cel 'rigs@N' to cały łańcuch w RigEngine dla N rigów naraz (--rigs: 1..64);
+# per_rig_us pokazuje, jak koszt rozkłada się na rigi.
+# Cel 'cab@MS' to sama kolumna z syntetyczną IR długości MS milisekund
+# (--cab: 50/200/1000 ms) - koszt bloku ma prawie nie zależeć od długości IR.
+# Cel 'tone' to sam stos barwy wzmacniacza (4 biquady, gałki poza środkiem).
+# Cel 'pipe@N' to ciężki pedalboard (PS-6, CE-2W, BF-3, DM-2W, RV-6) w potoku
+# do N segmentów (podział z rozgrzewki, patrz pipeline.py); --pipeline: 1..4.
+# --switch mierzy zmianę presetu: przygotowanie łańcucha (poza callbackiem),
+# koszt bloków z przejściem (dwa łańcuchy) i alokacje w tych blokach.
+# --idle: ciężki pedalboard gra nutę, potem cisza: koszt bloku przy graniu,
+# po wygaśnięciu ogonów (etapy pominięte) i w bloku pobudki, czas do
+# wygaszenia oraz opóźnienie pobudki (próbki, o które wyjście rozjeżdża się
+# z łańcuchem liczącym wszystko).
+# --modulation: BF-3 i CE-2W wobec pętli próbka-po-próbce, jaką liczyły przed
+# linią opóźniającą z modulacją; bench wymaga co najmniej MODULATION_TARGET-
+# krotnego przyspieszenia. Cel zakłada skompilowany kernel (numba jest
+# w requirements.txt) - ścieżka NumPy (VTL_NO_JIT=1) go nie osiąga i nie zalicza.
+
+BLOCK_SIZES = [32, 64, 128, 256, 512, 1024, 2048]
+SAMPLE_RATES = [44100, 48000, 96000]
+DRIVES = ['drive', 'fuzz', 'boost']
+SHAPERS = ['dist', 'drive', 'fuzz', 'boost', 'amp']
+RIG_COUNTS = [1, 4, 16, 64]
+CAB_IR_MS = [50, 200, 1000]
+HEAVY = ['comp', 'pitch', 'flanger', 'chorus', 'delay', 'reverb']
+PIPELINE_STAGES = [1, 2, 3, 4]
+MODULATION_TARGET = 20.0
+MODULATION_BLOCKS = [256, 512, 1024, 2048]
+
+# --- SYGNAŁ TESTOWY (szarpnięta struna + szum, zawsze ten sam) ---
+def test_signal(n, fs, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(n) / fs
+    # Nowe szarpnięcie co 0.5 s, żeby kompresor/bramki coś robiły
+    env = np.exp(-(t % 0.5) * 6.0)
+    sig = np.zeros(n)
+    for k, amp in enumerate([0.5, 0.25, 0.12, 0.06]):
+        sig += amp * np.sin(2 * np.pi * 82.41 * (k + 1) * t)
+    sig = sig * env + 0.003 * rng.standard_normal(n)
+    return np.stack([sig, sig], axis=1).astype(np.float32)
+
+def _percentile(values, q):
+    return float(np.percentile(values, q))
+
+def _make_rigs(rigs, fs):
+    engine = RigEngine(rigs, fs)
+    for rig in range(rigs):
+        for name in engine.order: engine.set_effect_state(rig, name, True)
+    def run(block):
+        return engine.process_block(np.repeat(block[:, :1], rigs, axis=1))
+    return run
+
+def _make_cab(ms, fs):
+    # Szum z wykładniczym zanikiem, zapisany raz do katalogu tymczasowego
+    path = os.path.join(tempfile.gettempdir(), f'vtl_bench_ir_{ms}.wav')
+    if not os.path.exists(path):
+        n = 48000 * ms // 1000
+        ir = np.random.default_rng(0).standard_normal(n) * np.exp(-np.arange(n) / (n / 6))
+        wavfile.write(path, 48000, ir.astype(np.float32))
+    mgr = AudioManager()
+    mgr.set_samplerate(fs)
+    mgr.set_cabinet(path)
+    return _mono(mgr.cabinet.process)
+
+def _make_pipeline(stages, fs):
+    mgr = AudioManager()
+    mgr.set_samplerate(fs)
+    for name in HEAVY: mgr.chain[name].active = True
+    mgr.set_pipeline(stages)
+    def run(block):
+        # Podział po pierwszych blokach (czasy etapów z rozgrzewki)
+        if mgr.metrics.count == 8: mgr.rebalance()
+        return mgr.process_block(block)
+    return run
+
+def _make_target(target, fs):
+    if target.startswith('rigs@'): return _make_rigs(int(target[5:]), fs)
+    if target.startswith('pipe@'): return _make_pipeline(int(target[5:]), fs)
+    if target.startswith('cab@'): return _make_cab(int(target[4:]), fs)
+    mgr = AudioManager()
+    mgr.set_samplerate(fs)
+    if target == 'tone':
+        mgr.eq_params.update({'bass': 0.8, 'middle': 0.3, 'treble': 0.6, 'presence': 0.7})
+        return _mono(mgr.apply_tone_stack)
+    target, _, factor = target.partition('@')
+    if factor: mgr.set_oversample(target, int(factor))
+    if target == 'amp':
+        # Sam wzmacniacz (wejście + amp, wszystkie efekty wyłączone)
+        return mgr.process_block
+    if target == 'chain':
+        for fx in mgr.chain.values(): fx.active = True
+        return mgr.process_block
+    if target == 'drives':
+        # Stos przesterów + wzmacniacz: sklejane w jedną tablicę przejścia
+        for name in DRIVES: mgr.chain[name].active = True
+        return mgr.process_block
+    fx = mgr.chain[target]
+    fx.active = True
+    return _mono(fx.process)
+
+def _mono(process):
+    # process(blok, out) z własnym buforem wyjścia
+    out = np.empty(0, dtype=np.float32)
+    def run(block):
+        nonlocal out
+        if len(out) != len(block): out = np.empty(len(block), dtype=np.float32)
+        return process(block, out)
+    return run
+
+def _alloc_bytes(run, blocks):
+    # Szczyt pamięci zaalokowanej w trakcie jednego bloku (tymczasowe tablice)
+    tracemalloc.start()
+    worst = 0
+    for block in blocks:
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        run(block)
+        worst = max(worst, tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+    return worst
+
+def bench_one(target, fs, blocksize, seconds=0.5, warmup=8):
+    run = _make_target(target, fs)
+    n_blocks = max(int(seconds * fs / blocksize), 16)
+    signal = test_signal((n_blocks + warmup) * blocksize, fs)
+    blocks = [signal[i:i + blocksize] for i in range(0, len(signal), blocksize)]
+    if target.partition('@')[0] not in ('chain', 'drives', 'amp', 'rigs', 'pipe'):
+        # Pojedynczy efekt dostaje ciągły blok mono, jak w AudioManager
+        blocks = [np.ascontiguousarray(b[:, 0]) for b in blocks]
+
+    for block in blocks[:warmup]: run(block)
+
+    times = np.empty(n_blocks)
+    for i, block in enumerate(blocks[warmup:]):
+        t0 = time.perf_counter()
+        run(block)
+        times[i] = time.perf_counter() - t0
+
+    alloc = _alloc_bytes(run, blocks[:warmup])
+
+    deadline = blocksize / fs
+    mean = float(times.mean())
+    rigs = int(target[5:]) if target.startswith('rigs@') else 1
+    return {
+        'target': target,
+        'fs': fs,
+        'block': blocksize,
+        'deadline_us': deadline * 1e6,
+        'mean_us': mean * 1e6,
+        'p50_us': _percentile(times, 50) * 1e6,
+        'p99_us': _percentile(times, 99) * 1e6,
+        'max_us': float(times.max()) * 1e6,
+        'load': mean / deadline,
+        'p99_load': _percentile(times, 99) / deadline,
+        'realtime_factor': deadline / mean if mean > 0 else float('inf'),
+        'alloc_bytes_per_block': alloc,
+        'per_rig_us': mean * 1e6 / rigs,
+    }
+
+def bench_switch(fs, blocksize, store):
+    mgr = AudioManager()
+    mgr.set_samplerate(fs)
+    signal = test_signal(fs * 2, fs)
+    blocks = [signal[i:i + blocksize] for i in range(0, len(signal) - blocksize, blocksize)]
+    k = 0
+    results = []
+    def fade(traced):
+        # Czas i alokacje osobno: tracemalloc wielokrotnie spowalnia callback
+        nonlocal k
+        times, alloc = [], 0
+        if traced: tracemalloc.start()
+        while mgr.incoming is not None:
+            base = tracemalloc.get_traced_memory()[0] if traced else 0
+            if traced: tracemalloc.reset_peak()
+            t0 = time.perf_counter()
+            mgr.process_block(blocks[k % len(blocks)]); k += 1
+            times.append(time.perf_counter() - t0)
+            if traced: alloc = max(alloc, tracemalloc.get_traced_memory()[1] - base)
+        if traced: tracemalloc.stop()
+        return times, alloc
+    for preset in store.list():
+        for _ in range(8):
+            mgr.process_block(blocks[k % len(blocks)]); k += 1
+        mgr.switch_state(store.load(preset['name']), blocksize, immediate=False)
+        _, alloc = fade(True)
+        mgr.switch_state(store.load(preset['name']), blocksize, immediate=False)
+        times, _ = fade(False)
+        r = {'target': f"switch:{preset['name']}", 'fs': fs, 'block': blocksize,
+             'fade_block_us': float(np.mean(times)) * 1e6, 'alloc_bytes_per_block': alloc, **mgr.switch_report()}
+        results.append(r)
+        print(f"{r['target']:<16} {fs:>6} Hz {blocksize:>5} | prepare {r['prepare_ms']:6.2f} ms "
+              f"| fade {len(times)} bl. x {r['fade_block_us']:8.1f} us | alloc {alloc:>6} B")
+    return results
+
+def bench_idle(fs, blocksize, idle_blocks=200):
+    managers = []
+    for floor in (None, -1.0):
+        mgr = AudioManager()
+        mgr.set_samplerate(fs)
+        for name in HEAVY: mgr.chain[name].active = True
+        if floor is not None: mgr.idle_floor = floor
+        managers.append(mgr)
+    mgr, ref = managers
+    note = test_signal(fs // 2, fs)
+    silence = np.zeros((blocksize, 2), dtype=np.float32)
+
+    def timed(block):
+        t0 = time.perf_counter()
+        out = mgr.process_block(block).copy()
+        return time.perf_counter() - t0, out
+
+    play = [timed(note[i:i + blocksize])[0] for i in range(0, len(note) - blocksize + 1, blocksize)]
+    for i in range(0, len(note) - blocksize + 1, blocksize): ref.process_block(note[i:i + blocksize])
+    # Cisza aż do wygaszenia wszystkich etapów (najdłuższy ogon: DM-2W, RV-6)
+    blocks = 0
+    while not mgr.idle_all and blocks < 60 * fs // blocksize:
+        mgr.process_block(silence); ref.process_block(silence)
+        blocks += 1
+    settle = blocks * blocksize / fs if mgr.idle_all else None
+    idle = [timed(silence)[0] for _ in range(idle_blocks)]
+    for _ in range(idle_blocks): ref.process_block(silence)
+    wake, out = timed(note[:blocksize])
+    diff = np.abs(out - ref.process_block(note[:blocksize]))
+    late = np.flatnonzero(diff > 1e-3)
+    r = {'target': 'idle', 'fs': fs, 'block': blocksize, 'deadline_us': blocksize / fs * 1e6,
+         'play_us': float(np.mean(play)) * 1e6, 'idle_us': float(np.mean(idle)) * 1e6, 'wake_us': wake * 1e6,
+         'settle_s': settle,
+         'wake_latency_samples': int(late[-1]) + 1 if len(late) else 0}
+    print(f"idle      {fs:>6} Hz {blocksize:>5} | gra {r['play_us']:8.1f} us | cisza {r['idle_us']:8.1f} us "
+          f"| pobudka {r['wake_us']:8.1f} us ({r['wake_latency_samples']} pr.) | wygaszenie po {'-' if settle is None else f'{settle:.2f} s'}")
+    return r
+
+def _per_sample_modulation(target, fs):
+    # Stara pętla BF-3/CE-2W: LFO, odczyt i zapis bufora po jednej próbce
+    fx = AudioManager().chain[target]
+    if target == 'flanger':
+        rate, depth, feedback = 0.1 + fx.params['rate'] * 4.0, fx.params['depth'] * 100, fx.params['res'] * 0.8
+        base, wet, size = 20, 1.0, 4000
+    else:
+        rate, depth, feedback = 0.5 + fx.params['rate'] * 3.0, 50 + fx.params['depth'] * 200, 0.0
+        base, wet, size = 400, 0.8, 4800
+    buffer = np.zeros(size)
+    state = {'ptr': 0, 'phase': 0.0}
+    step = 2 * np.pi * rate / fs
+    def run(block):
+        out = np.zeros_like(block)
+        ptr, phase = state['ptr'], state['phase']
+        for i in range(len(block)):
+            delayed = buffer[int(ptr - (base + (1.0 + np.sin(phase)) / 2.0 * depth)) % size]
+            buffer[ptr] = block[i] + delayed * feedback
+            out[i] = block[i] + delayed * wet
+            ptr = (ptr + 1) % size
+            phase += step
+        state['ptr'], state['phase'] = ptr, phase
+        return out
+    return run
+
+def bench_modulation(fs, blocksize, seconds):
+    results = []
+    for target in ('flanger', 'chorus'):
+        new = bench_one(target, fs, blocksize, seconds)
+        run = _per_sample_modulation(target, fs)
+        signal = test_signal(max(int(seconds * fs / blocksize), 4) * blocksize, fs)[:, 0].copy()
+        times = []
+        for i in range(0, len(signal), blocksize):
+            t0 = time.perf_counter()
+            run(signal[i:i + blocksize])
+            times.append(time.perf_counter() - t0)
+        # Mediany: pojedyncze wywłaszczenia nie przesuwają wyniku
+        old_us = _percentile(times, 50) * 1e6
+        r = {'target': f'mod:{target}', 'fs': fs, 'block': blocksize, 'per_sample_us': old_us,
+             'p50_us': new['p50_us'], 'speedup': old_us / new['p50_us'], 'backend': kernels.BACKEND}
+        results.append(r)
+        print(f"{target:<9} {fs:>6} Hz {blocksize:>5} | próbka-po-próbce {old_us:9.1f} us "
+              f"-> {r['p50_us']:8.1f} us ({r['speedup']:6.1f}x, {kernels.BACKEND or 'numpy'})")
+        assert r['speedup'] >= MODULATION_TARGET, \
+            f"{target} @ {fs} Hz / {blocksize}: {r['speedup']:.1f}x < {MODULATION_TARGET:.0f}x ({kernels.BACKEND or 'numpy'})"
+    return results
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).strip()
+    except:
+        return None
+
+def run_suite(targets, sample_rates, block_sizes, seconds):
+    results = []
+    for target in targets:
+        for fs in sample_rates:
+            for blocksize in block_sizes:
+                r = bench_one(target, fs, blocksize, seconds)
+                results.append(r)
+                flag = "  !!! XRUN" if r['p99_load'] >= 1.0 else ""
+                print(f"{target:<9} {fs:>6} Hz {blocksize:>5} | "
+                      f"{r['mean_us']:>9.1f} us (p99 {r['p99_us']:>9.1f}) / {r['deadline_us']:>8.1f} us "
+                      f"| load {r['load'] * 100:5.1f}% | {r['realtime_factor']:7.1f}x "
+                      f"| alloc {r['alloc_bytes_per_block']:>8} B{flag}")
+    return results
+
+# --- ZAPIS WYNIKÓW ---
+# Każdy tryb zapisuje ten sam układ: meta (commit, wersje, maszyna) i listę
+# wyników z kluczem (target, fs, block). Porównywany czas bloku zależy od
+# trybu: pierwszy z COMPARE_KEYS, który wynik ma (efekty: średnia, --switch:
+# blok przejścia, --idle: blok ciszy, --modulation: mediana).
+COMPARE_KEYS = ('mean_us', 'fade_block_us', 'idle_us', 'p50_us')
+
+def save_results(path, results):
+    report = {
+        'meta': {
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'backend': kernels.BACKEND,
+            'machine': platform.machine(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Zapisano: {path}")
+    return report
+
+def _compare_key(r):
+    return next((k for k in COMPARE_KEYS if k in r), None)
+
+# --- PORÓWNANIE DWÓCH WYNIKÓW ---
+def compare(old_path, new_path, threshold=1.2):
+    with open(old_path) as f: old = json.load(f)
+    with open(new_path) as f: new = json.load(f)
+    key = lambda r: (r['target'], r['fs'], r['block'])
+    old_by_key = {key(r): r for r in old['results']}
+
+    regressions = []
+    for r in new['results']:
+        prev = old_by_key.get(key(r))
+        metric = _compare_key(r)
+        if not prev or metric is None or metric not in prev: continue
+        ratio = r[metric] / prev[metric] if prev[metric] > 0 else 1.0
+        mark = ""
+        if ratio > threshold:
+            mark = "  <-- REGRESJA"
+            regressions.append((key(r), ratio))
+        print(f"{r['target']:<16} {r['fs']:>6} Hz {r['block']:>5} | {metric:<13} "
+              f"{prev[metric]:>9.1f} -> {r[metric]:>9.1f} us ({ratio:5.2f}x){mark}")
+    return regressions
+
+def main():
+    mgr_order = AudioManager().order
+    parser = argparse.ArgumentParser(description="VintageToneLab - benchmark efektów")
+    parser.add_argument('-t', '--target', action='append', help=f"efekt ({', '.join(mgr_order)}), 'tone', 'drives' lub 'chain'")
+    parser.add_argument('--fs', type=int, action='append', help="częstotliwość próbkowania")
+    parser.add_argument('--block', type=int, action='append', help="rozmiar bloku")
+    parser.add_argument('--oversample', action='store_true', help="koszt nadpróbkowania 2/4/8x nieliniowości")
+    parser.add_argument('--rigs', action='store_true', help="koszt łańcucha na rig w RigEngine (1/4/16/64 rigów)")
+    parser.add_argument('--cab', action='store_true', help="koszt kolumny (splot) dla IR 50/200/1000 ms")
+    parser.add_argument('--pipeline', action='store_true', help="ciężki pedalboard w potoku 1..4 segmentów")
+    parser.add_argument('--switch', action='store_true', help="zmiana presetu: przygotowanie i bloki przejścia")
+    parser.add_argument('--idle', action='store_true', help="koszt ciszy po wygaśnięciu ogonów i pobudka")
+    parser.add_argument('--modulation', action='store_true', help=f"BF-3/CE-2W wobec pętli próbka-po-próbce (cel {MODULATION_TARGET:.0f}x)")
+    parser.add_argument('--seconds', type=float, default=0.5, help="ile sekund audio na pomiar")
+    parser.add_argument('-o', '--out', default='bench.json')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'))
+    parser.add_argument('--threshold', type=float, default=1.2)
+    args = parser.parse_args()
+
+    if args.compare:
+        regressions = compare(args.compare[0], args.compare[1], args.threshold)
+        raise SystemExit(1 if regressions else 0)
+
+    targets = args.target or mgr_order + ['tone', 'drives', 'chain']
+    if args.oversample:
+        targets = targets + [f"{name}@{f}" for name in SHAPERS for f in OVERSAMPLE_FACTORS]
+    if args.rigs:
+        targets = targets + [f"rigs@{n}" for n in RIG_COUNTS]
+    if args.cab:
+        targets = targets + [f"cab@{ms}" for ms in CAB_IR_MS]
+    if args.pipeline:
+        targets = targets + [f"pipe@{n}" for n in PIPELINE_STAGES]
+    if args.switch:
+        store = PresetStore()
+        results = [r for fs in args.fs or SAMPLE_RATES for b in args.block or BLOCK_SIZES
+                   for r in bench_switch(fs, b, store)]
+    elif args.idle:
+        results = [bench_idle(fs, b) for fs in args.fs or SAMPLE_RATES for b in args.block or BLOCK_SIZES]
+    elif args.modulation:
+        results = [r for fs in args.fs or SAMPLE_RATES for b in args.block or MODULATION_BLOCKS
+                   for r in bench_modulation(fs, b, args.seconds)]
+    else:
+        results = run_suite(targets, args.fs or SAMPLE_RATES, args.block or BLOCK_SIZES, args.seconds)
+    save_results(args.out, results)
+
+if __name__ == '__main__':
+    main()
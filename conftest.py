@@ -0,0 +1,113 @@
+import numpy as np
+
+import kernels
+
+# --- WSPÓLNE POMOCE TESTÓW ---
+# Sygnał testowy, krojenie na bloki, referencyjne pętle próbka-po-próbce
+# i warianty kerneli; testy importują je z conftest.
+# test_audio.py to ręczny miernik poziomu na karcie (input()), nie test.
+collect_ignore = ['test_audio.py']
+
+FS = 48000
+TOL = {'atol': 2e-5, 'rtol': 1e-5}
+
+# --- REFERENCJE: oryginalne pętle próbka-po-próbce ---
+def ref_cs3(signal, params, envelope):
+    attack_coef = 0.01 + params['attack'] * 0.1
+    release_coef = 0.005
+    thresh = 1.0 - (params['sustain'] * 0.8)
+    output = np.zeros_like(signal)
+    for i in range(len(signal)):
+        lvl = abs(signal[i, 0])
+        if lvl > envelope: envelope += attack_coef * (lvl - envelope)
+        else: envelope += release_coef * (lvl - envelope)
+        gain = 1.0
+        if envelope > thresh: gain = thresh / (envelope + 0.001)
+        makeup = 1.0 + params['level'] * 3.0
+        output[i, 0] = signal[i, 0] * gain * makeup
+    return np.clip(output, -0.95, 0.95), envelope
+
+def ref_ds1(signal, params, curr):
+    drive = 1.0 + params['dist'] * 30.0
+    distorted = np.clip(signal * drive, -0.8, 0.8)
+    t = params['tone']
+    low_end = np.zeros_like(distorted)
+    for i in range(len(distorted)):
+        curr += 0.1 * (distorted[i, 0] - curr)
+        low_end[i, 0] = curr
+    high_end = distorted - low_end
+    tone_mix = low_end * (1.0 - t) + high_end * t
+    return tone_mix * params['level'] * 2.0, curr
+
+class RefDM2W:
+    def __init__(self, fs):
+        self.buffer = np.zeros(fs * 2)
+        self.ptr = 0
+        self.lp_val = 0.0
+
+    def run(self, signal, delay_samples, feedback, mix):
+        output = np.zeros_like(signal)
+        buf_len = len(self.buffer)
+        for i in range(len(signal)):
+            delayed = self.buffer[(self.ptr - delay_samples) % buf_len]
+            self.lp_val += 0.3 * (delayed - self.lp_val)
+            current_in = signal[i, 0]
+            self.buffer[self.ptr] = np.tanh(current_in + self.lp_val * feedback)
+            output[i, 0] = current_in + self.lp_val * mix
+            self.ptr = (self.ptr + 1) % buf_len
+        return output
+
+class RefModDelay:
+    # Pętla próbka-po-próbce z odczytem interpolowanym
+    def __init__(self, size):
+        self.buffer = np.zeros(size)
+        self.ptr = 0
+        self.lfo_phase = 0.0
+
+    def run(self, signal, delay_of_lfo, lfo_step, feedback):
+        buf_len = len(self.buffer)
+        delayed = np.zeros(len(signal))
+        for i in range(len(signal)):
+            pos = self.ptr - delay_of_lfo(np.sin(self.lfo_phase))
+            i0 = int(np.floor(pos))
+            frac = pos - i0
+            d = self.buffer[i0 % buf_len] * (1 - frac) + self.buffer[(i0 + 1) % buf_len] * frac
+            self.buffer[self.ptr] = signal[i, 0] + d * feedback
+            delayed[i] = d
+            self.ptr = (self.ptr + 1) % buf_len
+            self.lfo_phase += lfo_step
+        return delayed[:, None]
+
+def guitar_signal(n, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(n) / FS
+    decay = np.exp(-t * 3.0)
+    sig = 0.6 * np.sin(2 * np.pi * 82.41 * t) * decay
+    sig += 0.2 * np.sin(2 * np.pi * 246.9 * t) * decay
+    sig += 0.01 * rng.standard_normal(n)
+    # Jak z karty dźwiękowej: float32; referencje liczą w float64
+    return sig[:, None].astype(np.float32)
+
+def apply(fx, blk):
+    # Efekty pracują na blokach mono float32 z prealokowanym wyjściem
+    out = np.empty(len(blk), dtype=np.float32)
+    return fx.apply(blk[:, 0], out)[:, None]
+
+def blocks(signal, sizes):
+    i, k = 0, 0
+    while i < len(signal):
+        n = sizes[k % len(sizes)]
+        yield signal[i:i + n]
+        i += n
+        k += 1
+
+def kernel_variants(name):
+    # Pętla w czystym Pythonie zawsze, skompilowana - jeśli jest backend
+    yield getattr(kernels, name + '_loop')
+    if getattr(kernels, name) is not None: yield getattr(kernels, name)
+
+def run_with_kernel(make, kernel_of, kernel, sig, sizes):
+    fx = make()
+    target = kernel_of(fx)
+    target.kernel = kernel
+    return np.concatenate([apply(fx, blk) for blk in blocks(sig, sizes)])
@@ -0,0 +1,876 @@
+import os
+from functools import lru_cache
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided, sliding_window_view
+from scipy.io import wavfile
+from scipy.signal import firwin, lfilter, resample_poly, sosfilt
+
+import kernels
+
+# --- PRYMITYWY DSP (wspólne klocki dla efektów) ---
+# Wszystkie trzymają stan między blokami, więc wynik nie zależy od tego,
+# jak PortAudio pokroi sygnał na bloki.
+# Bloki to jednowymiarowe tablice float32 (mono). Metody process(x, out)
+# zapisują wynik do podanego out i korzystają tylko z prealokowanych buforów
+# roboczych - w stanie ustalonym nic nie alokują. out nie może być x.
+# Operacje na tablicach o różnych dtype (float32 * float64) alokują bufory
+# rzutowania wewnątrz numpy, więc wartości rzutujemy przypisaniem do bufora
+# roboczego, a same działania wykonujemy na zgodnych typach.
+
+# --- BUFORY ROBOCZE ---
+# Prealokowane tablice pod nazwą; rosną tylko wtedy, gdy przyjdzie większy blok.
+class Workspace:
+    def __init__(self):
+        self.arrays = {}
+
+    def get(self, name, n, dtype=np.float32):
+        buf = self.arrays.get(name)
+        if buf is None or len(buf) < n or buf.dtype != dtype:
+            buf = np.zeros(max(n, 256), dtype=dtype)
+            self.arrays[name] = buf
+        return buf[:n]
+
+    def ramp(self, n):
+        # 0, 1, 2, ... (float64) - wspólna rampa dla LFO i odczytów
+        buf = self.arrays.get('__ramp')
+        if buf is None or len(buf) < n:
+            buf = np.arange(max(n, 256), dtype=np.float64)
+            self.arrays['__ramp'] = buf
+        return buf[:n]
+
+# --- CISZA I OGONY (AudioManager pomija wygasłe etapy) ---
+# Klocki ze stanem podają tail(floor) - po ilu próbkach ciszy na wejściu ich
+# wyjście spada poniżej floor - energy(), czyli największy kwadrat próbki
+# w stanie (pojedyncze echo w środku bufora liczy się jak pełny blok), i reset()
+# do zera, żeby po obudzeniu nie ciągnąć denormali.
+def decay_samples(period, gain, floor):
+    # Pętla o okresie period próbek i wzmocnieniu gain na obieg
+    if gain <= 0.0: return period
+    if gain >= 1.0: return float('inf')
+    return period * (1 + int(np.log(floor) / np.log(gain)))
+
+def peak_energy(*buffers):
+    return max((float(max(b.max(), -b.min())) ** 2 for b in buffers if b.size), default=0.0)
+
+class SerialState:
+    # Kilka klocków liczonych po kolei w jednym kroku (np. przester + stos barwy)
+    def __init__(self, *parts):
+        self.parts = parts
+
+    def tail(self, floor):
+        return sum(part.tail(floor) for part in self.parts)
+
+    def energy(self):
+        return max(part.energy() for part in self.parts)
+
+    def reset(self):
+        for part in self.parts: part.reset()
+
+# --- RAMPA WZMOCNIENIA (bez "zipper noise") ---
+# Zmiana gałki przechodzi liniowo przez cały blok zamiast skokiem na jego
+# granicy. Rampa to kilka operacji wektorowych i tylko w bloku, w którym
+# wartość się zmieniła; ostatnia próbka dostaje już dokładnie nową wartość.
+class GainRamp:
+    def __init__(self):
+        self.value = None
+        self.ws = Workspace()
+
+    def apply(self, x, target):
+        # x *= gain (w miejscu)
+        if self.value is None or self.value == target:
+            x *= target
+        else:
+            n = len(x)
+            r = self.ws.get('ramp', n)
+            r[:] = self.ws.ramp(n)
+            r += 1.0
+            r *= (target - self.value) / n
+            r += self.value
+            x *= r
+        self.value = target
+        return x
+
+# --- FILTR IIR ZE STANEM (lfilter) ---
+# lfilter alokuje wynik, więc używamy go poza wątkiem audio (np. tuner).
+class StatefulIIR:
+    def __init__(self, b, a):
+        self.set_coefs(b, a)
+        self.zi = np.zeros(max(len(self.a), len(self.b)) - 1)
+
+    def set_coefs(self, b, a):
+        self.b = np.asarray(b, dtype=np.float64)
+        self.a = np.asarray(a, dtype=np.float64)
+
+    def reset(self):
+        self.zi[:] = 0.0
+
+    def process(self, x):
+        y, self.zi = lfilter(self.b, self.a, x, zi=self.zi)
+        return y
+
+# --- BIQUAD (RBJ cookbook) jako sekcja SOS [b0, b1, b2, 1, a1, a2] ---
+def biquad(kind, f0, gain_db, q, fs):
+    A = 10.0 ** (gain_db / 40.0)
+    w0 = 2 * np.pi * f0 / fs
+    cos, alpha = np.cos(w0), np.sin(w0) / (2 * q)
+    if kind == 'peak':
+        b = [1 + alpha * A, -2 * cos, 1 - alpha * A]
+        a = [1 + alpha / A, -2 * cos, 1 - alpha / A]
+    else:
+        sq = 2 * np.sqrt(A) * alpha
+        sign = 1 if kind == 'low' else -1
+        b = [A * ((A + 1) - sign * (A - 1) * cos + sq), sign * 2 * A * ((A - 1) - sign * (A + 1) * cos),
+             A * ((A + 1) - sign * (A - 1) * cos - sq)]
+        a = [(A + 1) + sign * (A - 1) * cos + sq, -sign * 2 * ((A - 1) + sign * (A + 1) * cos),
+             (A + 1) + sign * (A - 1) * cos - sq]
+    return np.array(b + a) / a[0]
+
+# --- KASKADA BIQUADÓW ZE STANEM (stos barwy wzmacniacza) ---
+# Z kernelem (Numba) liczone w miejscu, bez alokacji; bez niego sosfilt
+# (w C, alokuje wynik bloku i kopię zi, ale jest szybszy niż rekurencja
+# rozpisana w NumPy), a stan wraca do tego samego zi.
+# Nowe współczynniki nie wchodzą skokiem: w bloku, w którym się pojawią,
+# przechodzimy od starych do nowych liniowo w `steps` kawałkach (jak GainRamp
+# dla głośności). Sekcje to ten sam typ filtra o tej samej częstotliwości,
+# więc pośrednie zestawy są stabilne.
+class SOSCascade:
+    def __init__(self, sections, steps=8):
+        self.zi = np.zeros((sections, 2))
+        self.sos = None
+        self.steps = steps
+        self.mix = np.empty((sections, 6))
+        self.kernel = kernels.sos_cascade
+
+    def reset(self):
+        self.zi[:] = 0.0
+
+    def tail(self, floor):
+        # Najwolniej gasnący biegun: zespolone sqrt(a2), rzeczywiste większy pierwiastek
+        if self.sos is None: return 0
+        a1, a2 = self.sos[:, 4], self.sos[:, 5]
+        disc = a1 * a1 - 4.0 * a2
+        r = np.where(disc < 0, np.sqrt(np.abs(a2)), (np.abs(a1) + np.sqrt(np.maximum(disc, 0.0))) / 2)
+        return decay_samples(1, float(r.max()), floor)
+
+    def energy(self):
+        return peak_energy(self.zi)
+
+    def _run(self, x, out, sos):
+        if self.kernel is not None:
+            self.kernel(x, out, sos, self.zi)
+        else:
+            # zf to kopia - stan wraca do prealokowanego zi w miejscu
+            y, zf = sosfilt(sos, x, zi=self.zi)
+            out[:] = y
+            self.zi[:] = zf
+        return out
+
+    def process(self, x, out, sos):
+        # sos z cache współczynników: nowy obiekt = zmiana gałek
+        prev, self.sos = self.sos, sos
+        if prev is None or prev is sos: return self._run(x, out, sos)
+        n = len(x)
+        step = max(1, -(-n // self.steps))
+        for i in range(0, n, step):
+            m = min(step, n - i)
+            np.subtract(sos, prev, out=self.mix)
+            self.mix *= (i + m) / n
+            self.mix += prev
+            self._run(x[i:i + m], out[i:i + m], self.mix)
+        return out
+
+# --- FILTR JEDNOBIEGUNOWY: y += coef * (x - y) ---
+# Rekurencja o stałym współczynniku rozwiązana w zamkniętej postaci:
+# y[j] = k^(j+1) * (y0 + coef * sum(x[i] / k^(i+1))), k = 1 - coef.
+# Potęgi są policzone raz, kawałek jest na tyle krótki, żeby k^n nie zeszło
+# poniżej 1e-150 (float64), więc wynik zgadza się z lfilter do ~1e-13.
+class OnePole:
+    def __init__(self, coef):
+        self.ws = Workspace()
+        self.value = 0.0
+        self.coef = None
+        self.set_coef(coef)
+
+    def set_coef(self, coef):
+        if coef == self.coef: return
+        self.coef = coef
+        k = 1.0 - coef
+        if 0.0 < k < 1.0:
+            self.chunk = int(min(256, max(1, 150 / -np.log10(k))))
+            self.pows = k ** np.arange(1, self.chunk + 1)
+            self.inv_pows = 1.0 / self.pows
+
+    def reset(self):
+        self.value = 0.0
+
+    def process(self, x, out):
+        n = len(x)
+        k = 1.0 - self.coef
+        if k <= 0.0:
+            out[:] = x
+        elif k >= 1.0:
+            out[:] = self.value
+        else:
+            acc = self.ws.get('acc', n, np.float64)
+            y = self.value
+            for i in range(0, n, self.chunk):
+                m = min(self.chunk, n - i)
+                a = acc[i:i + m]
+                a[:] = x[i:i + m]
+                a *= self.inv_pows[:m]
+                np.cumsum(a, out=a)
+                a *= self.coef
+                a += y
+                a *= self.pows[:m]
+                y = float(a[-1])
+            out[:] = acc
+        if n: self.value = float(out[-1])
+        return out
+
+# --- DETEKTOR OBWIEDNI (ATTACK / RELEASE) ---
+# Wybór attack/release zależy od poprzedniej wartości obwiedni, więc blok
+# liczymy iteracyjnie: zgadujemy tryb dla każdej próbki, liczymy rekurencję
+# o zmiennym współczynniku wektorowo (cumprod/cumsum) i poprawiamy decyzje
+# tam, gdzie się nie zgadzają. Każda iteracja ustala co najmniej jedną
+# kolejną próbkę, a zwykle wystarczą 2-3 przebiegi na blok.
+# Wynik jest identyczny z pętlą próbka-po-próbce (z dokładnością do float64).
+# Ze skompilowanym backendem (kernels.envelope) liczymy po prostu tę pętlę.
+class EnvelopeFollower:
+    def __init__(self, attack, release, chunk=256):
+        # Współczynniki muszą być w (0, 1); chunk ogranicza underflow cumprod
+        self.attack = attack
+        self.release = release
+        self.chunk = chunk
+        self.value = 0.0
+        self.kernel = kernels.envelope
+        self.ws = Workspace()
+
+    def reset(self):
+        self.value = 0.0
+
+    def process(self, level, out):
+        if self.kernel is not None:
+            self.value = self.kernel(level, out, self.value, self.attack, self.release)
+            return out
+        n = len(level)
+        ws = self.ws
+        c = ws.get('c', self.chunk, np.float64)
+        g = ws.get('g', self.chunk, np.float64)
+        y = ws.get('y', self.chunk, np.float64)
+        prev = ws.get('prev', self.chunk, np.float64)
+        rising = ws.get('rising', self.chunk, np.bool_)
+        actual = ws.get('actual', self.chunk, np.bool_)
+        flips = ws.get('flips', self.chunk, np.bool_)
+
+        xs = ws.get('x', self.chunk, np.float64)
+
+        e = self.value
+        for i in range(0, n, self.chunk):
+            m = min(self.chunk, n - i)
+            x = xs[:m]
+            x[:] = level[i:i + m]
+            c_, g_, y_, p_ = c[:m], g[:m], y[:m], prev[:m]
+            r_, a_, f_ = rising[:m], actual[:m], flips[:m]
+            np.greater(x, e, out=r_)
+            while True:
+                # e[n] = (1 - c[n]) * e[n-1] + c[n] * x[n]
+                c_.fill(self.release)
+                np.copyto(c_, self.attack, where=r_)
+                np.subtract(1.0, c_, out=g_)
+                np.cumprod(g_, out=g_)
+                np.multiply(c_, x, out=y_)
+                y_ /= g_
+                np.cumsum(y_, out=y_)
+                y_ += e
+                y_ *= g_
+
+                p_[0] = e
+                p_[1:] = y_[:-1]
+                np.greater(x, p_, out=a_)
+                np.not_equal(a_, r_, out=f_)
+                if not f_.any(): break
+                r_, a_ = a_, r_
+            out[i:i + m] = y_
+            e = float(y_[-1])
+        self.value = e
+        return out
+
+# --- LFO SINUSOIDALNE ---
+# Zwraca trajektorię dla całego bloku, faza jest zawijana do [0, 2pi),
+# żeby nie traciła precyzji po godzinach grania.
+class SineLFO:
+    def __init__(self):
+        self.phase = 0.0
+        self.ws = Workspace()
+
+    def block(self, n, freq, fs, out):
+        step = 2 * np.pi * freq / fs
+        np.multiply(self.ws.ramp(n), step, out=out)
+        out += self.phase
+        np.sin(out, out=out)
+        self.phase = (self.phase + step * n) % (2 * np.pi)
+        return out
+
+    def skip(self, n, freq, fs):
+        # Faza po n próbkach bez liczenia trajektorii (etap wygasły)
+        self.phase = (self.phase + 2 * np.pi * freq / fs * n) % (2 * np.pi)
+
+# --- LINIA OPÓŹNIAJĄCA Z MODULACJĄ (bufor kołowy) ---
+# Odczyt z interpolacją liniową dla ułamkowych opóźnień, liczony dla całego
+# pod-bloku naraz. Przy sprzężeniu zwrotnym pod-blok nie może być dłuższy niż
+# najkrótsze opóźnienie w jego obrębie - wtedy wszystko, co czytamy, jest już
+# zapisane i wynik jest dokładny.
+class ModulatedDelayLine:
+    def __init__(self, size):
+        self.size = size
+        # Bufor jest zdublowany (każda próbka leży pod p i p + size), więc
+        # odczyt nigdy nie potrzebuje modulo; ostatnia komórka to kopia
+        # buffer[0] dla interpolacji.
+        self.buffer = np.zeros(2 * size + 1, dtype=np.float32)
+        self.ptr = 0
+        self.ws = Workspace()
+        # Skompilowana pętla (kernels.py), None = kawałki wektorowe
+        self.kernel = kernels.modulated_delay
+
+    def reset(self):
+        self.buffer[:] = 0.0
+        self.ptr = 0
+
+    def _read(self, base, delays, out):
+        n = len(delays)
+        pos = self.ws.get('pos', n, np.float64)
+        whole = self.ws.get('whole', n, np.float64)
+        i0 = self.ws.get('i0', n, np.int64)
+        frac = self.ws.get('frac', n)
+        s0 = self.ws.get('s0', n)
+        s1 = self.ws.get('s1', n)
+
+        np.subtract(self.ws.ramp(n), delays, out=pos)
+        pos += base + self.size
+        np.floor(pos, out=whole)
+        pos -= whole
+        frac[:] = pos
+        np.copyto(i0, whole, casting='unsafe')
+        # mode='clip' nie buforuje (indeksy i tak są zawsze w zakresie)
+        np.take(self.buffer, i0, out=s0, mode='clip')
+        i0 += 1
+        np.take(self.buffer, i0, out=s1, mode='clip')
+        s1 -= s0
+        s1 *= frac
+        np.add(s0, s1, out=out)
+        return out
+
+    def _write(self, x):
+        # Pod-bloki nigdy nie przekraczają końca bufora
+        end = self.ptr + len(x)
+        self.buffer[self.ptr:end] = x
+        self.buffer[self.ptr + self.size:end + self.size] = x
+        if self.ptr == 0: self.buffer[-1] = x[0]
+        self.ptr = end % self.size
+
+    def process_taps(self, x, delays, outs):
+        # Kilka odczytów (bez sprzężenia) z jednego zapisu: delays i outs to krotki
+        n = len(x)
+        cap = max(self.size - int(np.ceil(max((d.max() for d in delays), default=0.0))) - 2, 1)
+        i = 0
+        while i < n:
+            span = min(cap, self.size - self.ptr, n - i)
+            base = self.ptr
+            self._write(x[i:i + span])
+            for d, y in zip(delays, outs): self._read(base, d[i:i + span], y[i:i + span])
+            i += span
+        return outs
+
+    def process(self, x, delays, out, feedback=0.0):
+        # delays: opóźnienie w próbkach dla każdej próbki bloku (>= 1)
+        n = len(x)
+        if self.kernel is not None:
+            self.ptr = self.kernel(x, delays, out, self.buffer, self.ptr, self.size, feedback)
+            return out
+        # Bez kernela sprzężenie liczy się kawałkami nie dłuższymi niż
+        # najkrótsze opóźnienie (~20 próbek dla BF-3): wynik dokładny, ale
+        # narzut NumPy na kawałek zjada większość zysku - to tylko zapas.
+        cap = max(self.size - int(np.ceil(delays.max())) - 2, 1)
+        tmp = self.ws.get('tmp', n)
+
+        i = 0
+        while i < n:
+            span = min(cap, self.size - self.ptr, n - i)
+            if feedback:
+                # Minimum z okna dłuższego niż pod-blok - bezpieczne ograniczenie
+                d0 = int(delays[i])
+                span = max(min(span, int(delays[i:i + d0].min())), 1)
+            xs = x[i:i + span]
+            ds = delays[i:i + span]
+            y = out[i:i + span]
+            base = self.ptr
+            if feedback:
+                self._read(base, ds, y)
+                t = tmp[:span]
+                np.multiply(y, feedback, out=t)
+                t += xs
+                self._write(t)
+            else:
+                # Bez sprzężenia najpierw zapis, więc krótkie opóźnienia
+                # mogą czytać próbki z bieżącego pod-bloku
+                self._write(xs)
+                self._read(base, ds, y)
+            i += span
+        return out
+
+# --- SILNIK PĘTLI SPRZĘŻENIA (stałe opóźnienie) ---
+# Pętla: buffer[n] = f(x[n], buffer[n - delay]). Blok dzielimy na kawałki
+# nie dłuższe niż opóźnienie pętli, więc cały kawałek czyta wyłącznie próbki
+# zapisane wcześniej i można go policzyć wektorowo. Koszt nie zależy od
+# długości ogona (współczynnika sprzężenia), tylko od długości bloku.
+class FeedbackDelay:
+    def __init__(self, size):
+        self.buffer = np.zeros(size, dtype=np.float32)
+        self.ptr = 0
+        self.ws = Workspace()
+
+    def reset(self):
+        self.buffer[:] = 0.0
+        self.ptr = 0
+
+    def _read(self, delay, out):
+        size = len(self.buffer)
+        n = len(out)
+        start = (self.ptr - delay) % size
+        end = start + n
+        if end <= size:
+            out[:] = self.buffer[start:end]
+        else:
+            k = size - start
+            out[:k] = self.buffer[start:]
+            out[k:] = self.buffer[:end - size]
+        return out
+
+    def _write(self, x):
+        size = len(self.buffer)
+        end = self.ptr + len(x)
+        if end <= size:
+            self.buffer[self.ptr:end] = x
+        else:
+            k = size - self.ptr
+            self.buffer[self.ptr:] = x[:k]
+            self.buffer[:end - size] = x[k:]
+        self.ptr = end % size
+
+    def process(self, x, delay, loop, out):
+        # loop(x_kawałek, delayed, out_kawałek) zapisuje wyjście kawałka
+        # do out_kawałek i zwraca tablicę do zapisania w buforze.
+        # delay w próbkach, 1 <= delay <= len(buffer)
+        n = len(x)
+        delayed = self.ws.get('delayed', min(n, delay))
+        for i in range(0, n, delay):
+            m = min(delay, n - i)
+            d = self._read(delay, delayed[:m])
+            self._write(loop(x[i:i + m], d, out[i:i + m]))
+        return out
+
+# --- FILTR GRZEBIENIOWY (z tłumieniem w pętli) ---
+class CombFilter:
+    def __init__(self, delay, damp=0.0):
+        self.delay = delay
+        self.line = FeedbackDelay(delay)
+        # damp = 0 -> brak filtra w pętli
+        self.lp = OnePole(1.0 - damp)
+        self.feedback = 0.5
+        self.ws = Workspace()
+
+    def _loop(self, xs, delayed, out):
+        out[:] = delayed
+        fb = self.lp.process(delayed, self.ws.get('fb', len(xs)))
+        fb *= self.feedback
+        fb += xs
+        return fb
+
+    def process(self, x, out):
+        return self.line.process(x, self.delay, self._loop, out)
+
+# --- FILTR WSZECHPRZEPUSTOWY (Schroeder) ---
+class AllpassFilter:
+    def __init__(self, delay, gain=0.7):
+        self.delay = delay
+        self.gain = gain
+        self.line = FeedbackDelay(delay)
+        self.ws = Workspace()
+
+    def _loop(self, xs, delayed, out):
+        # v = x + g * d;  y = d - g * v
+        v = self.ws.get('v', len(xs))
+        np.multiply(delayed, self.gain, out=v)
+        v += xs
+        np.multiply(v, -self.gain, out=out)
+        out += delayed
+        return v
+
+    def process(self, x, out):
+        return self.line.process(x, self.delay, self._loop, out)
+
+# --- TABLICA PRZEJŚCIA (waveshaper bez pamięci) ---
+# Złożenie kilku krzywych y = f(x) spróbkowane raz na siatce [-limit, limit]
+# i odczytywane z interpolacją liniową - jedno przejście po bloku niezależnie
+# od tego, ile krzywych sklejono. Wejście spoza siatki jest przycinane do
+# krawędzi (przesterowane krzywe są tam i tak płaskie); limit 12 mieści pełne
+# wysterowanie przy gałce gain = 11. Po przebudowie (zmiana gałki) pierwszy
+# blok przechodzi liniowo ze starej krzywej w nową, bez skoku na granicy.
+class TransferTable:
+    def __init__(self, size=1 << 16, limit=12.0):
+        self.size = size
+        self.limit = limit
+        self.grid = np.linspace(-limit, limit, size)
+        self.scale = (size - 1) / (2.0 * limit)
+        self.values = np.zeros(size)
+        self.slopes = np.zeros(size)
+        self.prev_values = np.zeros(size)
+        self.prev_slopes = np.zeros(size)
+        self.built = False
+        self.fade = False
+        self.ws = Workspace()
+
+    def build(self, curves):
+        # curves: funkcje float64 -> float64, stosowane po kolei
+        self.values, self.prev_values = self.prev_values, self.values
+        self.slopes, self.prev_slopes = self.prev_slopes, self.slopes
+        y = self.grid
+        for curve in curves: y = curve(y)
+        self.values[:] = y
+        # Przyrost na komórkę (ostatnia komórka płaska)
+        np.subtract(self.values[1:], self.values[:-1], out=self.slopes[:-1])
+        self.slopes[-1] = 0.0
+        self.fade = self.built
+        self.built = True
+
+    def _lookup(self, values, slopes, idx, frac, y, tmp):
+        np.take(slopes, idx, out=y, mode='clip')
+        y *= frac
+        np.take(values, idx, out=tmp, mode='clip')
+        y += tmp
+        return y
+
+    def process(self, x, out):
+        n = len(x)
+        pos = self.ws.get('pos', n, np.float64)
+        whole = self.ws.get('whole', n, np.float64)
+        idx = self.ws.get('idx', n, np.int64)
+        y = self.ws.get('y', n, np.float64)
+
+        pos[:] = x
+        pos += self.limit
+        pos *= self.scale
+        # minimum/maximum zamiast np.clip - to samo, a kilka razy taniej
+        np.maximum(pos, 0.0, out=pos)
+        np.minimum(pos, self.size - 1, out=pos)
+        np.floor(pos, out=whole)
+        pos -= whole
+        np.copyto(idx, whole, casting='unsafe')
+        self._lookup(self.values, self.slopes, idx, pos, y, whole)
+        if self.fade:
+            # y = old + (new - old) * (k + 1) / n
+            old = self._lookup(self.prev_values, self.prev_slopes, idx, pos,
+                               self.ws.get('old', n, np.float64), whole)
+            y -= old
+            np.add(self.ws.ramp(n), 1.0, out=whole)
+            whole *= 1.0 / n
+            y *= whole
+            y += old
+            self.fade = False
+        out[:] = y
+        return out
+
+# --- NADPRÓBKOWANIE POLIFAZOWE (dla nieliniowości) ---
+# Clipping i tanh dają harmoniczne powyżej Nyquista, które przy bazowym fs
+# odbijają się w pasmo (aliasing). Oversampler podnosi blok factor razy,
+# nieliniowość liczy się na gęstszym sygnale, a filtr + decymacja wracają do
+# fs. Filtr FIR jest rozłożony na fazy, więc liczymy tylko niezerowe iloczyny:
+# interpolacja to jedno mnożenie macierzy (okna wejścia x bank faz), decymacja
+# to jedno mnożenie (okna co factor próbek x odwrócony filtr). Historia obu
+# filtrów przechodzi między blokami. Opóźnienie: taps - 1 próbek bazowego fs,
+# niezależnie od factor (przełączanie nie przesuwa sygnału).
+OVERSAMPLE_FACTORS = (1, 2, 4, 8)
+
+@lru_cache(maxsize=None)
+def polyphase_bank(factor, taps):
+    # Dolnoprzepustowy z lekkim zapasem pod Nyquistem bazowego fs, tłumienie ~80 dB
+    h = firwin(factor * taps, 0.9 / factor, window=('kaiser', 8.0))
+    return h.astype(np.float32)
+
+class Oversampler:
+    def __init__(self, factor=1, taps=16):
+        if factor not in OVERSAMPLE_FACTORS:
+            raise ValueError(f"Nieobsługiwany współczynnik nadpróbkowania: {factor}")
+        self.factor = factor
+        self.taps = taps
+        self.latency = taps - 1 if factor > 1 else 0
+        h = polyphase_bank(factor, taps)
+        # Okno wejścia [x[k - T + 1] .. x[k]] razy bank -> faza p próbki k:
+        # hi[k * L + p] = L * sum_t x[k - t] * h[t * L + p]
+        self.up_bank = np.ascontiguousarray(h.reshape(taps, factor)[::-1] * factor)
+        # lo[k] = sum_j h[j] * hi[k * L + L - 1 - j]
+        self.down_taps = np.ascontiguousarray(h[::-1])
+        self.x_hist = np.zeros(taps - 1, dtype=np.float32)
+        self.y_hist = np.zeros((taps - 1) * factor, dtype=np.float32)
+        self.ws = Workspace()
+        self.views = None
+
+    def reset(self):
+        self.x_hist[:] = 0.0
+        self.y_hist[:] = 0.0
+
+    def tail(self, floor):
+        # Filtry FIR: pamięć to historia wejścia i wyjścia
+        return 2 * self.latency
+
+    def energy(self):
+        return peak_energy(self.x_hist, self.y_hist) if self.factor > 1 else 0.0
+
+    def _views(self, n):
+        # Widoki okien liczone raz na rozmiar bloku (tworzenie widoku kosztuje
+        # więcej niż samo mnożenie przy małych blokach)
+        L, T = self.factor, self.taps
+        ws = self.ws
+        ex = ws.get('ex', n + T - 1)
+        hi = ws.get('hi', n * L)
+        ey = ws.get('ey', (n + T - 1) * L)
+        # Wiersz k: hi[k * L - (T - 1) * L .. k * L + L - 1] (okna zachodzą na siebie)
+        frames = as_strided(ey, shape=(n, T * L), strides=(L * ey.itemsize, ey.itemsize))
+        self.views = (n, ex, sliding_window_view(ex, T), hi, hi.reshape(n, L),
+                      ws.get('hi_out', n * L), ey, frames)
+
+    def process(self, x, out, shaper):
+        # shaper(hi, hi_out) - nieliniowość liczona przy fs * factor
+        L, T = self.factor, self.taps
+        if L == 1: return shaper(x, out)
+        n = len(x)
+        if self.views is None or self.views[0] != n: self._views(n)
+        _, ex, windows, hi, hi_frames, hi_out, ey, frames = self.views
+
+        ex[:T - 1] = self.x_hist
+        ex[T - 1:] = x
+        self.x_hist[:] = ex[n:]
+        np.matmul(windows, self.up_bank, out=hi_frames)
+
+        y = shaper(hi, hi_out)
+
+        ey[:(T - 1) * L] = self.y_hist
+        ey[(T - 1) * L:] = y
+        self.y_hist[:] = ey[n * L:]
+        np.matmul(frames, self.down_taps, out=out)
+        return out
+
+# --- KOLUMNA: SPLOT Z ODPOWIEDZIĄ IMPULSOWĄ (overlap-save, równy podział) ---
+# IR dzielimy na P kawałków po B próbek i trzymamy ich widma (FFT 2B). Co B
+# próbek wejścia: jedna FFT ramki [poprzedni blok, bieżący blok] do linii
+# opóźnienia w dziedzinie częstotliwości (FDL), suma P iloczynów widm i jedna
+# odwrotna FFT. Każdy blok robi dokładnie to samo (bez szczytów), FFT ma stały
+# rozmiar, a długość IR dokłada tylko tanie mnożenie P x (B + 1) - IR 200 ms+
+# mieści się w budżecie callbacku. Wejście i wyjście idą przez FIFO długości B,
+# więc blok PortAudio może mieć dowolną długość, a opóźnienie to zawsze B.
+# Widma są w cache według (plik, czas modyfikacji, fs, B) - powrót do IR albo
+# do fs nic nie liczy.
+
+@lru_cache(maxsize=16)
+def load_ir(path, mtime, fs):
+    # Pierwszy kanał WAV, przepróbkowany do fs, szczyt charakterystyki = 0 dB
+    ir_fs, data = wavfile.read(path)
+    h = np.asarray(data, dtype=np.float64)
+    if h.ndim > 1: h = h[:, 0]
+    if ir_fs != fs:
+        g = np.gcd(int(fs), int(ir_fs))
+        h = resample_poly(h, fs // g, ir_fs // g)
+    peak = np.abs(np.fft.rfft(h)).max()
+    return h / peak if peak > 0 else h
+
+@lru_cache(maxsize=16)
+def ir_partitions(path, mtime, fs, block):
+    # Widma kawałków ułożone pod FDL: R[j] = H[-j mod P], podwojone, żeby dla
+    # slotu s wycinek R[-s mod P:][:P] trafiał na sloty FDL bez kopiowania
+    h = load_ir(path, mtime, fs)
+    P = max(1, -(-len(h) // block))
+    parts = np.zeros((P, block))
+    parts.reshape(-1)[:len(h)] = h
+    H = np.fft.rfft(parts, 2 * block, axis=1).astype(np.complex64)
+    R = H[-np.arange(2 * P) % P]
+    R.flags.writeable = False
+    return R
+
+class PartitionedConvolver:
+    def __init__(self, block=256):
+        self.block = block
+        self.latency = block
+        self.ir = None
+        self.bank = None
+
+    def load(self, path, fs):
+        # Cały stan podmieniany jednym przypisaniem (callback może akurat liczyć)
+        B = self.block
+        spectra = ir_partitions(path, os.path.getmtime(path), fs, B)
+        P = len(spectra) // 2
+        self.bank = {
+            'spectra': spectra,
+            'fdl': np.zeros((P, B + 1), dtype=np.complex64),
+            'prod': np.empty((P, B + 1), dtype=np.complex64),
+            'acc': np.empty(B + 1, dtype=np.complex64),
+            'frame': np.zeros(2 * B, dtype=np.float32),
+            'y': np.empty(2 * B, dtype=np.float32),
+            'out': np.zeros(B, dtype=np.float32),
+            'fill': 0,
+            'slot': 0,
+        }
+        self.ir = path
+
+    def unload(self):
+        self.ir = self.bank = None
+
+    def tail(self, floor):
+        # Cała IR plus bufor FIFO (bez przybliżeń: splot nie ma sprzężenia)
+        return (len(self.bank['fdl']) + 1) * self.block if self.bank else 0
+
+    def energy(self):
+        return peak_energy(self.bank['frame'], self.bank['out']) if self.bank else 0.0
+
+    def reset(self):
+        if self.bank is None: return
+        for key in ('fdl', 'frame', 'out'): self.bank[key][:] = 0.0
+
+    def _partition(self, bank):
+        B = self.block
+        fdl = bank['fdl']
+        P = len(fdl)
+        slot = bank['slot']
+        np.fft.rfft(bank['frame'], out=fdl[slot])
+        k = -slot % P
+        np.multiply(fdl, bank['spectra'][k:k + P], out=bank['prod'])
+        np.sum(bank['prod'], axis=0, out=bank['acc'])
+        np.fft.irfft(bank['acc'], 2 * B, out=bank['y'])
+        bank['out'][:] = bank['y'][B:]
+        bank['frame'][:B] = bank['frame'][B:]
+        bank['slot'] = (slot + 1) % P
+
+    def process(self, x, out):
+        bank = self.bank
+        if bank is None:
+            out[:] = x
+            return out
+        B = self.block
+        frame, y = bank['frame'], bank['out']
+        fill = bank['fill']
+        i, n = 0, len(x)
+        while i < n:
+            m = min(B - fill, n - i)
+            frame[B + fill:B + fill + m] = x[i:i + m]
+            out[i:i + m] = y[fill:fill + m]
+            fill += m
+            i += m
+            if fill == B:
+                self._partition(bank)
+                fill = 0
+        bank['fill'] = fill
+        return out
+
+# --- PHASE VOCODER (przesunięcie wysokości w widmie) ---
+# Ramki Hanna z nakładką 4x: faza każdego binu daje jego prawdziwą
+# częstotliwość, bin k trafia do k * shift z częstotliwością razy shift,
+# a faza syntezy jest akumulowana między ramkami (stan trwały, zawijany do
+# 2pi). Okno, oczekiwane przyrosty fazy i wszystkie bufory są prealokowane;
+# rfft/irfft piszą do out. Strumieniowo jak PartitionedConvolver: wyjście
+# (i wejście do miksu, dry) opóźnione o size - hop próbek.
+class PhaseVocoder:
+    def __init__(self, size=1024, overlap=4):
+        self.size = size
+        self.hop = size // overlap
+        self.latency = size - self.hop
+        bins = size // 2 + 1
+        self.window = (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(size) / size))
+        # Analiza i synteza tym samym oknem: suma w^2 z nakładających się ramek
+        self.gain = self.hop / float((self.window ** 2).sum())
+        self.bins = np.arange(bins, dtype=np.float64)
+        self.expected = 2 * np.pi * self.hop / size * self.bins
+        self.in_fifo = np.zeros(size)
+        self.out_fifo = np.zeros(self.hop)
+        self.acc = np.zeros(size)
+        self.last_phase = np.zeros(bins)
+        self.sum_phase = np.zeros(bins)
+        self.fill = 0
+        self.ws = Workspace()
+
+    def reset(self):
+        for buf in (self.in_fifo, self.out_fifo, self.acc, self.last_phase, self.sum_phase): buf[:] = 0.0
+
+    def _frame(self, shift):
+        ws, size, hop = self.ws, self.size, self.hop
+        nb = len(self.bins)
+        frame = np.multiply(self.in_fifo, self.window, out=ws.get('frame', size, np.float64))
+        spec = np.fft.rfft(frame, out=ws.get('spec', nb, np.complex128))
+        mag = np.abs(spec, out=ws.get('mag', nb, np.float64))
+        phase = np.arctan2(spec.imag, spec.real, out=ws.get('phase', nb, np.float64))
+
+        # Odchyłka fazy od oczekiwanej -> prawdziwa częstotliwość (w binach)
+        delta = np.subtract(phase, self.last_phase, out=ws.get('delta', nb, np.float64))
+        self.last_phase[:] = phase
+        delta -= self.expected
+        wraps = np.multiply(delta, 1 / (2 * np.pi), out=ws.get('wraps', nb, np.float64))
+        np.rint(wraps, out=wraps)
+        wraps *= 2 * np.pi
+        delta -= wraps
+        delta *= size / (2 * np.pi * hop)
+        delta += self.bins
+
+        # Bin k -> round(k * shift); przy shift < 1 kilka binów sumuje się
+        # w jednym, te poza zakresem lądują w dodatkowym binie nb (odrzucany)
+        target = ws.get('target', nb, np.int64)
+        np.multiply(self.bins, shift, out=wraps)
+        np.rint(wraps, out=wraps)
+        np.minimum(wraps, nb, out=wraps)
+        np.copyto(target, wraps, casting='unsafe')
+        new_mag = ws.get('new_mag', nb + 1, np.float64)
+        new_freq = ws.get('new_freq', nb + 1, np.float64)
+        # target rośnie z k, więc suma binów źródłowych to różnica sum
+        # narastających: put zostawia w binie docelowym sumę do jego ostatniego
+        # źródła (późniejszy zapis wygrywa), maximum.accumulate przenosi ją
+        # na puste biny - bez np.add.at, które alokuje i jest bardzo wolne
+        cum = np.cumsum(mag, out=ws.get('cum', nb, np.float64))
+        ends = ws.get('ends', nb + 1, np.float64)
+        ends[:] = 0.0
+        np.put(ends, target, cum)
+        np.maximum.accumulate(ends, out=ends)
+        new_mag[0] = ends[0]
+        np.subtract(ends[1:], ends[:-1], out=new_mag[1:])
+        delta *= shift
+        new_freq[:] = 0.0
+        np.put(new_freq, target, delta)
+
+        tmp = np.multiply(new_freq[:nb], 2 * np.pi * hop / size, out=wraps)
+        self.sum_phase += tmp
+        np.remainder(self.sum_phase, 2 * np.pi, out=self.sum_phase)
+        np.cos(self.sum_phase, out=tmp)
+        np.multiply(new_mag[:nb], tmp, out=spec.real)
+        np.sin(self.sum_phase, out=tmp)
+        np.multiply(new_mag[:nb], tmp, out=spec.imag)
+        np.fft.irfft(spec, size, out=frame)
+        frame *= self.window
+        frame *= self.gain
+        self.acc += frame
+        self.out_fifo[:] = self.acc[:hop]
+        self.acc[:-hop] = self.acc[hop:]
+        self.acc[-hop:] = 0.0
+        self.in_fifo[:-hop] = self.in_fifo[hop:]
+
+    def process(self, x, out, shift, dry=None):
+        # out: sygnał przesunięty; dry (opcjonalnie): wejście z tym samym opóźnieniem
+        i, n = 0, len(x)
+        while i < n:
+            m = min(self.hop - self.fill, n - i)
+            r = self.latency + self.fill
+            self.in_fifo[r:r + m] = x[i:i + m]
+            out[i:i + m] = self.out_fifo[self.fill:self.fill + m]
+            if dry is not None: dry[i:i + m] = self.in_fifo[self.fill:self.fill + m]
+            self.fill += m
+            i += m
+            if self.fill == self.hop:
+                self.fill = 0
+                self._frame(shift)
+        return out
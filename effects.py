@@ -1,338 +1,771 @@
+import mmap
+from collections import deque
+
 import numpy as np
+from scipy.signal import butter
+from dsp import (
+    OnePole, EnvelopeFollower, SineLFO, ModulatedDelayLine,
+    FeedbackDelay, CombFilter, AllpassFilter, StatefulIIR, Workspace, Oversampler, GainRamp, PhaseVocoder,
+    decay_samples, peak_energy
+)
+import kernels
+from params import Params
+from ringbuffer import SPSCRing, HistoryBuffer
 
 # --- BAZA ---
+# Sygnał to jednowymiarowy blok float32 (mono). apply(signal, out) zapisuje
+# wynik do prealokowanego out (nie może to być signal) i go zwraca; bufory
+# bloków należą do AudioManager, tymczasowe tablice efektu do self.ws.
+# Waveshapery bez pamięci podają też curve(x) - krzywą przejścia liczoną na
+# dowolnej tablicy float64 - żeby AudioManager mógł skleić sąsiednie takie
+# etapy w jedną tablicę (dsp.TransferTable). shaper = 'full': cały efekt to
+# krzywa; 'pre': tylko jego początek (apply_pre), resztę robi apply_post.
+# Część nieliniową (shape) można liczyć z nadpróbkowaniem: set_oversample(4).
+# Współczynniki wyprowadzone z gałek (derive) liczymy z migawki parametrów
+# i trzymamy do zmiany wersji (params.version) albo fs - nie co blok.
+# tail(floor) / energy() / reset() jak w dsp.py (CISZA I OGONY): na ich
+# podstawie AudioManager przestaje liczyć efekt, którego ogon już wygasł;
+# skip(n) przesuwa wtedy tylko zegary efektu (LFO), jakby blok był policzony.
+# prepare(fs) woła AudioManager.set_samplerate przed otwarciem strumienia:
+# tam efekt buduje wszystko, co zależy od fs, żeby callback nie alokował.
 class Effect:
+    shaper = None
+    # Stałe opóźnienie wnoszone przez efekt [próbki], wliczane do opóźnienia planu
+    latency = 0
+
     def __init__(self, fs=48000):
         self.active = False
         self.fs = fs
         self.params = {}
+        self.coef_key = None
+        self.ws = Workspace()
+        self.oversampler = Oversampler(1)
+
+    @property
+    def params(self): return self._params
+
+    @params.setter
+    def params(self, values): self._params = Params(values)
+
+    def derive(self, p):
+        return ()
+
+    def coefs(self):
+        # Wersję czytamy przed kopią: jeśli zapis wpadnie pomiędzy, kopia jest
+        # nowsza od klucza i następny blok po prostu przeliczy jeszcze raz
+        key = (self._params.version, self.fs)
+        if key != self.coef_key:
+            self.coef_cache = self.derive(self._params.snapshot())
+            self.coef_key = key
+        return self.coef_cache
+
+    def prepare(self, fs):
+        self.fs = fs
+
+    def set_oversample(self, factor):
+        if factor != self.oversampler.factor: self.oversampler = Oversampler(factor)
+
+    # --- OGON (bez pamięci poza nadpróbkowaniem) ---
+    def tail(self, floor):
+        return self.oversampler.tail(floor)
+
+    def energy(self):
+        return self.oversampler.energy()
+
+    def reset(self):
+        self.oversampler.reset()
+
+    def skip(self, n):
+        pass
+
+    def shape(self, signal, out):
+        fn = self.apply if self.shaper == 'full' else self.apply_pre
+        return self.oversampler.process(signal, out, fn)
     
-    def process(self, signal):
+    def process(self, signal, out=None):
         if not self.active: return signal
-        return self.apply(signal)
+        # Wygoda poza callbackiem (testy, narzędzia): bez out alokujemy wynik
+        if out is None: out = np.empty(len(signal), dtype=np.float32)
+        if self.shaper == 'full': return self.shape(signal, out)
+        return self.apply(signal, out)
     
-    def apply(self, signal): return signal
+    def apply(self, signal, out):
+        out[:] = signal
+        return out
+
 # --- 1. TUNER (TU-3 Logic) ---
 # --- 1. TUNER (TU-3 Logic - WERSJA BEZ MUTE) ---
 # --- 1. TUNER (TU-3 PRO VERSION) ---
+# Detektor: YIN (różnicowa funkcja autokorelacji liczona przez FFT) na sygnale
+# zdecymowanym do ~16 kHz. Okno i zakres strojenia da się ustawić: dłuższe okno
+# = stabilniejszy odczyt, krótsze = szybsza reakcja.
 class BossTU3(Effect):
-    def __init__(self, fs):
+    NOTE_NAMES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
+
+    def __init__(self, fs, fmin=40.0, fmax=1500.0, window_ms=50.0, update_hz=15.0, threshold=0.15):
         super().__init__(fs)
-        # Większy bufor = większa precyzja dla niskich strun (E, A)
-        self.buffer = np.zeros(8192) 
-        self.ptr = 0
+        # fmin 40 Hz: łapie też drop tuning i 7 strun (B1 = 61.7 Hz)
+        self.fmin = fmin
+        self.fmax = fmax
+        self.window_ms = window_ms
+        self.update_hz = update_hz
+        self.threshold = threshold
         self.is_ready = False
-        self.NOTE_NAMES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
 
-    def process(self, signal):
-        # Tuner tylko analizuje, sygnał przepuszcza bez zmian (True Bypass)
-        self._analyze(signal)
+        # Próbki z wątku audio -> wątek monitora (analiza poza callbackiem)
+        self.ring = SPSCRing(16384)
+        self.scratch = np.zeros(4096, dtype=np.float32)
+        self._build()
+
+    def prepare(self, fs):
+        super().prepare(fs)
+        if fs != self.built_fs: self._build()
+
+    def _build(self):
+        # Wszystko, co zależy od fs, liczone raz (prepare przed strumieniem)
+        self.built_fs = self.fs
+        self.decim = max(1, int(self.fs // 16000))
+        self.fs_d = self.fs / self.decim
+        self.decim_phase = 0
+        self.aa_filter = StatefulIIR(*butter(6, 0.8 / self.decim)) if self.decim > 1 else None
+
+        self.tau_min = max(2, int(self.fs_d / self.fmax))
+        self.tau_max = int(np.ceil(self.fs_d / self.fmin)) + 1
+        self.win = max(int(self.fs_d * self.window_ms / 1000), self.tau_max)
+        self.history = HistoryBuffer(self.win + self.tau_max)
+        self.nfft = 1 << int(np.ceil(np.log2(self.win + self.history.size)))
+        self.taus = np.arange(1, self.tau_max + 1)
+
+        self.pending = 0
+        self.last_result = {'note': '--', 'cents': 0}
+        self.is_ready = False
+
+    def tail(self, floor):
+        # Analiza musi zobaczyć ciszę (wskazanie gaśnie), a sam etap nic nie kosztuje
+        return float('inf')
+
+    def process(self, signal, out=None):
+        # Tuner tylko zbiera próbki, sygnał przepuszcza bez zmian (True Bypass)
+        if self.active: self.ring.push(signal)
         return signal 
 
-    def _analyze(self, signal):
-        # Pobieramy tylko jeden kanał (mono) do analizy
-        mono_signal = signal[:, 0]
-        chunk_size = len(mono_signal)
-        
-        # Bufor cykliczny
-        if self.ptr + chunk_size > len(self.buffer):
-            # Przesuwamy dane w lewo (FIFO)
-            self.buffer = np.roll(self.buffer, -chunk_size)
-            self.ptr = len(self.buffer) - chunk_size
-            
-        self.buffer[self.ptr : self.ptr + chunk_size] = mono_signal
-        # self.ptr nie zwiększamy w nieskończoność w buforze przesuwnym, 
-        # ale tutaj prościej jest trzymać stały wskaźnik końca.
+    def poll(self):
+        # Wywoływane z wątku monitora: przenosi próbki z bufora SPSC do analizy
+        while True:
+            n = self.ring.pop_into(self.scratch)
+            if not n: break
+            self._analyze(self.scratch[:n])
+
+    def _analyze(self, mono_signal):
+        # Antyaliasing + decymacja (faza decymacji przechodzi między blokami)
+        if self.aa_filter is not None:
+            filtered = self.aa_filter.process(mono_signal)
+            decimated = filtered[self.decim_phase::self.decim]
+            self.decim_phase = (self.decim_phase - len(mono_signal)) % self.decim
+        else:
+            decimated = mono_signal
+        self.history.write(decimated)
+        self.pending += len(decimated)
         self.is_ready = True
 
+    def _yin(self, x):
+        # d(tau) = E(0..W) + E(tau..tau+W) - 2 r(tau), r przez FFT
+        W, T = self.win, self.tau_max
+        spec = np.fft.rfft(x, self.nfft)
+        head = np.fft.rfft(x[:W], self.nfft)
+        r = np.fft.irfft(spec * np.conj(head), self.nfft)[:T + 1]
+
+        energy = np.concatenate(([0.0], np.cumsum(x * x)))
+        e_shift = energy[W:W + T + 1] - energy[:T + 1]
+        d = e_shift[0] + e_shift - 2.0 * r
+
+        # Skumulowana normalizacja (CMNDF)
+        cmnd = d[1:] * self.taus / np.maximum(np.cumsum(d[1:]), 1e-12)
+        return d[1:], cmnd, e_shift[0] / W
+
     def get_tuner_data(self):
         if not self.is_ready: 
             return {'note': '--', 'cents': 0}
+        # Nowa analiza dopiero po 1/update_hz sekundy nowych próbek
+        if self.pending < self.fs_d / self.update_hz:
+            return self.last_result
+        self.pending = 0
+        self.last_result = self._detect()
+        return self.last_result
 
-        # 1. Okno Hanninga
-        windowed = self.buffer * np.hanning(len(self.buffer))
-        
-        # 2. FFT
-        spectrum = np.abs(np.fft.rfft(windowed))
-        
-        # 3. Szukanie piku
-        peak_idx = np.argmax(spectrum)
-        max_val = spectrum[peak_idx]
+    def _detect(self):
+        x = self.history.latest()
+        diff, cmnd, power = self._yin(x)
+        if power < 1e-6:
+            return {'note': '--', 'cents': 0}
 
-        # --- POPRAWKA: ZMNIEJSZONY PRÓG (BYŁO 2.0) ---
-        if max_val < 0.1: 
+        # Pierwsze minimum poniżej progu (indeks i odpowiada tau = i + 1)
+        lo = self.tau_min - 1
+        below = np.flatnonzero(cmnd[lo:] < self.threshold)
+        if len(below) == 0:
             return {'note': '--', 'cents': 0}
+        i = lo + below[0]
+        while i + 1 < len(cmnd) and cmnd[i + 1] < cmnd[i]:
+            i += 1
 
-        # 4. Interpolacja
-        if 0 < peak_idx < len(spectrum) - 1:
-            y0, y1, y2 = spectrum[peak_idx-1], spectrum[peak_idx], spectrum[peak_idx+1]
-            denom = (y0 - 2*y1 + y2)
+        # Interpolacja paraboliczna minimum (na nienormalizowanej d(tau))
+        tau = float(i + 1)
+        if 0 < i < len(diff) - 1:
+            y0, y1, y2 = diff[i - 1], diff[i], diff[i + 1]
+            denom = y0 - 2 * y1 + y2
             if denom != 0:
-                delta = 0.5 * (y0 - y2) / denom
-                true_idx = peak_idx + delta
-            else:
-                true_idx = peak_idx
-        else:
-            true_idx = peak_idx
+                tau += 0.5 * (y0 - y2) / denom
 
-        # 5. Konwersja na Hz
-        freq = true_idx * self.fs / len(self.buffer)
-
-        # --- DIAGNOSTYKA (USUŃ TO JAK JUŻ BĘDZIE DZIAŁAĆ) ---
-        # print(f"TUNER DEBUG: Siła={max_val:.2f} | Hz={freq:.2f}") 
-        # ----------------------------------------------------
-
-        # 6. Filtrowanie (Gitara: E2=82Hz ... E4=330Hz ... High=1200Hz)
-        if freq < 60 or freq > 1500:
+        freq = self.fs_d / tau
+        if freq < self.fmin or freq > self.fmax:
             return {'note': '--', 'cents': 0}
 
-        # 7. Wynik
-        if freq > 0:
-            midi_num = 12 * np.log2(freq / 440.0) + 69
-            midi_rounded = int(round(midi_num))
-            note_idx = midi_rounded % 12
-            deviation = (midi_num - midi_rounded) * 100
-            
-            note_name = self.NOTE_NAMES[note_idx]
-            return {'note': note_name, 'cents': int(deviation)}
-            
-        return {'note': '--', 'cents': 0}
+        midi_num = 12 * np.log2(freq / 440.0) + 69
+        midi_rounded = int(round(midi_num))
+        note_idx = midi_rounded % 12
+        deviation = (midi_num - midi_rounded) * 100
+        return {'note': self.NOTE_NAMES[note_idx], 'cents': int(round(deviation)), 'freq': round(float(freq), 2)}
         
 # --- 2. COMPRESSOR (CS-3) ---
 class BossCS3(Effect):
     def __init__(self, fs):
         super().__init__(fs)
         self.params = {'level': 0.5, 'attack': 0.5, 'sustain': 0.5} 
-        self.envelope = 0.0
+        self.follower = EnvelopeFollower(attack=0.06, release=0.005)
+        self.makeup = GainRamp()
 
-    def apply(self, signal):
-        attack_coef = 0.01 + self.params['attack'] * 0.1
-        release_coef = 0.005 
-        thresh = 1.0 - (self.params['sustain'] * 0.8)
-        
-        output = np.zeros_like(signal)
-        for i in range(len(signal)):
-            lvl = abs(signal[i, 0])
-            if lvl > self.envelope: self.envelope += attack_coef * (lvl - self.envelope)
-            else: self.envelope += release_coef * (lvl - self.envelope)
-            
-            gain = 1.0
-            if self.envelope > thresh: gain = thresh / (self.envelope + 0.001)
-            
-            makeup = 1.0 + self.params['level'] * 3.0
-            output[i, 0] = signal[i, 0] * gain * makeup
-            
-        return np.clip(output, -0.95, 0.95)
+    @property
+    def envelope(self): return self.follower.value
+
+    def tail(self, floor):
+        return decay_samples(1, 1.0 - self.follower.release, floor)
+
+    def energy(self):
+        return self.follower.value ** 2
+
+    def reset(self):
+        self.follower.reset()
+
+    def derive(self, p):
+        return 0.01 + p['attack'] * 0.1, 1.0 - (p['sustain'] * 0.8), 1.0 + p['level'] * 3.0
+
+    def apply(self, signal, out):
+        self.follower.attack, thresh, makeup = self.coefs()
+        n = len(signal)
+
+        # Obwiednia całego bloku naraz (stan przechodzi między blokami)
+        level = np.abs(signal, out=self.ws.get('level', n))
+        env = self.follower.process(level, self.ws.get('env', n))
+
+        # gain = thresh / (env + 0.001) powyżej progu, 1.0 poniżej
+        gain = np.add(env, 0.001, out=self.ws.get('gain', n))
+        np.divide(thresh, gain, out=gain)
+        quiet = np.less_equal(env, thresh, out=self.ws.get('quiet', n, np.bool_))
+        np.copyto(gain, 1.0, where=quiet)
+        self.makeup.apply(gain, makeup)
+
+        np.multiply(signal, gain, out=out)
+        return np.clip(out, -0.95, 0.95, out=out)
 
 # --- 3. PITCH SHIFTER (PS-6) ---
 class BossPS6(Effect):
+    # Dwa odczyty z linii opóźniającej, całe bloki wektorowo: opóźnienie
+    # każdego zmienia się o (1 - shift) próbki na próbkę (odczyt z prędkością
+    # shift) w oknie WINDOW_S, drugi odczyt przesunięty o pół okna. Wagi
+    # sin^2 / cos^2 fazy okna: odczyt przeskakuje na drugi koniec okna
+    # dokładnie wtedy, gdy jego waga jest zerowa - bez trzasków, które dawał
+    # pojedynczy wskaźnik wyprzedzający zapis. Gałka 'mode' >= 0.5 włącza
+    # phase vocoder (dsp.PhaseVocoder): czystsze interwały bez "echa" okna
+    # za cenę opóźnienia ramki (latency, wliczane do opóźnienia planu).
+    # Wysokość: -12..+12 półtonów (0.5 = bez zmiany).
+    WINDOW_S = 0.03
+    MIN_DELAY = 2.0
+
     def __init__(self, fs):
         super().__init__(fs)
-        self.params = {'pitch': 0.5, 'balance': 0.5} 
-        self.buffer = np.zeros(8000)
-        self.w_ptr = 0
-        self.r_ptr = 0.0
-        
-    def apply(self, signal):
-        shift_factor = 0.5 + self.params['pitch'] 
-        mix = self.params['balance']
-        output = np.zeros_like(signal)
-        buf_len = len(self.buffer)
-        
-        for i in range(len(signal)):
-            self.buffer[self.w_ptr] = signal[i, 0]
-            idx_int = int(self.r_ptr)
-            frac = self.r_ptr - idx_int
-            s1 = self.buffer[idx_int % buf_len]
-            s2 = self.buffer[(idx_int + 1) % buf_len]
-            shifted = s1 * (1 - frac) + s2 * frac
-            
-            output[i, 0] = signal[i, 0] * (1-mix) + shifted * mix
-            
-            self.w_ptr = (self.w_ptr + 1) % buf_len
-            self.r_ptr = (self.r_ptr + shift_factor)
-            if self.r_ptr >= buf_len: self.r_ptr -= buf_len
-        return output
+        self.params = {'pitch': 0.5, 'balance': 0.5, 'mode': 0.0}
+        self.line = ModulatedDelayLine(8192)
+        self.phase = 0.0
+        self.vocoder = None
+
+    def derive(self, p):
+        shift = 2.0 ** ((p['pitch'] - 0.5) * 2.0)
+        # Przyrost fazy okna na próbkę, tryb: 0 = dwa odczyty, 1 = vocoder
+        return shift, p['balance'], (1.0 - shift) / (self.fs * self.WINDOW_S), int(p.get('mode', 0.0) >= 0.5)
+
+    @property
+    def latency(self):
+        return self._vocoder().latency if self.coefs()[3] else 0
+
+    def tail(self, floor):
+        if self.coefs()[3]: return self._vocoder().size
+        return int(self.fs * self.WINDOW_S + self.MIN_DELAY) + 2
+
+    def energy(self):
+        v = self.vocoder
+        return peak_energy(self.line.buffer, *((v.in_fifo, v.out_fifo, v.acc) if v else ()))
+
+    def reset(self):
+        self.line.reset()
+        if self.vocoder: self.vocoder.reset()
+
+    def skip(self, n):
+        self.phase = (self.phase + self.coefs()[2] * n) % 1.0
+        if self.vocoder: self.vocoder.fill = (self.vocoder.fill + n) % self.vocoder.hop
+
+    def _vocoder(self):
+        # Ramka ~21 ms niezależnie od fs (1024 przy 44.1/48 kHz, 2048 przy 96 kHz)
+        size = 1024 if self.fs <= 50000 else 2048
+        if self.vocoder is None or self.vocoder.size != size: self.vocoder = PhaseVocoder(size)
+        return self.vocoder
+
+    def apply(self, signal, out):
+        shift, mix, rate, vocoder = self.coefs()
+        n = len(signal)
+        if vocoder:
+            wet = self._vocoder().process(signal, self.ws.get('wet', n), shift, self.ws.get('dry', n))
+            np.multiply(self.ws.get('dry', n), 1.0 - mix, out=out)
+            wet *= mix
+            out += wet
+            return out
+        if shift == 1.0:
+            # Bez przesunięcia: linia dostaje blok (bez trzasku przy kręceniu), wyjście = wejście
+            self.line.process_taps(signal, (), ())
+            out[:] = signal
+            return out
+
+        window = self.fs * self.WINDOW_S
+        p = np.multiply(self.ws.ramp(n), rate, out=self.ws.get('phase', n, np.float64))
+        p += self.phase
+        np.remainder(p, 1.0, out=p)
+        self.phase = (self.phase + rate * n) % 1.0
+        d1 = np.multiply(p, window, out=self.ws.get('d1', n, np.float64))
+        d1 += self.MIN_DELAY
+        d2 = np.add(p, 0.5, out=self.ws.get('d2', n, np.float64))
+        np.remainder(d2, 1.0, out=d2)
+        d2 *= window
+        d2 += self.MIN_DELAY
+        # Waga pierwszego odczytu: sin^2(pi p) = 0.5 - 0.5 cos(2 pi p)
+        g = np.multiply(p, 2 * np.pi, out=p)
+        np.cos(g, out=g)
+        g *= -0.5
+        g += 0.5
+        t1, t2 = self.line.process_taps(signal, (d1, d2), (self.ws.get('t1', n), self.ws.get('t2', n)))
+        t1 -= t2
+        t1 *= g
+        t1 += t2
+
+        np.multiply(signal, 1.0 - mix, out=out)
+        t1 *= mix
+        out += t1
+        return out
 
 # --- 4. DISTORTION (DS-1) ---
 class BossDS1(Effect):
+    shaper = 'pre'
+
     def __init__(self, fs):
         super().__init__(fs)
         self.params = {'dist': 0.5, 'tone': 0.5, 'level': 0.5}
+        self.tone_lp = OnePole(0.1)
+        self.level = GainRamp()
 
-    def apply(self, signal):
-        drive = 1.0 + self.params['dist'] * 30.0
+    def derive(self, p):
+        return 1.0 + p['dist'] * 30.0, p['tone'], p['level'] * 2.0
+
+    def tail(self, floor):
+        return max(self.oversampler.tail(floor), decay_samples(1, 1.0 - self.tone_lp.coef, floor))
+
+    def energy(self):
+        return max(self.oversampler.energy(), self.tone_lp.value ** 2)
+
+    def reset(self):
+        self.oversampler.reset()
+        self.tone_lp.reset()
+
+    def curve(self, x):
         # Hard Clipping
-        distorted = np.clip(signal * drive, -0.8, 0.8)
-        
-        # Tone Stack (Scoop)
-        t = self.params['tone']
-        low_end = np.zeros_like(distorted)
-        curr = 0.0
-        for i in range(len(distorted)):
-            curr += 0.1 * (distorted[i, 0] - curr)
-            low_end[i, 0] = curr
-        
-        high_end = distorted - low_end
-        tone_mix = low_end * (1.0 - t) + high_end * t
-        
-        return tone_mix * self.params['level'] * 2.0
+        return np.clip(x * self.coefs()[0], -0.8, 0.8)
+
+    def apply_pre(self, signal, out):
+        np.multiply(signal, self.coefs()[0], out=out)
+        return np.clip(out, -0.8, 0.8, out=out)
+
+    def apply_post(self, distorted, out):
+        # Tone Stack (Scoop) - filtr trzyma stan między blokami
+        # low * (1 - t) + (distorted - low) * t = low * (1 - 2t) + distorted * t
+        _, t, level = self.coefs()
+        low_end = self.tone_lp.process(distorted, self.ws.get('low', len(distorted)))
+        low_end *= 1.0 - 2.0 * t
+        np.multiply(distorted, t, out=out)
+        out += low_end
+        return self.level.apply(out, level)
+
+    def apply(self, signal, out):
+        distorted = self.shape(signal, self.ws.get('distorted', len(signal)))
+        return self.apply_post(distorted, out)
 
 # --- 5. OVERDRIVE (OD-1) ---
 class BossOD1(Effect):
+    shaper = 'full'
+
     def __init__(self, fs):
         super().__init__(fs)
         self.params = {'drive': 0.5, 'level': 0.5}
+        self.level = GainRamp()
+
+    def derive(self, p):
+        return 1.0 + p['drive'] * 20.0, p['level']
+
+    def curve(self, x):
+        drive, level = self.coefs()
+        return np.tanh(x * np.where(x > 0, drive, drive * 0.7)) * level
 
-    def apply(self, signal):
-        drive = 1.0 + self.params['drive'] * 20.0
-        # Asymetryczny clipping
-        pos = np.tanh(signal * drive)
-        neg = np.tanh(signal * drive * 0.7) 
-        clipped = np.where(signal > 0, pos, neg)
-        return clipped * self.params['level']
+    def apply(self, signal, out):
+        drive, level = self.coefs()
+        # Asymetryczny clipping: dodatnia połówka drive, ujemna drive * 0.7
+        n = len(signal)
+        scale = self.ws.get('scale', n)
+        scale.fill(drive * 0.7)
+        np.copyto(scale, drive, where=np.greater(signal, 0, out=self.ws.get('pos', n, np.bool_)))
+        np.multiply(signal, scale, out=out)
+        np.tanh(out, out=out)
+        return self.level.apply(out, level)
 
 # --- 6. FUZZ (FZ-5) ---
 class BossFZ5(Effect):
+    shaper = 'full'
+
     def __init__(self, fs):
         super().__init__(fs)
         self.params = {'fuzz': 0.5, 'level': 0.5}
-        
-    def apply(self, signal):
-        gain = 5.0 + self.params['fuzz'] * 50.0
-        raw = (signal + 0.1) * gain
-        return np.clip(raw, -0.9, 0.9) * self.params['level'] * 0.5
+        self.level = GainRamp()
+
+    def derive(self, p):
+        return 5.0 + p['fuzz'] * 50.0, p['level'] * 0.5
+
+    def curve(self, x):
+        gain, level = self.coefs()
+        return np.clip((x + 0.1) * gain, -0.9, 0.9) * level
+
+    def apply(self, signal, out):
+        gain, level = self.coefs()
+        np.add(signal, 0.1, out=out)
+        out *= gain
+        np.clip(out, -0.9, 0.9, out=out)
+        return self.level.apply(out, level)
 
 # --- 7. BOOSTER (BP-1W) ---
 class BossBP1W(Effect):
+    shaper = 'full'
+
     def __init__(self, fs):
         super().__init__(fs)
         self.params = {'gain': 0.5, 'level': 0.5}
-        
-    def apply(self, signal):
-        drive = 1.0 + self.params['gain'] * 5.0
-        # Saturacja preampu
-        saturated = signal * drive - (signal * drive)**3 / 3 
-        return saturated * self.params['level']
+        self.level = GainRamp()
+
+    def derive(self, p):
+        return 1.0 + p['gain'] * 5.0, p['level']
+
+    def curve(self, x):
+        drive, level = self.coefs()
+        s = x * drive
+        return s * (1.0 - s * s / 3.0) * level
+
+    def apply(self, signal, out):
+        drive, level = self.coefs()
+        # Saturacja preampu: s - s^3 / 3 = s * (1 - s^2 / 3)
+        np.multiply(signal, drive, out=out)
+        shape = np.multiply(out, out, out=self.ws.get('shape', len(signal)))
+        shape *= -1.0 / 3.0
+        shape += 1.0
+        out *= shape
+        return self.level.apply(out, level)
 
 # --- 8. FLANGER (BF-3) ---
 class BossBF3(Effect):
     def __init__(self, fs):
         super().__init__(fs)
         self.params = {'rate': 0.4, 'depth': 0.6, 'res': 0.5} 
-        self.buffer = np.zeros(4000)
-        self.ptr = 0
-        self.lfo_phase = 0.0
-
-    def apply(self, signal):
-        rate = 0.1 + self.params['rate'] * 4.0
-        depth = self.params['depth'] * 100
-        feedback = self.params['res'] * 0.8
-        output = np.zeros_like(signal)
-        buf_len = len(self.buffer)
-        lfo_step = (2 * np.pi * rate) / self.fs
-        
-        for i in range(len(signal)):
-            lfo_val = (1.0 + np.sin(self.lfo_phase)) / 2.0
-            current_delay = 20 + lfo_val * depth
-            r_idx = int(self.ptr - current_delay) % buf_len
-            delayed = self.buffer[r_idx]
-            
-            inp = signal[i, 0] + delayed * feedback
-            self.buffer[self.ptr] = inp
-            output[i, 0] = signal[i, 0] + delayed
-            
-            self.ptr = (self.ptr + 1) % buf_len
-            self.lfo_phase += lfo_step
-        return output * 0.7
+        self.line = ModulatedDelayLine(4000)
+        self.lfo = SineLFO()
+
+    def derive(self, p):
+        return 0.1 + p['rate'] * 4.0, p['depth'] * 100, p['res'] * 0.8
+
+    def tail(self, floor):
+        # Najdłuższe opóźnienie (20 + depth) obiega pętlę ze sprzężeniem res
+        _, depth, feedback = self.coefs()
+        return decay_samples(int(20 + depth) + 2, feedback, floor)
+
+    def energy(self):
+        return peak_energy(self.line.buffer)
+
+    def reset(self):
+        self.line.reset()
+
+    def skip(self, n):
+        self.lfo.skip(n, self.coefs()[0], self.fs)
+
+    def apply(self, signal, out):
+        rate, depth, feedback = self.coefs()
+
+        # Cała trajektoria LFO dla bloku naraz: 20 + (1 + sin) / 2 * depth
+        delays = self.lfo.block(len(signal), rate, self.fs, self.ws.get('delays', len(signal), np.float64))
+        delays *= depth / 2.0
+        delays += 20 + depth / 2.0
+        self.line.process(signal, delays, out, feedback)
+
+        out += signal
+        out *= 0.7
+        return out
 
 # --- 9. CHORUS (CE-2W) ---
 class BossCE2W(Effect):
     def __init__(self, fs):
         super().__init__(fs)
         self.params = {'rate': 0.3, 'depth': 0.5} 
-        self.buffer = np.zeros(4800) 
-        self.ptr = 0
-        self.lfo_phase = 0.0
-
-    def apply(self, signal):
-        rate = 0.5 + self.params['rate'] * 3.0
-        depth = 50 + self.params['depth'] * 200
-        output = np.zeros_like(signal)
-        buf_len = len(self.buffer)
-        lfo_step = (2 * np.pi * rate) / self.fs
-        
-        for i in range(len(signal)):
-            lfo = np.sin(self.lfo_phase)
-            current_delay = 400 + lfo * depth 
-            r_idx = int(self.ptr - current_delay) % buf_len
-            delayed = self.buffer[r_idx] * 0.8 # Dark analog filter
-            
-            self.buffer[self.ptr] = signal[i, 0]
-            output[i, 0] = signal[i, 0] + delayed
-            
-            self.ptr = (self.ptr + 1) % buf_len
-            self.lfo_phase += lfo_step
-        return output
+        self.line = ModulatedDelayLine(4800)
+        self.lfo = SineLFO()
+
+    def derive(self, p):
+        return 0.5 + p['rate'] * 3.0, 50 + p['depth'] * 200
+
+    def tail(self, floor):
+        # Bez sprzężenia: ogon to najdłuższe opóźnienie (400 + depth)
+        return int(400 + self.coefs()[1]) + 2
+
+    def energy(self):
+        return peak_energy(self.line.buffer)
+
+    def reset(self):
+        self.line.reset()
+
+    def skip(self, n):
+        self.lfo.skip(n, self.coefs()[0], self.fs)
+
+    def apply(self, signal, out):
+        rate, depth = self.coefs()
+
+        delays = self.lfo.block(len(signal), rate, self.fs, self.ws.get('delays', len(signal), np.float64))
+        delays *= depth
+        delays += 400
+        self.line.process(signal, delays, out)
+
+        out *= 0.8 # Dark analog filter
+        out += signal
+        return out
 
 # --- 10. DELAY (DM-2W) ---
 class BossDM2W(Effect):
     def __init__(self, fs):
         super().__init__(fs)
         self.params = {'time': 0.3, 'repeat': 0.4, 'intensity': 0.5}
-        self.buffer = np.zeros(fs * 2)
-        self.ptr = 0
-        self.lp_val = 0.0
-
-    def apply(self, signal):
-        # NAPRAWIONE: Usunięto błąd w tej linii
-        delay_samples = int(0.02 * self.fs + self.params['time'] * 0.6 * self.fs)
-        feedback = self.params['repeat'] * 0.9 
-        mix = self.params['intensity']
-        output = np.zeros_like(signal)
-        buf_len = len(self.buffer)
-        
-        for i in range(len(signal)):
-            r_idx = (self.ptr - delay_samples) % buf_len
-            delayed = self.buffer[r_idx]
-            
-            # Analog Degradation Filter
-            self.lp_val += 0.3 * (delayed - self.lp_val)
-            filtered_delayed = self.lp_val
-            
-            # TU BYŁ BŁĄD SKŁADNI - TERAZ JEST POPRAWNIE:
-            current_in = signal[i, 0]
-            
-            to_buffer = current_in + filtered_delayed * feedback
-            self.buffer[self.ptr] = np.tanh(to_buffer) 
-            
-            output[i, 0] = current_in + filtered_delayed * mix
-            self.ptr = (self.ptr + 1) % buf_len
-        return output
+        # Do 2 s opóźnienia; prepare() dopasowuje bufor do fs strumienia
+        self.line = FeedbackDelay(fs * 2)
+        # Analog Degradation Filter
+        self.lp = OnePole(0.3)
+        self.mix = GainRamp()
+        # Skompilowana pętla (kernels.py), None = kawałki wektorowe
+        self.kernel = kernels.feedback_delay
+
+    def _loop(self, current_in, delayed, filtered_delayed):
+        self.lp.process(delayed, filtered_delayed)
+        to_buffer = np.multiply(filtered_delayed, self.feedback, out=self.ws.get('to_buffer', len(delayed)))
+        to_buffer += current_in
+        return np.tanh(to_buffer, out=to_buffer)
+
+    def prepare(self, fs):
+        super().prepare(fs)
+        if len(self.line.buffer) != fs * 2: self.line = FeedbackDelay(fs * 2)
+
+    def derive(self, p):
+        delay_samples = int(0.02 * self.fs + p['time'] * 0.6 * self.fs)
+        return min(delay_samples, len(self.line.buffer)), p['repeat'] * 0.9, p['intensity']
+
+    def tail(self, floor):
+        # Filtr w pętli i tanh tylko ściszają, więc samo sprzężenie to górne oszacowanie
+        delay_samples, feedback, _ = self.coefs()
+        return decay_samples(delay_samples, feedback, floor)
+
+    def energy(self):
+        return max(peak_energy(self.line.buffer), self.lp.value ** 2)
+
+    def reset(self):
+        self.line.reset()
+        self.lp.reset()
+
+    def apply(self, signal, out):
+        delay_samples, self.feedback, mix = self.coefs()
+
+        if self.kernel is not None:
+            line, lp = self.line, self.lp
+            line.ptr, lp.value = self.kernel(signal, out, line.buffer, line.ptr, delay_samples,
+                                             lp.value, lp.coef, self.feedback)
+        else:
+            # Kawałki nie dłuższe niż opóźnienie -> liczone wektorowo
+            self.line.process(signal, delay_samples, self._loop, out)
+        self.mix.apply(out, mix)
+        out += signal
+        return out
 
 # --- 11. REVERB (RV-6) ---
+# Schroeder: 4 równoległe filtry grzebieniowe z tłumieniem + 2 allpassy
 class BossRV6(Effect):
+    COMB_MS = [29.7, 37.1, 41.1, 43.7]
+    ALLPASS_MS = [5.0, 1.7]
+
     def __init__(self, fs):
         super().__init__(fs)
         self.params = {'time': 0.4, 'level': 0.4} 
-        self.delays = [int(fs*0.029), int(fs*0.037), int(fs*0.043)]
-        self.buffers = [np.zeros(d+10) for d in self.delays]
-        self.ptrs = [0, 0, 0]
-
-    def apply(self, signal):
-        decay = 0.5 + self.params['time'] * 0.45
-        level = self.params['level']
-        output = np.zeros_like(signal)
-        
-        for i in range(len(signal)):
-            inp = signal[i, 0]
-            wet_sum = 0.0
-            for k in range(3):
-                buf = self.buffers[k]
-                ptr = self.ptrs[k]
-                read_val = buf[ptr]
-                wet_sum += read_val
-                buf[ptr] = inp + read_val * decay
-                self.ptrs[k] = (ptr + 1) % len(buf)
-            output[i, 0] = inp + wet_sum * level * 0.3
-        return output
\ No newline at end of file
+        self.level = GainRamp()
+        self._build()
+
+    def prepare(self, fs):
+        super().prepare(fs)
+        if fs != self.built_fs: self._build()
+
+    def _build(self):
+        self.built_fs = self.fs
+        self.combs = [CombFilter(int(self.fs * ms / 1000), damp=0.3) for ms in self.COMB_MS]
+        self.allpasses = [AllpassFilter(int(self.fs * ms / 1000)) for ms in self.ALLPASS_MS]
+
+    def derive(self, p):
+        return 0.5 + p['time'] * 0.45, p['level'] * 0.3
+
+    def tail(self, floor):
+        # Najdłuższy grzebień ze sprzężeniem decay, potem allpassy po kolei
+        decay = self.coefs()[0]
+        return (max(decay_samples(comb.delay, decay, floor) for comb in self.combs)
+                + sum(decay_samples(ap.delay, ap.gain, floor) for ap in self.allpasses))
+
+    def energy(self):
+        return max(peak_energy(*(f.line.buffer for f in self.combs + self.allpasses)),
+                   max(comb.lp.value ** 2 for comb in self.combs))
+
+    def reset(self):
+        for f in self.combs + self.allpasses: f.line.reset()
+        for comb in self.combs: comb.lp.reset()
+
+    def apply(self, signal, out):
+        decay, level = self.coefs()
+        n = len(signal)
+
+        wet_sum = self.ws.get('wet', n)
+        wet_sum.fill(0.0)
+        comb_out = self.ws.get('comb', n)
+        for comb in self.combs:
+            comb.feedback = decay
+            wet_sum += comb.process(signal, comb_out)
+        for ap in self.allpasses:
+            ap.process(wet_sum, comb_out)
+            wet_sum, comb_out = comb_out, wet_sum
+
+        self.level.apply(wet_sum, level)
+        return np.add(wet_sum, signal, out=out)
+
+# --- 12. LOOPER (RC-1) ---
+# Pętla leży w prealokowanym buforze z anonimowego mmap, a nie na stercie:
+# minutowa pętla nie rozdyma procesu i wraca do systemu w całości. Strony
+# są dotykane raz w allocate() (wątek serwera, przy pierwszej komendzie),
+# więc w callbacku nie ma ani alokacji, ani pierwszych page faultów.
+# Komendy (wątek serwera) czekają w kolejce i wykonuje je callback na
+# początku bloku - długość pętli jest co do próbki. 'press' to jeden
+# footswitch jak w RC-1: nagrywanie -> odtwarzanie -> dogrywanie -> ...
+# Nowa pętla też idzie kolejką ('adopt'): stan żywej pętli (loop, mode,
+# length, pos) zmienia wyłącznie callback, razem, na granicy bloku.
+class BossRC1(Effect):
+    ACTIONS = ('press', 'record', 'play', 'overdub', 'stop', 'clear')
+    PRESS = {'empty': 'record', 'record': 'play', 'play': 'overdub', 'overdub': 'play', 'stop': 'play'}
+
+    def __init__(self, fs, max_seconds=60.0):
+        super().__init__(fs)
+        self.params = {'level': 0.5}
+        self.max_seconds = max_seconds
+        self.loop = None
+        self.built_fs = None
+        self.queued_fs = None
+        self.mode = 'empty'
+        self.length = 0
+        self.pos = 0
+        self.commands = deque(maxlen=16)
+        self.level = GainRamp()
+
+    def derive(self, p):
+        return p['level'] * 2.0,
+
+    def allocate(self):
+        # Wątek serwera: buduje pętlę obok, nie ruszając tej, na której gra callback
+        n = int(self.max_seconds * self.fs)
+        loop = np.frombuffer(mmap.mmap(-1, n * 4), dtype=np.float32)
+        loop[:] = 0.0
+        self.queued_fs = self.fs
+        self.commands.append(('adopt', loop, self.fs))
+
+    def command(self, action):
+        # Wątek serwera; zmiana fs (nowy strumień) = nowa, pusta pętla
+        if action not in self.ACTIONS: raise ValueError(f"Nieznana komenda loopera: {action}")
+        # (pusta kolejka bez pętli = 'adopt' wypadł z pełnej kolejki)
+        if self.queued_fs != self.fs or (self.loop is None and not self.commands): self.allocate()
+        self.commands.append(action)
+        self.active = True
+
+    def status(self):
+        fs = self.built_fs or self.fs
+        return {'mode': self.mode, 'length': self.length / fs, 'position': self.pos / fs,
+                'max_seconds': self.max_seconds}
+
+    def _close(self, mode):
+        # Koniec nagrywania: pętla ma tyle próbek, ile nagraliśmy
+        self.length, self.pos = self.pos, 0
+        self.mode = mode if self.length else 'empty'
+
+    def _run_command(self, action):
+        if isinstance(action, tuple):
+            _, loop, fs = action
+            self.loop, self.built_fs = loop, fs
+            self.mode, self.length, self.pos = 'empty', 0, 0
+            return
+        # Pełna kolejka mogła zgubić 'adopt' - bez pętli komendy nic nie robią
+        if self.loop is None: return
+        if action == 'press': action = self.PRESS[self.mode]
+        if action == 'clear':
+            self.mode, self.length, self.pos = 'empty', 0, 0
+        elif action == 'record':
+            self.mode, self.length, self.pos = 'record', 0, 0
+        elif self.mode == 'record':
+            self._close(action)
+        elif self.length:
+            self.mode = action
+            if action == 'stop': self.pos = 0
+
+    def process(self, signal, out=None):
+        # Pusta albo zatrzymana pętla nic nie robi z sygnałem
+        if not self.active or (self.mode in ('empty', 'stop') and not self.commands): return signal
+        return super().process(signal, out)
+
+    def apply(self, signal, out):
+        while self.commands: self._run_command(self.commands.popleft())
+        out[:] = signal
+        n = len(signal)
+        loop = self.loop
+        if self.mode == 'record':
+            m = min(n, len(loop) - self.pos)
+            loop[self.pos:self.pos + m] = signal[:m]
+            self.pos += m
+            if self.pos == len(loop): self._close('play')
+            return out
+        if self.mode not in ('play', 'overdub'): return out
+
+        # Odtwarzanie kawałkami do końca pętli (pętla może być krótsza niż blok)
+        play = self.ws.get('play', n)
+        i = 0
+        while i < n:
+            m = min(n - i, self.length - self.pos)
+            seg = loop[self.pos:self.pos + m]
+            play[i:i + m] = seg
+            if self.mode == 'overdub': seg += signal[i:i + m]
+            i += m
+            self.pos = (self.pos + m) % self.length
+        out += self.level.apply(play, self.coefs()[0])
+        return out
@@ -0,0 +1,83 @@
+import os
+import numpy as np
+
+# --- KERNELE PRÓBKA-PO-PRÓBCE (opcjonalnie kompilowane) ---
+# Obwiednia CS-3, pętla sprzężenia DM-2W, linia z modulacją BF-3/CE-2W
+# i kaskada biquadów stosu barwy to rekurencje po próbkach - NumPy liczy je
+# okrężnie (kawałkami, iteracyjnie) albo przez scipy z alokacją wyniku.
+# Tu są te same pętle wprost, na tym samym stanie co efekty (bufor, wskaźniki, wartość filtra).
+# Jeśli jest Numba (i nie ustawiono VTL_NO_JIT=1), kompilujemy je przy imporcie:
+# sygnatury są podane jawnie, więc nic nie kompiluje się przy pierwszym bloku
+# w callbacku, a cache=True zapisuje kod maszynowy na dysku - kolejne
+# uruchomienia tylko go wczytują. Bez Numby BACKEND = None, skompilowane
+# kernele są None i efekty liczą po staremu (NumPy). Pętle *_loop w czystym
+# Pythonie służą jako referencja w testach.
+
+def envelope_loop(level, out, e, attack, release):
+    # e[n] = e[n-1] + c * (x[n] - e[n-1]), c = attack gdy sygnał rośnie
+    for i in range(len(level)):
+        x = level[i]
+        if x > e: e += attack * (x - e)
+        else: e += release * (x - e)
+        out[i] = e
+    return e
+
+def feedback_delay_loop(x, out, buffer, ptr, delay, lp, lp_coef, feedback):
+    # DM-2W: out = przefiltrowane opóźnienie, do bufora wraca tanh(x + out * fb)
+    size = len(buffer)
+    for i in range(len(x)):
+        delayed = buffer[(ptr - delay) % size]
+        lp += lp_coef * (delayed - lp)
+        out[i] = lp
+        buffer[ptr] = np.tanh(x[i] + lp * feedback)
+        ptr = (ptr + 1) % size
+    return ptr, lp
+
+def modulated_delay_loop(x, delays, out, buffer, ptr, size, feedback):
+    # BF-3/CE-2W: odczyt z interpolacją liniową (bufor zdublowany jak w
+    # ModulatedDelayLine), do bufora wraca x + out * fb; opóźnienia >= 1
+    for i in range(len(x)):
+        pos = ptr + size - delays[i]
+        i0 = int(np.floor(pos))
+        frac = pos - i0
+        s0 = buffer[i0]
+        y = s0 + frac * (buffer[i0 + 1] - s0)
+        out[i] = y
+        v = x[i] + y * feedback
+        buffer[ptr] = v
+        buffer[ptr + size] = v
+        if ptr == 0: buffer[2 * size] = v
+        ptr = (ptr + 1) % size
+    return ptr
+
+def sos_cascade_loop(x, out, sos, zi):
+    # Biquady w transponowanej postaci II (jak scipy.signal.sosfilt), stan zi
+    for i in range(len(x)):
+        v = x[i]
+        for s in range(sos.shape[0]):
+            y = sos[s, 0] * v + zi[s, 0]
+            zi[s, 0] = sos[s, 1] * v - sos[s, 4] * y + zi[s, 1]
+            zi[s, 1] = sos[s, 2] * v - sos[s, 5] * y
+            v = y
+        out[i] = v
+
+BACKEND = None
+envelope = feedback_delay = modulated_delay = sos_cascade = None
+
+if os.environ.get('VTL_NO_JIT') != '1':
+    try:
+        from numba import njit, types
+    except ImportError:
+        njit = None
+    if njit is not None:
+        f32 = types.float32[:]
+        envelope = njit(types.float64(f32, f32, types.float64, types.float64, types.float64),
+                        cache=True, nogil=True)(envelope_loop)
+        feedback_delay = njit(types.Tuple((types.int64, types.float64))(
+                                  f32, f32, f32, types.int64, types.int64, types.float64, types.float64, types.float64),
+                              cache=True, nogil=True)(feedback_delay_loop)
+        modulated_delay = njit(types.int64(f32, types.float64[:], f32, f32, types.int64, types.int64, types.float64),
+                               cache=True, nogil=True)(modulated_delay_loop)
+        sos_cascade = njit(types.void(f32, f32, types.float64[:, :], types.float64[:, :]),
+                           cache=True, nogil=True)(sos_cascade_loop)
+        BACKEND = 'numba'
@@ -0,0 +1,139 @@
+import threading
+import time
+
+import numpy as np
+from audio_manager import AudioManager
+
+# --- REGULATOR ROZMIARU BLOKU (opóźnienie vs obciążenie callbacku) ---
+# Najmniejszy blok, przy którym p99 obciążenia callbacku (czas / termin
+# bloku, jak w CallbackMetrics) mieści się pod progiem. Próba: kopia
+# bieżącego łańcucha (manager-cień, poza callbackiem) liczy probe_blocks
+# bloków dla kolejnych rozmiarów od najmniejszego i staje na pierwszym,
+# który się mieści. Próba jest powtarzana, gdy zmieni się skład łańcucha
+# (włączone kostki, nadpróbkowanie, kolumna, fs) - wtedy blok może też
+# zmaleć. Na żywo regulator patrzy na p99 z metryk callbacku: jeśli jest
+# gorzej niż w próbie (system, inne procesy), idzie o rozmiar w górę.
+# Zmiana rozmiaru = ponowne otwarcie strumienia (AudioManager.open_stream).
+# Z potokiem (AudioManager.set_pipeline) próba liczy łańcuch podzielony
+# tak samo jak na żywo, a regulator co krok dzieli plan od nowa wg
+# zmierzonych kosztów etapów (AudioManager.rebalance).
+
+BLOCK_SIZES = [64, 128, 256, 512, 1024, 2048]
+
+class LatencyController:
+    def __init__(self, mgr, threshold=0.7, sizes=BLOCK_SIZES, probe_blocks=64, period=1.0, latency='low'):
+        self.mgr = mgr
+        self.threshold = threshold
+        self.sizes = sorted(sizes)
+        self.probe_blocks = probe_blocks
+        self.period = period
+        self.latency = latency
+        self.blocksize = None
+        self.signature = None
+        self.probes = {}
+        self.renegotiations = 0
+        self.seen = 0
+        self.thread = None
+        self.running = False
+
+    def chain_signature(self):
+        mgr = self.mgr
+        return (mgr.fs, mgr.cabinet.ir, mgr.amp_oversampler.factor, mgr.pipeline and mgr.pipeline.stages,
+                tuple((fx.active, fx.oversampler.factor) for fx in mgr.chain.values()))
+
+    # --- PRÓBA (poza callbackiem) ---
+    def probe(self):
+        mgr = self.mgr
+        shadow = AudioManager(devices=False)
+        shadow.set_samplerate(mgr.fs)
+        shadow.load_state(mgr.get_state())
+        if mgr.pipeline: shadow.set_pipeline(mgr.pipeline.stages)
+        signal = (np.random.default_rng(0).standard_normal((self.sizes[-1], 2)) * 0.1).astype(np.float32)
+        self.probes = {}
+        try:
+            for size in self.sizes:
+                # Rozgrzewka (plan, bufory robocze pod ten rozmiar), potem pomiar
+                for _ in range(8): shadow.process_block(signal[:size])
+                if shadow.rebalance():
+                    for _ in range(shadow.pipeline.stages): shadow.process_block(signal[:size])
+                shadow.metrics.reset()
+                for _ in range(self.probe_blocks): shadow.process_block(signal[:size])
+                self.probes[size] = float(np.percentile(shadow.metrics.loads[:self.probe_blocks], 99))
+                if self.probes[size] <= self.threshold: break
+            # Podział z próby od razu na żywo (ten sam łańcuch, ten sam rozmiar)
+            if mgr.pipeline: mgr.pipeline.cuts = shadow.pipeline.cuts
+            return size
+        finally:
+            shadow.set_pipeline(1)
+
+    def live_load(self):
+        # p99 obciążenia z bloków od poprzedniego sprawdzenia (None = brak nowych)
+        m = self.mgr.metrics
+        new = min(m.count - self.seen, m.capacity)
+        self.seen = m.count
+        if new <= 0: return None
+        return float(np.percentile(m.loads[(m.pos - np.arange(1, new + 1)) % m.capacity], 99))
+
+    # --- REGULACJA ---
+    def update(self):
+        # Jeden krok regulatora; True = strumień otwarty z nowym rozmiarem
+        signature = self.chain_signature()
+        target = self.blocksize
+        self.mgr.rebalance()
+        if signature != self.signature:
+            self.signature = signature
+            target = self.probe()
+        else:
+            load = self.live_load()
+            if load is not None and load > self.threshold and self.blocksize < self.sizes[-1]:
+                target = self.sizes[self.sizes.index(self.blocksize) + 1]
+        if target == self.blocksize: return False
+        self.renegotiate(target)
+        return True
+
+    def renegotiate(self, blocksize):
+        self.mgr.open_stream(blocksize, self.latency)
+        self.blocksize = blocksize
+        self.renegotiations += 1
+        self.seen = self.mgr.metrics.count
+
+    def set_threshold(self, threshold):
+        # Nowy próg = nowa próba przy najbliższym kroku
+        self.threshold = threshold
+        self.signature = None
+
+    def report(self):
+        return {
+            'threshold': self.threshold,
+            'renegotiations': self.renegotiations,
+            'probe_p99_load': {str(size): load for size, load in self.probes.items()},
+            **self.mgr.latency_report(),
+        }
+
+    # --- WĄTEK REGULATORA ---
+    def start(self, device_id, callback):
+        # Jak AudioManager.start_streaming, ale rozmiar bloku z próby
+        mgr = self.mgr
+        self.stop()
+        mgr.stop_streaming()
+        mgr.select_device(device_id)
+        self.blocksize = self.signature = None
+        self.update()
+        mgr.monitor.start(callback)
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='latency-controller', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=2 * self.period)
+            self.thread = None
+
+    def _run(self):
+        while self.running:
+            time.sleep(self.period)
+            try:
+                self.update()
+            except Exception as e:
+                print(f"!!! BŁĄD REGULATORA OPÓŹNIENIA: {e}")
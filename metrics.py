@@ -0,0 +1,82 @@
+import numpy as np
+
+# --- METRYKI CALLBACKU AUDIO ---
+# Zapisywanie jest tanie i nie alokuje: czasy etapów lądują w prealokowanym
+# buforze kołowym (etap x ostatnie N bloków), liczniki to tablice numpy.
+# Percentyle liczymy dopiero w snapshot(), czyli w wątku Flaska.
+
+XRUN_FLAGS = ['input_underflow', 'input_overflow', 'output_underflow', 'output_overflow', 'priming_output']
+
+class CallbackMetrics:
+    def __init__(self, stages, capacity=2048):
+        self.stages = list(stages)
+        self.capacity = capacity
+        self.times = np.zeros((len(self.stages), capacity))
+        self.totals = np.zeros(capacity)
+        self.loads = np.zeros(capacity)
+        self.errors = np.zeros(len(self.stages), dtype=np.int64)
+        self.last_errors = [None] * len(self.stages)
+        self.xruns = np.zeros(len(XRUN_FLAGS), dtype=np.int64)
+        self.overruns = 0
+        self.pos = 0
+        self.count = 0
+
+    def reset(self):
+        self.times[:] = 0.0
+        self.totals[:] = 0.0
+        self.loads[:] = 0.0
+        self.errors[:] = 0
+        self.last_errors = [None] * len(self.stages)
+        self.xruns[:] = 0
+        self.overruns = 0
+        self.pos = 0
+        self.count = 0
+
+    # --- WĄTEK AUDIO ---
+    def begin_block(self):
+        # Etapy pominięte w tym bloku (wyłączone, sklejone) mają czas 0
+        self.times[:, self.pos] = 0.0
+
+    def record_stage(self, idx, seconds):
+        # Suma: kilka kroków planu pod jednym indeksem (wzmacniacz + stos barwy)
+        self.times[idx, self.pos] += seconds
+
+    def record_error(self, idx, exc):
+        self.errors[idx] += 1
+        self.last_errors[idx] = exc
+
+    def record_status(self, status):
+        for i, flag in enumerate(XRUN_FLAGS):
+            if getattr(status, flag, False): self.xruns[i] += 1
+
+    def end_block(self, total, deadline):
+        self.totals[self.pos] = total
+        load = total / deadline if deadline > 0 else 0.0
+        self.loads[self.pos] = load
+        if load > 1.0: self.overruns += 1
+        self.pos = (self.pos + 1) % self.capacity
+        self.count += 1
+
+    # --- WĄTEK SERWERA ---
+    @staticmethod
+    def _summary(values, scale=1e6):
+        if len(values) == 0:
+            return {'p50': 0.0, 'p99': 0.0, 'max': 0.0}
+        p50, p99 = np.percentile(values, [50, 99])
+        return {'p50': float(p50) * scale, 'p99': float(p99) * scale, 'max': float(values.max()) * scale}
+
+    def snapshot(self):
+        n = min(self.count, self.capacity)
+        return {
+            'blocks': self.count,
+            'window': n,
+            'overruns': self.overruns,
+            'xruns': {flag: int(v) for flag, v in zip(XRUN_FLAGS, self.xruns)},
+            'errors': {
+                name: {'count': int(self.errors[i]), 'last': repr(self.last_errors[i])}
+                for i, name in enumerate(self.stages) if self.errors[i]
+            },
+            'stages_us': {name: self._summary(self.times[i, :n]) for i, name in enumerate(self.stages)},
+            'total_us': self._summary(self.totals[:n]),
+            'load': self._summary(self.loads[:n], scale=1.0),
+        }
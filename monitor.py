@@ -0,0 +1,74 @@
+import threading
+import time
+
+import numpy as np
+
+# --- WĄTEK MONITORINGU (UI) ---
+# Callback audio wrzuca tylko mierniki i próbki dla tunera do buforów SPSC.
+# Analiza wysokości dźwięku i emisja Socket.IO dzieją się tutaj, we własnym
+# tempie, więc obciążenie Flaska / sieci nie wpływa na czas callbacku.
+# Co tick wszystkie bloki od poprzedniego ticka są zlewane w jeden pomiar na
+# punkt: peak = max, RMS z sumy kwadratów i liczby próbek. NaN = punkt nie był
+# mierzony (etap wyłączony albo brak subskrypcji mierników etapów).
+class AudioMonitor:
+    def __init__(self, mgr, rate=30.0):
+        self.mgr = mgr
+        self.rate = rate
+        self.callback = None
+        self.thread = None
+        self.running = False
+        self.rows = np.zeros_like(mgr.meter_ring.buffer)
+
+    def start(self, callback):
+        self.stop()
+        self.callback = callback
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='audio-monitor', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=1.0)
+            self.thread = None
+
+    def merge(self, rows):
+        # (peak, rms) na punkt z wierszy peak..., suma kwadratów..., n
+        p = len(self.mgr.meter_points)
+        peak = np.full(p, np.nan)
+        rms = np.full(p, np.nan)
+        if len(rows):
+            peak = np.fmax.reduce(rows[:, :p], axis=0).astype(np.float64)
+            sumsq = rows[:, p:2 * p].astype(np.float64)
+            measured = ~np.isnan(sumsq)
+            count = (measured * rows[:, -1:]).sum(axis=0)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                rms = np.sqrt(np.where(measured, sumsq, 0.0).sum(axis=0) / count)
+        return peak, rms
+
+    def tick(self):
+        # Wszystkie bloki od ostatniego ticka (żeby wskaźnik nie gubił pików)
+        n = self.mgr.meter_ring.pop_into(self.rows)
+        peak, rms = self.merge(self.rows[:n])
+
+        tuner = self.mgr.chain['tuner']
+        tuner.poll()
+        # Jeśli tuner wyłączony, wyślij null, żeby zgasić diody w JS
+        tuner_info = tuner.get_tuner_data() if tuner.active else None
+
+        if self.callback: self.callback(peak, rms, tuner_info)
+
+    def _run(self):
+        period = 1.0 / self.rate
+        next_tick = time.monotonic()
+        while self.running:
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"!!! BŁĄD MONITORA: {e}")
+            next_tick += period
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_tick = time.monotonic()
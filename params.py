@@ -0,0 +1,26 @@
+import itertools
+
+# --- PARAMETRY Z WERSJĄ ---
+# Gałki zapisuje wątek serwera (Socket.IO), czyta wątek audio. Każdy zapis
+# podbija version - dopiero PO zmianie wartości, więc kopia wzięta przy danej
+# wersji nigdy nie jest od niej starsza (najwyżej nowsza, a wtedy następny
+# blok i tak zobaczy nową wersję). Wersje pochodzą z jednego licznika, więc
+# nie powtarzają się też po podmianie całego obiektu (fx.params = {...}).
+_versions = itertools.count(1)
+
+class Params(dict):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.version = next(_versions)
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.version = next(_versions)
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self.version = next(_versions)
+
+    def snapshot(self):
+        # Spójna kopia: dict() kopiuje w C, pod GIL, bez przeplotu z zapisami
+        return dict(self)
@@ -0,0 +1,184 @@
+import _thread
+import threading
+from bisect import bisect_right
+from time import perf_counter
+
+import numpy as np
+
+# --- POTOK WIELORDZENIOWY (opcjonalny) ---
+# Plan łańcucha dzielimy na kolejne segmenty (granice = indeksy etapów).
+# W każdym callbacku wszystkie segmenty liczą się naraz, każdy na innym
+# bloku: segment 0 w wątku callbacku na bloku, który właśnie przyszedł,
+# segment j w swoim wątku na bloku sprzed j callbacków. Na wyjście idzie
+# blok, który przeszedł ostatni segment, więc łańcuch z S segmentami
+# opóźnia dźwięk o stałe S - 1 bloków (AudioManager.latency_report).
+# Czas callbacku to najwolniejszy segment zamiast sumy, o ile wątki naprawdę
+# liczą równolegle: pętle numba (kernels.py, nogil) i ufunc NumPy zwalniają
+# GIL, interpreter Pythona między nimi już nie.
+#
+# Bufory: S bloków w kółko (blok wchodzi do slotu round % S i przesuwa się
+# o segment na callback) plus własny blok roboczy (ping-pong) na segment -
+# wszystko prealokowane; zmiana rozmiaru bloku albo liczby segmentów zeruje
+# potok (S - 1 bloków ciszy). Synchronizacja: surowe locki _thread (start
+# i koniec rundy na wątek) - bez alokacji w callbacku, w przeciwieństwie
+# do Condition / Event.
+#
+# Podział wybiera split() z kosztów etapów zmierzonych w CallbackMetrics:
+# najmniejsze możliwe "najwolniejsze ogniwo" plus SYNC_COST za każdy
+# dodatkowy segment, więc potok nie rośnie, gdy jeden ciężki etap (np.
+# pogłos) i tak wyznacza czas.
+
+SYNC_COST = 60e-6 # przekazanie rundy do wątku i z powrotem [s]
+GAIN = 0.9 # nowy podział tylko, jeśli przewidywany czas spadnie o >= 10%
+
+def bottleneck(costs, starts):
+    # Najdroższy segment dla podanych początków segmentów (indeksy w costs)
+    bounds = [0, *starts, len(costs)]
+    return max(sum(costs[a:b]) for a, b in zip(bounds, bounds[1:]))
+
+def split(costs, stages, sync=SYNC_COST):
+    # Podział kolejnych kosztów na <= stages ciągłych segmentów:
+    # min(najdroższy segment + sync * (segmenty - 1)); zwraca początki segmentów 1..
+    n = len(costs)
+    prefix = np.concatenate([[0.0], np.cumsum(costs)])
+    best, best_starts = float('inf'), []
+    # dp[j] = najmniejszy najdroższy segment dla pierwszych j kosztów w k segmentach
+    dp = prefix.copy()
+    back = [[0] * (n + 1)]
+    for k in range(1, min(stages, n) + 1):
+        if k > 1:
+            prev, dp = dp, np.full(n + 1, np.inf)
+            back.append([0] * (n + 1))
+            for j in range(k, n + 1):
+                for m in range(k - 1, j):
+                    v = max(prev[m], prefix[j] - prefix[m])
+                    if v < dp[j]: dp[j], back[k - 1][j] = v, m
+        score = dp[n] + sync * (k - 1)
+        if score < best:
+            best = score
+            starts, j = [], n
+            for level in range(k - 1, 0, -1):
+                j = back[level][j]
+                starts.append(j)
+            best_starts = starts[::-1]
+    return best_starts
+
+class ChainPipeline:
+    def __init__(self, stages):
+        self.stages = stages
+        self.cuts = () # indeksy etapów, od których zaczynają się segmenty 1..
+        self.active = 1
+        self.segments = [[] for _ in range(stages)]
+        self.layout = (None, None) # (plan, cuts), pod które ułożone są segmenty
+        self.bufs, self.spares = [], []
+        self.n = 0
+        self.round = 0
+        self.mgr = None
+        self.closed = False
+        # Runda w toku (close czeka, aż się skończy)
+        self.busy = _thread.allocate_lock()
+        self.go = [_thread.allocate_lock() for _ in range(stages)]
+        self.done = [_thread.allocate_lock() for _ in range(stages)]
+        for lock in self.go + self.done: lock.acquire()
+        self.threads = [threading.Thread(target=self._work, args=(j,), name=f'chain-stage-{j}', daemon=True)
+                        for j in range(1, stages)]
+        for t in self.threads: t.start()
+
+    @property
+    def delay(self):
+        # Opóźnienie potoku w blokach
+        return self.active - 1
+
+    # --- PODZIAŁ (poza callbackiem) ---
+    def rebalance(self, groups, costs):
+        # groups: indeksy etapów planu (rosnąco), costs: ich czas na blok [s]
+        costs = list(costs)
+        starts = split(costs, self.stages)
+        cuts = tuple(groups[k] for k in starts)
+        if cuts == self.cuts: return False
+        now = [k for k, i in enumerate(groups) if i in self.cuts]
+        old = bottleneck(costs, now) + SYNC_COST * len(now)
+        new = bottleneck(costs, starts) + SYNC_COST * len(starts)
+        if new > GAIN * old: return False
+        self.cuts = cuts
+        return True
+
+    # --- WĄTEK AUDIO ---
+    def run(self, mgr, signal, plan):
+        # Zwraca blok po całym planie (sprzed delay callbacków) albo None,
+        # gdy potok ma jeden segment lub jest zamknięty - wtedy liczy callback
+        self.busy.acquire()
+        try:
+            cuts = self.cuts
+            if self.closed or not cuts: return None
+            n = len(signal)
+            if plan is not self.layout[0] or cuts is not self.layout[1]: self._layout(plan, cuts, n)
+            elif n != self.n: self._reset(n)
+            self.mgr = mgr
+            self.bufs[self.round % self.active][:] = signal
+            for j in range(1, self.active): self.go[j].release()
+            self._segment(0)
+            for j in range(1, self.active): self.done[j].acquire()
+            # Następna runda pisze wejście w ten slot, więc wynik kopiujemy
+            out = mgr.ws.get('pipeline_out', n)
+            out[:] = self.bufs[(self.round + 1) % self.active]
+            self.round += 1
+            return out
+        finally:
+            self.busy.release()
+
+    def _layout(self, plan, cuts, n):
+        # Kroki planu do segmentów wg indeksu etapu (nowy plan albo podział)
+        for seg in self.segments: seg.clear()
+        for i, step in plan: self.segments[bisect_right(cuts, i)].append((i, step))
+        self.layout = (plan, cuts)
+        if len(cuts) + 1 != self.active or n != self.n:
+            self.active = len(cuts) + 1
+            self._reset(n)
+
+    def _reset(self, n):
+        if n > (len(self.bufs[0]) if self.bufs else 0):
+            self.bufs = [np.zeros(n, dtype=np.float32) for _ in range(self.stages)]
+            self.spares = [np.zeros(n, dtype=np.float32) for _ in range(self.stages)]
+        else:
+            self.bufs = [b[:n] for b in self.bufs]
+            self.spares = [b[:n] for b in self.spares]
+            for b in self.bufs: b[:] = 0.0
+        self.n = n
+        self.round = 0
+
+    def _segment(self, j):
+        # Po wyzerowaniu do segmentu j nie doszedł jeszcze żaden blok
+        # (LFO i linie opóźniające nie liczą ciszy, której nie było)
+        if self.round < j: return
+        mgr = self.mgr
+        metrics = mgr.metrics
+        k = (self.round - j) % self.active
+        signal, spare = self.bufs[k], self.spares[j]
+        for i, step in self.segments[j]:
+            t = perf_counter()
+            try:
+                result = step(signal, spare)
+                if result is spare: signal, spare = spare, signal
+            except Exception as e:
+                metrics.record_error(i, e)
+            if mgr.meter_stages: mgr._meter(i, signal)
+            metrics.record_stage(i, perf_counter() - t)
+        self.bufs[k], self.spares[j] = signal, spare
+
+    def _work(self, j):
+        while True:
+            self.go[j].acquire()
+            if self.closed: return
+            try:
+                self._segment(j)
+            finally:
+                self.done[j].release()
+
+    # --- ZAMKNIĘCIE (poza callbackiem) ---
+    def close(self):
+        with self.busy:
+            if self.closed: return
+            self.closed = True
+            for j in range(1, self.stages): self.go[j].release()
+        for t in self.threads: t.join()
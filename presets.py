@@ -0,0 +1,43 @@
+import json
+import os
+import re
+
+# --- PRESETY ---
+# Jeden plik JSON na preset, w formacie AudioManager.load_state / get_state
+# (+ opcjonalna etykieta 'label' dla UI). Efekty, których preset nie wymienia,
+# są wyłączone z domyślnymi gałkami - preset opisuje cały łańcuch.
+
+NAME_RE = re.compile(r'[\w-]+')
+
+class PresetStore:
+    def __init__(self, root='presets'):
+        self.root = root
+
+    def _path(self, name):
+        if not NAME_RE.fullmatch(name):
+            raise ValueError(f"Niepoprawna nazwa presetu: {name!r}")
+        return os.path.join(self.root, name + '.json')
+
+    def list(self):
+        if not os.path.isdir(self.root): return []
+        presets = []
+        for file in sorted(os.listdir(self.root)):
+            name, ext = os.path.splitext(file)
+            if ext != '.json' or not NAME_RE.fullmatch(name): continue
+            presets.append({'name': name, 'label': self.load(name).get('label', name)})
+        return presets
+
+    def load(self, name):
+        with open(self._path(name), encoding='utf-8') as f:
+            return json.load(f)
+
+    def save(self, name, state, label=None):
+        # Zapis przez plik tymczasowy - przerwany zapis nie psuje presetu
+        path = self._path(name)
+        os.makedirs(self.root, exist_ok=True)
+        if label: state = {**state, 'label': label}
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=2, ensure_ascii=False)
+            f.write('\n')
+        os.replace(tmp, path)
@@ -0,0 +1,123 @@
+import os
+import threading
+import time
+import wave
+
+import numpy as np
+from render import float_to_pcm
+from ringbuffer import SPSCRing
+
+# --- NAGRYWANIE NA DYSK (DI + sygnał z łańcucha) ---
+# Callback audio tylko kopiuje blok do prealokowanego bufora SPSC, prosto
+# w jego pamięć (reserve/commit, bez tymczasowych tablic). Wątek zapisu co
+# period zbiera wszystko, co czeka, w duży kawałek i zapisuje go jednym
+# writeframes do pliku z buforem 1 MB - dysk nie widzi małych zapisów,
+# a callback nigdy nie czeka na dysk. Jeśli dysk nie nadąży i bufor się
+# zapełni, cały blok przepada i trafia do licznika dropped_blocks.
+# Plik: WAV stereo, lewy kanał = DI (wejście tak, jak widzi je łańcuch, przed
+# gałką gain - do reampingu: render.py -c 0), prawy = wyjście łańcucha.
+# Stop: stop() tylko zdejmuje armed. Callback zaznacza (writing) czas od
+# sprawdzenia armed do commit, więc wątek zapisu kończy dopiero, gdy armed
+# jest zdjęte, a żaden blok nie jest w połowie zapisu - wtedy ostatni raz
+# opróżnia bufor i sam zamyka plik. Nic nie wpada do bufora po zamknięciu.
+
+class DiskRecorder:
+    def __init__(self, seconds=4.0, max_fs=96000, chunk_seconds=0.5, sampwidth=3, period=0.05):
+        # Bufor i kawałek zapisu liczone pod największe fs - bez alokacji przy starcie
+        self.ring = SPSCRing(int(seconds * max_fs), channels=2)
+        self.chunk = np.zeros((int(chunk_seconds * max_fs), 2), dtype=np.float32)
+        self.sampwidth = sampwidth
+        self.period = period
+        self.armed = False
+        self.writing = False
+        self.thread = None
+        self.path = None
+        self.fs = 0
+        self.blocks = 0
+        self.frames = 0
+        self.peak_fill = 0
+
+    # --- WĄTEK AUDIO ---
+    def record(self, indata, wet):
+        # writing przed sprawdzeniem armed: wątek zapisu widzi albo blok w toku, albo brak bloku
+        self.writing = True
+        if not self.armed:
+            self.writing = False
+            return False
+        n = len(wet)
+        views = self.ring.reserve(n)
+        if views is None:
+            self.writing = False
+            return False
+        i = 0
+        for view in views:
+            m = len(view)
+            src = indata[i:i + m]
+            if indata.shape[1] >= 2:
+                np.add(src[:, 0], src[:, 1], out=view[:, 0])
+                view[:, 0] *= 0.5
+            else:
+                view[:, 0] = src[:, 0]
+            view[:, 1] = wet[i:i + m]
+            i += m
+        self.ring.commit(n)
+        self.blocks += 1
+        self.writing = False
+        return True
+
+    # --- WĄTEK SERWERA ---
+    def start(self, path, fs):
+        self.stop()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        f = open(path, 'wb', buffering=1 << 20)
+        dst = wave.open(f, 'wb')
+        dst.setnchannels(2)
+        dst.setsampwidth(self.sampwidth)
+        dst.setframerate(fs)
+        self.path, self.fs = path, fs
+        self.blocks = self.frames = self.peak_fill = 0
+        self.ring.clear()
+        self.ring.dropped = 0
+        self.thread = threading.Thread(target=self._run, args=(f, dst), name='disk-recorder', daemon=True)
+        self.armed = True
+        self.thread.start()
+
+    def stop(self):
+        # Flaga dla callbacku; wątek zapisu dopisuje resztę bufora i zamyka plik
+        self.armed = False
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        return self.status()
+
+    def status(self):
+        return {
+            'recording': self.armed,
+            'path': self.path,
+            'seconds': self.frames / self.fs if self.fs else 0.0,
+            'blocks': self.blocks,
+            'dropped_blocks': self.ring.dropped,
+            'buffer_peak': self.peak_fill / self.ring.capacity,
+        }
+
+    # --- WĄTEK ZAPISU ---
+    def _run(self, f, dst):
+        fill = 0
+        try:
+            while True:
+                # Koniec dopiero bez bloku w toku - commit po ostatnim pop zginąłby
+                stopping = not self.armed and not self.writing
+                self.peak_fill = max(self.peak_fill, self.ring.available())
+                fill += self.ring.pop_into(self.chunk[fill:])
+                if fill == len(self.chunk) or (stopping and fill):
+                    dst.writeframesraw(float_to_pcm(self.chunk[:fill].ravel(), self.sampwidth))
+                    self.frames += fill
+                    fill = 0
+                elif stopping:
+                    break
+                else:
+                    time.sleep(self.period)
+        finally:
+            # wave poprawia rozmiary w nagłówku przy close()
+            dst.close()
+            f.close()
@@ -0,0 +1,142 @@
+import argparse
+import json
+import os
+import time
+import wave
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from audio_manager import AudioManager
+
+# --- RENDER OFFLINE (reamping bez karty dźwiękowej) ---
+# Plik WAV przechodzi przez ten sam łańcuch co na żywo (AudioManager.process_block),
+# czytany i zapisywany kawałkami, więc nawet godzinne nagrania nie lądują
+# w całości w pamięci.
+
+BLOCKSIZE = 4096
+
+# --- KONWERSJA PCM <-> FLOAT ---
+def pcm_to_float(raw, sampwidth, channels):
+    if sampwidth == 1:
+        data = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif sampwidth == 2:
+        data = np.frombuffer(raw, dtype='<i2').astype(np.float32) / 32768.0
+    elif sampwidth == 3:
+        b = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        ints = b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16)
+        ints = np.where(ints >= 1 << 23, ints - (1 << 24), ints)
+        data = ints.astype(np.float32) / 8388608.0
+    elif sampwidth == 4:
+        data = np.frombuffer(raw, dtype='<i4').astype(np.float32) / 2147483648.0
+    else:
+        raise ValueError(f"Nieobsługiwana szerokość próbki: {sampwidth}")
+    return data.reshape(-1, channels)
+
+def float_to_pcm(signal, sampwidth):
+    x = np.clip(signal, -1.0, 1.0)
+    if sampwidth == 1:
+        return (x * 127.0 + 128.0).astype(np.uint8).tobytes()
+    if sampwidth == 2:
+        return (x * 32767.0).astype('<i2').tobytes()
+    if sampwidth == 3:
+        ints = (x * 8388607.0).astype(np.int32)
+        b = np.empty((len(ints), 3), dtype=np.uint8)
+        b[:, 0] = ints & 0xFF
+        b[:, 1] = (ints >> 8) & 0xFF
+        b[:, 2] = (ints >> 16) & 0xFF
+        return b.tobytes()
+    if sampwidth == 4:
+        return (x * 2147483647.0).astype('<i4').tobytes()
+    raise ValueError(f"Nieobsługiwana szerokość próbki: {sampwidth}")
+
+def load_preset(path):
+    if not path: return {}
+    with open(path) as f:
+        return json.load(f)
+
+# --- RENDER JEDNEGO PLIKU ---
+def render_file(in_path, out_path, state=None, blocksize=BLOCKSIZE, channel=None):
+    mgr = AudioManager()
+    started = time.perf_counter()
+
+    with wave.open(in_path, 'rb') as src, wave.open(out_path, 'wb') as dst:
+        channels = src.getnchannels()
+        sampwidth = src.getsampwidth()
+        fs = src.getframerate()
+
+        mgr.set_samplerate(fs)
+        if state: mgr.load_state(state)
+
+        dst.setnchannels(1)
+        dst.setsampwidth(sampwidth)
+        dst.setframerate(fs)
+
+        frames = 0
+        while True:
+            raw = src.readframes(blocksize)
+            if not raw: break
+            indata = pcm_to_float(raw, sampwidth, channels)
+            # Jeden kanał pliku (np. DI z nagrania recorder.py), inaczej suma jak na żywo
+            if channel is not None: indata = indata[:, channel:channel + 1]
+            out = mgr.process_block(indata)
+            dst.writeframes(float_to_pcm(out, sampwidth))
+            frames += len(indata)
+
+    elapsed = time.perf_counter() - started
+    seconds = frames / fs
+    return {
+        'input': in_path,
+        'output': out_path,
+        'seconds': seconds,
+        'elapsed': elapsed,
+        'realtime_factor': seconds / elapsed if elapsed > 0 else float('inf'),
+    }
+
+def _render_job(job):
+    in_path, out_path, preset_path, blocksize, channel = job
+    return render_file(in_path, out_path, load_preset(preset_path), blocksize, channel)
+
+# --- RENDER WIELU PLIKÓW / PRESETÓW RÓWNOLEGLE ---
+def render_many(inputs, out_dir, presets=None, blocksize=BLOCKSIZE, workers=None, channel=None):
+    os.makedirs(out_dir, exist_ok=True)
+    jobs = []
+    for in_path in inputs:
+        stem = os.path.splitext(os.path.basename(in_path))[0]
+        for preset_path in (presets or [None]):
+            suffix = os.path.splitext(os.path.basename(preset_path))[0] if preset_path else 'out'
+            out_path = os.path.join(out_dir, f"{stem}__{suffix}.wav")
+            jobs.append((in_path, out_path, preset_path, blocksize, channel))
+
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(_render_job, jobs))
+    elapsed = time.perf_counter() - started
+
+    total = sum(r['seconds'] for r in results)
+    summary = {
+        'files': len(results),
+        'seconds': total,
+        'elapsed': elapsed,
+        'realtime_factor': total / elapsed if elapsed > 0 else float('inf'),
+    }
+    return results, summary
+
+def main():
+    parser = argparse.ArgumentParser(description="VintageToneLab - render offline plików WAV")
+    parser.add_argument('inputs', nargs='+', help="pliki WAV (DI)")
+    parser.add_argument('-o', '--out-dir', default='renders')
+    parser.add_argument('-p', '--preset', action='append', help="preset JSON (można podać wiele)")
+    parser.add_argument('-b', '--blocksize', type=int, default=BLOCKSIZE)
+    parser.add_argument('-j', '--workers', type=int, default=None)
+    parser.add_argument('-c', '--channel', type=int, default=None, help="tylko ten kanał wejścia (0 = DI z nagrania)")
+    args = parser.parse_args()
+
+    results, summary = render_many(args.inputs, args.out_dir, args.preset, args.blocksize, args.workers, args.channel)
+    for r in results:
+        print(f"{r['input']} -> {r['output']} | {r['seconds']:.1f} s w {r['elapsed']:.2f} s "
+              f"({r['realtime_factor']:.1f}x realtime)")
+    print(f"RAZEM: {summary['files']} plików, {summary['seconds']:.1f} s audio w "
+          f"{summary['elapsed']:.2f} s ({summary['realtime_factor']:.1f}x realtime)")
+
+if __name__ == '__main__':
+    main()
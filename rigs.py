@@ -0,0 +1,656 @@
+import numpy as np
+from time import perf_counter
+from backends import default_backend
+from audio_manager import AudioManager, PEDALBOARD, DEFAULT_EQ
+from dsp import Workspace
+from metrics import CallbackMetrics
+from params import Params
+
+# --- SILNIK WIELU RIGÓW (batch) ---
+# Kilku graczy / wejść na jednej maszynie: zamiast osobnego AudioManager na
+# każdego, jeden silnik liczy N niezależnych łańcuchów naraz. Blok to tablica
+# (rig, próbka), a cały stan efektów (bufory, wskaźniki, obwiednie, fazy LFO)
+# ma oś rigu, więc każda operacja NumPy obsługuje wszystkie rigi w jednym
+# przejściu i narzut Pythona rozkłada się na N.
+# Każdy rig ma własne gałki (Params z wersją) i własne włączniki. Efekt liczymy,
+# jeśli jest włączony w którymkolwiek rigu; rigi z wyłączonym efektem dostają
+# wejście bez zmian (stan efektu i tak biegnie - jak pedał z buforowanym
+# bypassem). Wskaźniki zapisu są wspólne, bo wszystkie rigi przesuwają się
+# o ten sam blok. Waveshapery liczymy dokładnie (bez tablic przejścia
+# i nadpróbkowania), gałki zmieniają się skokowo na granicy bloku, a wzmacniacz
+# to sam tanh + master (bez stosu barwy i kolumny z AudioManager).
+
+def _grid(ws, name, rigs, n, dtype=np.float32):
+    # Tablica robocza (rig, próbka) z prealokowanego bufora
+    return ws.get(name, rigs * n, dtype).reshape(rigs, n)
+
+# --- PRYMITYWY Z OSIĄ RIGU (odpowiedniki dsp.py) ---
+class BatchOnePole:
+    def __init__(self, coef, rigs):
+        self.coef = coef
+        k = 1.0 - coef
+        self.chunk = int(min(256, max(1, 150 / -np.log10(k))))
+        self.pows = k ** np.arange(1, self.chunk + 1)
+        self.inv_pows = 1.0 / self.pows
+        self.value = np.zeros(rigs)
+        self.ws = Workspace()
+
+    def process(self, x, out):
+        rigs, n = x.shape
+        for i in range(0, n, self.chunk):
+            m = min(self.chunk, n - i)
+            a = _grid(self.ws, 'acc', rigs, m, np.float64)
+            a[:] = x[:, i:i + m]
+            a *= self.inv_pows[:m]
+            np.cumsum(a, axis=1, out=a)
+            a *= self.coef
+            a += self.value[:, None]
+            a *= self.pows[:m]
+            self.value[:] = a[:, -1]
+            out[:, i:i + m] = a
+        return out
+
+class BatchEnvelope:
+    # Jak dsp.EnvelopeFollower: zgadujemy attack/release, poprawiamy, aż
+    # decyzje zgodzą się we wszystkich rigach
+    def __init__(self, release, rigs, chunk=256):
+        self.release = release
+        self.chunk = chunk
+        self.value = np.zeros(rigs)
+        self.ws = Workspace()
+
+    def process(self, level, attack, out):
+        # attack: (rigs, 1)
+        rigs, n = level.shape
+        ws = self.ws
+        e = self.value
+        for i in range(0, n, self.chunk):
+            m = min(self.chunk, n - i)
+            x = _grid(ws, 'x', rigs, m, np.float64)
+            c = _grid(ws, 'c', rigs, m, np.float64)
+            g = _grid(ws, 'g', rigs, m, np.float64)
+            y = _grid(ws, 'y', rigs, m, np.float64)
+            prev = _grid(ws, 'prev', rigs, m, np.float64)
+            rising = _grid(ws, 'rising', rigs, m, np.bool_)
+            actual = _grid(ws, 'actual', rigs, m, np.bool_)
+            flips = _grid(ws, 'flips', rigs, m, np.bool_)
+
+            x[:] = level[:, i:i + m]
+            np.greater(x, e[:, None], out=rising)
+            while True:
+                c.fill(self.release)
+                np.copyto(c, attack, where=rising)
+                np.subtract(1.0, c, out=g)
+                np.cumprod(g, axis=1, out=g)
+                np.multiply(c, x, out=y)
+                y /= g
+                np.cumsum(y, axis=1, out=y)
+                y += e[:, None]
+                y *= g
+
+                prev[:, 0] = e
+                prev[:, 1:] = y[:, :-1]
+                np.greater(x, prev, out=actual)
+                np.not_equal(actual, rising, out=flips)
+                if not flips.any(): break
+                rising, actual = actual, rising
+            out[:, i:i + m] = y
+            e[:] = y[:, -1]
+        return out
+
+class BatchModDelay:
+    # Jak dsp.ModulatedDelayLine: bufor zdublowany, odczyt interpolowany
+    def __init__(self, size, rigs):
+        self.size = size
+        self.buffer = np.zeros((rigs, 2 * size + 1), dtype=np.float32)
+        self.flat = self.buffer.reshape(-1)
+        self.rows = (np.arange(rigs) * (2 * size + 1))[:, None]
+        self.ptr = 0
+        self.ws = Workspace()
+
+    def _read(self, base, delays, out):
+        rigs, n = delays.shape
+        ws = self.ws
+        pos = _grid(ws, 'pos', rigs, n, np.float64)
+        whole = _grid(ws, 'whole', rigs, n, np.float64)
+        i0 = _grid(ws, 'i0', rigs, n, np.int64)
+        frac = _grid(ws, 'frac', rigs, n)
+        s0 = _grid(ws, 's0', rigs, n)
+        s1 = _grid(ws, 's1', rigs, n)
+
+        np.subtract(ws.ramp(n), delays, out=pos)
+        pos += base + self.size
+        np.floor(pos, out=whole)
+        pos -= whole
+        frac[:] = pos
+        np.copyto(i0, whole, casting='unsafe')
+        i0 += self.rows
+        np.take(self.flat, i0, out=s0, mode='clip')
+        i0 += 1
+        np.take(self.flat, i0, out=s1, mode='clip')
+        s1 -= s0
+        s1 *= frac
+        np.add(s0, s1, out=out)
+        return out
+
+    def _write(self, x):
+        end = self.ptr + x.shape[1]
+        self.buffer[:, self.ptr:end] = x
+        self.buffer[:, self.ptr + self.size:end + self.size] = x
+        if self.ptr == 0: self.buffer[:, -1] = x[:, 0]
+        self.ptr = end % self.size
+
+    def process_taps(self, x, delays, outs):
+        # Kilka odczytów bez sprzężenia z jednego zapisu (delays, outs: krotki)
+        n = x.shape[1]
+        cap = max(self.size - int(np.ceil(max((d.max() for d in delays), default=0.0))) - 2, 1)
+        i = 0
+        while i < n:
+            span = min(cap, self.size - self.ptr, n - i)
+            base = self.ptr
+            self._write(x[:, i:i + span])
+            for d, y in zip(delays, outs): self._read(base, d[:, i:i + span], y[:, i:i + span])
+            i += span
+        return outs
+
+    def process(self, x, delays, out, feedback=None):
+        # delays: (rigs, n) w próbkach (>= 1), feedback: (rigs, 1) albo None
+        rigs, n = x.shape
+        cap = max(self.size - int(np.ceil(delays.max())) - 2, 1)
+
+        i = 0
+        while i < n:
+            span = min(cap, self.size - self.ptr, n - i)
+            if feedback is not None:
+                d0 = int(delays[:, i].min())
+                span = max(min(span, int(delays[:, i:i + d0].min())), 1)
+            xs = x[:, i:i + span]
+            ds = delays[:, i:i + span]
+            y = out[:, i:i + span]
+            base = self.ptr
+            if feedback is not None:
+                self._read(base, ds, y)
+                t = _grid(self.ws, 'tmp', rigs, span)
+                np.multiply(y, feedback, out=t)
+                t += xs
+                self._write(t)
+            else:
+                self._write(xs)
+                self._read(base, ds, y)
+            i += span
+        return out
+
+class BatchFeedbackDelay:
+    # Jak dsp.FeedbackDelay, ale opóźnienie może być inne w każdym rigu;
+    # kawałki nie dłuższe niż najkrótsze z nich
+    def __init__(self, size, rigs):
+        self.buffer = np.zeros((rigs, size), dtype=np.float32)
+        self.flat = self.buffer.reshape(-1)
+        self.rows = (np.arange(rigs) * size)[:, None]
+        self.steps = np.arange(size)
+        self.ptr = 0
+        self.ws = Workspace()
+
+    def _read(self, delays, out):
+        rigs, m = out.shape
+        size = self.buffer.shape[1]
+        idx = _grid(self.ws, 'idx', rigs, m, np.int64)
+        np.subtract(self.steps[:m], delays, out=idx)
+        idx += self.ptr
+        np.remainder(idx, size, out=idx)
+        idx += self.rows
+        return np.take(self.flat, idx, out=out, mode='clip')
+
+    def _write(self, x):
+        size = self.buffer.shape[1]
+        end = self.ptr + x.shape[1]
+        if end <= size:
+            self.buffer[:, self.ptr:end] = x
+        else:
+            k = size - self.ptr
+            self.buffer[:, self.ptr:] = x[:, :k]
+            self.buffer[:, :end - size] = x[:, k:]
+        self.ptr = end % size
+
+    def process(self, x, delays, loop, out):
+        # delays: (rigs, 1) int, 1 <= delay <= len(buffer)
+        rigs, n = x.shape
+        step = int(delays.min())
+        for i in range(0, n, step):
+            m = min(step, n - i)
+            d = self._read(delays, _grid(self.ws, 'delayed', rigs, m))
+            self._write(loop(x[:, i:i + m], d, out[:, i:i + m]))
+        return out
+
+class BatchComb:
+    def __init__(self, delay, damp, rigs):
+        self.line = BatchFeedbackDelay(delay, rigs)
+        self.delays = np.full((rigs, 1), delay)
+        self.lp = BatchOnePole(1.0 - damp, rigs)
+        self.ws = Workspace()
+
+    def _loop(self, xs, delayed, out):
+        out[:] = delayed
+        fb = self.lp.process(delayed, _grid(self.ws, 'fb', *delayed.shape))
+        fb *= self.feedback
+        fb += xs
+        return fb
+
+    def process(self, x, feedback, out):
+        self.feedback = feedback
+        return self.line.process(x, self.delays, self._loop, out)
+
+class BatchAllpass:
+    def __init__(self, delay, rigs, gain=0.7):
+        self.line = BatchFeedbackDelay(delay, rigs)
+        self.delays = np.full((rigs, 1), delay)
+        self.gain = gain
+        self.ws = Workspace()
+
+    def _loop(self, xs, delayed, out):
+        v = np.multiply(delayed, self.gain, out=_grid(self.ws, 'v', *delayed.shape))
+        v += xs
+        np.multiply(v, -self.gain, out=out)
+        out += delayed
+        return v
+
+    def process(self, x, out):
+        return self.line.process(x, self.delays, self._loop, out)
+
+# --- EFEKTY Z OSIĄ RIGU ---
+# proto to zwykły efekt z effects.py: daje domyślne gałki i derive(), więc
+# współczynniki liczą się dokładnie tak samo jak w AudioManager.
+class BatchEffect:
+    coef_dtype = np.float32
+
+    def __init__(self, proto, rigs):
+        self.proto = proto
+        self.params = [Params(proto.params) for _ in range(rigs)]
+        self.active = np.zeros(rigs, dtype=bool)
+        self.bypass = np.ones((rigs, 1), dtype=bool)
+        self.coef_key = None
+        self.ws = Workspace()
+
+    def set_active(self, rig, active):
+        self.active[rig] = active
+        self.bypass[rig, 0] = not active
+
+    def coefs(self):
+        # Kolumny współczynników (rigs, 1): float32 do mnożenia bloków, int bez zmian
+        key = tuple(p.version for p in self.params)
+        if key != self.coef_key:
+            rows = [self.proto.derive(p.snapshot()) for p in self.params]
+            cols = []
+            for col in zip(*rows):
+                a = np.array(col)
+                cols.append(a[:, None] if a.dtype.kind == 'i' else a.astype(self.coef_dtype)[:, None])
+            self.coef_cache = tuple(cols)
+            self.coef_key = key
+        return self.coef_cache
+
+    def process(self, signal, out):
+        if not self.active.any(): return signal
+        self.apply(signal, out)
+        np.copyto(out, signal, where=self.bypass)
+        return out
+
+class BatchTU3(BatchEffect):
+    # Analiza jak w AudioManager: próbki do bufora SPSC, FFT poza callbackiem
+    def __init__(self, proto, rigs):
+        super().__init__(proto, rigs)
+        self.tuners = [type(proto)(proto.fs) for _ in range(rigs)]
+
+    def process(self, signal, out):
+        for rig in np.flatnonzero(self.active): self.tuners[rig].ring.push(signal[rig])
+        return signal
+
+class BatchCS3(BatchEffect):
+    def __init__(self, proto, rigs):
+        super().__init__(proto, rigs)
+        self.follower = BatchEnvelope(proto.follower.release, rigs)
+
+    def apply(self, signal, out):
+        attack, thresh, makeup = self.coefs()
+        rigs, n = signal.shape
+        ws = self.ws
+        level = np.abs(signal, out=_grid(ws, 'level', rigs, n))
+        env = self.follower.process(level, attack, _grid(ws, 'env', rigs, n))
+        gain = np.add(env, 0.001, out=_grid(ws, 'gain', rigs, n))
+        np.divide(thresh, gain, out=gain)
+        quiet = np.less_equal(env, thresh, out=_grid(ws, 'quiet', rigs, n, np.bool_))
+        np.copyto(gain, 1.0, where=quiet)
+        gain *= makeup
+        np.multiply(signal, gain, out=out)
+        return np.clip(out, -0.95, 0.95, out=out)
+
+class BatchPS6(BatchEffect):
+    # Jak BossPS6: dwa odczyty z linii z osią rigu, faza okna osobno w każdym
+    # rigu. Rigi w trybie vocodera liczy solowy BossPS6 na gałkach rigu
+    # (FFT i tak idzie ramka po ramce). Współczynniki w float64 - przyrost
+    # fazy zaokrąglony do float32 rozjeżdża okno.
+    coef_dtype = np.float64
+
+    def __init__(self, proto, rigs):
+        super().__init__(proto, rigs)
+        self.line = BatchModDelay(proto.line.size, rigs)
+        self.phase = np.zeros((rigs, 1))
+        self.solo = [None] * rigs
+
+    def _solo(self, rig):
+        if self.solo[rig] is None:
+            self.solo[rig] = type(self.proto)(self.proto.fs)
+            self.solo[rig]._params = self.params[rig]
+        return self.solo[rig]
+
+    def apply(self, signal, out):
+        shift, mix, rate, vocoder = self.coefs()
+        rigs, n = signal.shape
+        ws = self.ws
+        window = self.proto.fs * self.proto.WINDOW_S
+        low = self.proto.MIN_DELAY
+
+        p = _grid(ws, 'phase', rigs, n, np.float64)
+        np.multiply(ws.ramp(n), rate, out=p)
+        p += self.phase
+        np.remainder(p, 1.0, out=p)
+        self.phase += rate * n
+        np.remainder(self.phase, 1.0, out=self.phase)
+        d1 = np.multiply(p, window, out=_grid(ws, 'd1', rigs, n, np.float64))
+        d1 += low
+        d2 = np.add(p, 0.5, out=_grid(ws, 'd2', rigs, n, np.float64))
+        np.remainder(d2, 1.0, out=d2)
+        d2 *= window
+        d2 += low
+        g = np.multiply(p, 2 * np.pi, out=p)
+        np.cos(g, out=g)
+        g *= -0.5
+        g += 0.5
+        t1, t2 = self.line.process_taps(signal, (d1, d2), (_grid(ws, 't1', rigs, n), _grid(ws, 't2', rigs, n)))
+        t1 -= t2
+        t1 *= g
+        t1 += t2
+
+        np.multiply(signal, 1.0 - mix, out=out)
+        t1 *= mix
+        out += t1
+        # Bez przesunięcia wyjście = wejście (linia i tak dostała blok)
+        np.copyto(out, signal, where=shift == 1.0)
+        for rig in np.flatnonzero(vocoder[:, 0] & self.active):
+            self._solo(rig).apply(signal[rig], out[rig])
+        return out
+
+class BatchDS1(BatchEffect):
+    def __init__(self, proto, rigs):
+        super().__init__(proto, rigs)
+        self.tone_lp = BatchOnePole(proto.tone_lp.coef, rigs)
+
+    def apply(self, signal, out):
+        drive, t, level = self.coefs()
+        rigs, n = signal.shape
+        distorted = np.multiply(signal, drive, out=_grid(self.ws, 'distorted', rigs, n))
+        np.clip(distorted, -0.8, 0.8, out=distorted)
+        low_end = self.tone_lp.process(distorted, _grid(self.ws, 'low', rigs, n))
+        low_end *= 1.0 - 2.0 * t
+        np.multiply(distorted, t, out=out)
+        out += low_end
+        out *= level
+        return out
+
+class BatchOD1(BatchEffect):
+    def apply(self, signal, out):
+        drive, level = self.coefs()
+        rigs, n = signal.shape
+        scale = _grid(self.ws, 'scale', rigs, n)
+        scale[:] = drive * 0.7
+        np.copyto(scale, drive, where=np.greater(signal, 0, out=_grid(self.ws, 'pos', rigs, n, np.bool_)))
+        np.multiply(signal, scale, out=out)
+        np.tanh(out, out=out)
+        out *= level
+        return out
+
+class BatchFZ5(BatchEffect):
+    def apply(self, signal, out):
+        gain, level = self.coefs()
+        np.add(signal, 0.1, out=out)
+        out *= gain
+        np.clip(out, -0.9, 0.9, out=out)
+        out *= level
+        return out
+
+class BatchBP1W(BatchEffect):
+    def apply(self, signal, out):
+        drive, level = self.coefs()
+        np.multiply(signal, drive, out=out)
+        shape = np.multiply(out, out, out=_grid(self.ws, 'shape', *signal.shape))
+        shape *= -1.0 / 3.0
+        shape += 1.0
+        out *= shape
+        out *= level
+        return out
+
+class BatchModulation(BatchEffect):
+    # Wspólne dla BF-3 i CE-2W: LFO z fazą na rig + linia z modulacją
+    def __init__(self, proto, rigs):
+        super().__init__(proto, rigs)
+        self.line = BatchModDelay(proto.line.size, rigs)
+        self.phase = np.zeros(rigs)
+
+    def lfo(self, rate, n):
+        step = rate.astype(np.float64) * (2 * np.pi / self.proto.fs)
+        out = _grid(self.ws, 'delays', len(step), n, np.float64)
+        np.multiply(self.ws.ramp(n), step, out=out)
+        out += self.phase[:, None]
+        np.sin(out, out=out)
+        self.phase += step[:, 0] * n
+        np.remainder(self.phase, 2 * np.pi, out=self.phase)
+        return out
+
+class BatchBF3(BatchModulation):
+    def apply(self, signal, out):
+        rate, depth, feedback = self.coefs()
+        delays = self.lfo(rate, signal.shape[1])
+        delays += 1.0
+        delays *= depth.astype(np.float64) / 2.0
+        delays += 20
+        self.line.process(signal, delays, out, feedback)
+        out += signal
+        out *= 0.7
+        return out
+
+class BatchCE2W(BatchModulation):
+    def apply(self, signal, out):
+        rate, depth = self.coefs()
+        delays = self.lfo(rate, signal.shape[1])
+        delays *= depth.astype(np.float64)
+        delays += 400
+        self.line.process(signal, delays, out)
+        out *= 0.8
+        out += signal
+        return out
+
+class BatchDM2W(BatchEffect):
+    def __init__(self, proto, rigs):
+        super().__init__(proto, rigs)
+        self.line = BatchFeedbackDelay(len(proto.line.buffer), rigs)
+        self.lp = BatchOnePole(proto.lp.coef, rigs)
+
+    def _loop(self, current_in, delayed, filtered_delayed):
+        self.lp.process(delayed, filtered_delayed)
+        to_buffer = np.multiply(filtered_delayed, self.feedback, out=_grid(self.ws, 'to_buffer', *delayed.shape))
+        to_buffer += current_in
+        return np.tanh(to_buffer, out=to_buffer)
+
+    def apply(self, signal, out):
+        delays, self.feedback, mix = self.coefs()
+        self.line.process(signal, delays, self._loop, out)
+        out *= mix
+        out += signal
+        return out
+
+class BatchRV6(BatchEffect):
+    def __init__(self, proto, rigs):
+        super().__init__(proto, rigs)
+        fs = proto.fs
+        self.combs = [BatchComb(int(fs * ms / 1000), 0.3, rigs) for ms in proto.COMB_MS]
+        self.allpasses = [BatchAllpass(int(fs * ms / 1000), rigs) for ms in proto.ALLPASS_MS]
+
+    def apply(self, signal, out):
+        decay, level = self.coefs()
+        rigs, n = signal.shape
+        wet_sum = _grid(self.ws, 'wet', rigs, n)
+        wet_sum.fill(0.0)
+        comb_out = _grid(self.ws, 'comb', rigs, n)
+        for comb in self.combs:
+            wet_sum += comb.process(signal, decay, comb_out)
+        for ap in self.allpasses:
+            ap.process(wet_sum, comb_out)
+            wet_sum, comb_out = comb_out, wet_sum
+        np.multiply(wet_sum, level, out=out)
+        out += signal
+        return out
+
+BATCH_EFFECTS = {
+    'tuner': BatchTU3,
+    'comp': BatchCS3,
+    'pitch': BatchPS6,
+    'dist': BatchDS1,
+    'drive': BatchOD1,
+    'fuzz': BatchFZ5,
+    'boost': BatchBP1W,
+    'flanger': BatchBF3,
+    'chorus': BatchCE2W,
+    'delay': BatchDM2W,
+    'reverb': BatchRV6,
+}
+
+# --- SILNIK ---
+# Sterowanie jak w AudioManager (set_effect_state, set_effect_param,
+# load_state, get_state), tylko z numerem rigu. Rig = kanał wejścia/wyjścia.
+class RigEngine:
+    def __init__(self, rigs=4, fs=44100, backend=None):
+        self.rigs = rigs
+        self.backend = backend or default_backend()
+        self.stream = None
+        self.order = [name for name, _ in PEDALBOARD]
+        self.gains = np.ones((rigs, 1), dtype=np.float32)
+        self.eq_params = [Params(DEFAULT_EQ) for _ in range(rigs)]
+        self.amp_key = None
+        self.metrics = CallbackMetrics(['input'] + self.order + ['amp'])
+        self.ws = Workspace()
+        self.chain = {}
+        self.set_samplerate(fs)
+
+    def set_samplerate(self, fs):
+        # Bufory zależą od fs - efekty budujemy od nowa, gałki i włączniki zostają
+        self.fs = fs
+        old = self.chain
+        self.chain = {}
+        for name, cls in PEDALBOARD:
+            fx = BATCH_EFFECTS[name](cls(fs), self.rigs)
+            if name in old:
+                fx.params = old[name].params
+                for rig, active in enumerate(old[name].active): fx.set_active(rig, active)
+            self.chain[name] = fx
+
+    # --- STEROWANIE ---
+    def set_gain(self, rig, value): self.gains[rig, 0] = value
+
+    def set_effect_state(self, rig, name, is_active):
+        if name in self.chain: self.chain[name].set_active(rig, is_active)
+
+    def set_effect_param(self, rig, name, param, value):
+        if name in self.chain and param in self.chain[name].params[rig]:
+            self.chain[name].params[rig][param] = value
+
+    def load_state(self, rig, state):
+        # Format jak get_state / AudioManager.load_state
+        for name, cfg in state.items():
+            if name == 'amp':
+                self.set_gain(rig, cfg.get('gain', float(self.gains[rig, 0])))
+                self.eq_params[rig].update(cfg.get('eq', {}))
+            elif name in self.chain:
+                self.set_effect_state(rig, name, cfg.get('active', False))
+                for param, value in cfg.get('params', {}).items():
+                    self.set_effect_param(rig, name, param, float(value))
+
+    def get_state(self, rig):
+        state = {name: {'active': bool(fx.active[rig]), 'params': fx.params[rig]} for name, fx in self.chain.items()}
+        state['amp'] = {'gain': float(self.gains[rig, 0]), 'eq': self.eq_params[rig]}
+        return state
+
+    def tuner_data(self, rig):
+        tuner = self.chain['tuner'].tuners[rig]
+        tuner.poll()
+        return tuner.get_tuner_data()
+
+    # --- WZMACNIACZ ---
+    def amp_coefs(self):
+        key = tuple(p.version for p in self.eq_params)
+        if key != self.amp_key:
+            rows = [AudioManager._amp_derive(p.snapshot()) for p in self.eq_params]
+            self.amp_cache = tuple(np.array(col, dtype=np.float32)[:, None] for col in zip(*rows))
+            self.amp_key = key
+        return self.amp_cache
+
+    def apply_amp_sim(self, signal, out):
+        drive, volume = self.amp_coefs()
+        np.multiply(signal, drive, out=out)
+        np.tanh(out, out=out)
+        out *= volume
+        return out
+
+    # --- AUDIO ---
+    def process_block(self, indata):
+        # indata: (próbki, kanały), kanał = rig. Wynik: (rig, próbki)
+        metrics = self.metrics
+        metrics.begin_block()
+        t_start = t_prev = perf_counter()
+
+        n = len(indata)
+        signal = _grid(self.ws, 'block_a', self.rigs, n)
+        spare = _grid(self.ws, 'block_b', self.rigs, n)
+
+        cols = min(indata.shape[1], self.rigs)
+        signal[:cols] = indata[:, :cols].T
+        signal[cols:] = 0.0
+        signal *= self.gains
+        t = perf_counter(); metrics.record_stage(0, t - t_prev); t_prev = t
+
+        for i, name in enumerate(self.order, 1):
+            try:
+                result = self.chain[name].process(signal, spare)
+                if result is spare: signal, spare = spare, signal
+            except Exception as e:
+                metrics.record_error(i, e)
+            t = perf_counter(); metrics.record_stage(i, t - t_prev); t_prev = t
+
+        output = self.apply_amp_sim(signal, spare)
+        t = perf_counter(); metrics.record_stage(len(self.order) + 1, t - t_prev)
+
+        metrics.end_block(t - t_start, n / self.fs)
+        return output
+
+    def audio_callback(self, indata, outdata, frames, time, status):
+        if status: self.metrics.record_status(status)
+        outdata[:] = self.process_block(indata).T[:, :outdata.shape[1]]
+
+    def start_streaming(self, device_id):
+        # Jedno urządzenie wielokanałowe: kanał i wejścia -> rig i -> kanał i wyjścia
+        self.stop_streaming()
+        info = self.backend.query_devices(device_id)
+        self.set_samplerate(max(int(info['default_samplerate']), 44100))
+        self.stream = self.backend.open_stream(
+            device=device_id,
+            channels=self.rigs,
+            samplerate=self.fs,
+            callback=self.audio_callback,
+            blocksize=0,
+            latency=None
+        )
+        self.stream.start()
+
+    def stop_streaming(self):
+        if self.stream:
+            try: self.stream.stop(); self.stream.close()
+            except: pass
+            self.stream = None
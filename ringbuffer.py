@@ -0,0 +1,98 @@
+import numpy as np
+
+# --- BUFOR KOŁOWY SPSC (jeden producent, jeden konsument) ---
+# Producent (wątek audio) tylko zapisuje dane i przesuwa write_idx, konsument
+# tylko czyta i przesuwa read_idx. Indeksy rosną monotonicznie, a przypisanie
+# inta pod GIL-em jest atomowe, więc nie potrzeba żadnych blokad.
+# Gdy brakuje miejsca, push() odrzuca cały blok i zwiększa licznik dropped -
+# wątek audio nigdy nie czeka.
+class SPSCRing:
+    def __init__(self, capacity, channels=None, dtype=np.float32):
+        shape = (capacity,) if channels is None else (capacity, channels)
+        self.buffer = np.zeros(shape, dtype=dtype)
+        self.capacity = capacity
+        self.write_idx = 0
+        self.read_idx = 0
+        self.dropped = 0
+
+    def available(self):
+        return self.write_idx - self.read_idx
+
+    def free(self):
+        return self.capacity - (self.write_idx - self.read_idx)
+
+    # --- PRODUCENT ---
+    def reserve(self, n):
+        # Miejsce na n wierszy jako (widok do końca bufora, widok od początku) -
+        # producent pisze prosto w bufor i publikuje przez commit(n).
+        # None = za mało miejsca (blok odrzucony, licznik dropped).
+        if n > self.free():
+            self.dropped += 1
+            return None
+        start = self.write_idx % self.capacity
+        k = min(n, self.capacity - start)
+        return self.buffer[start:start + k], self.buffer[:n - k]
+
+    def commit(self, n):
+        # Publikacja dopiero po zapisaniu danych
+        self.write_idx += n
+
+    def push(self, x):
+        views = self.reserve(len(x))
+        if views is None: return False
+        head, tail = views
+        head[:] = x[:len(head)]
+        tail[:] = x[len(head):]
+        self.commit(len(x))
+        return True
+
+    # --- KONSUMENT ---
+    def pop_into(self, out):
+        n = min(len(out), self.available())
+        start = self.read_idx % self.capacity
+        end = start + n
+        if end <= self.capacity:
+            out[:n] = self.buffer[start:end]
+        else:
+            k = self.capacity - start
+            out[:k] = self.buffer[start:]
+            out[k:n] = self.buffer[:n - k]
+        self.read_idx += n
+        return n
+
+    def clear(self):
+        self.read_idx = self.write_idx
+
+# --- BUFOR HISTORII Z LUSTREM (okno bez kopiowania) ---
+# Każda próbka jest zapisywana dwa razy (pod p i p + size), więc ostatnie
+# size próbek zawsze leżą w pamięci ciągiem i latest() zwraca widok, a nie
+# kopię - nic nie jest przesuwane (np.roll) ani alokowane.
+class HistoryBuffer:
+    def __init__(self, size, dtype=np.float64):
+        self.size = size
+        self.buffer = np.zeros(2 * size, dtype=dtype)
+        self.ptr = 0
+
+    def reset(self):
+        self.buffer[:] = 0
+        self.ptr = 0
+
+    def write(self, x):
+        if len(x) >= self.size:
+            x = x[-self.size:]
+        n = len(x)
+        end = self.ptr + n
+        if end <= self.size:
+            self.buffer[self.ptr:end] = x
+            self.buffer[self.ptr + self.size:end + self.size] = x
+        else:
+            k = self.size - self.ptr
+            self.buffer[self.ptr:self.size] = x[:k]
+            self.buffer[self.ptr + self.size:] = x[:k]
+            self.buffer[:n - k] = x[k:]
+            self.buffer[self.size:self.size + n - k] = x[k:]
+        self.ptr = end % self.size
+
+    def latest(self):
+        # Najstarsza próbka pierwsza
+        return self.buffer[self.ptr:self.ptr + self.size]
@@ -0,0 +1,126 @@
+import argparse
+import json
+import sys
+import threading
+import time
+
+import numpy as np
+
+from backends import VirtualBackend
+
+# --- TEST WYTRZYMAŁOŚCIOWY (soak) ---
+# Cała aplikacja (Flask + Socket.IO + AudioManager + regulator bloku) na
+# urządzeniu wirtualnym (backends.VirtualBackend): zegar woła audio_callback
+# w tempie karty, a w tym czasie klient Socket.IO zasypuje serwer zmianami
+# gałek, włączaniem kostek, nadpróbkowaniem i presetami, drugi odbiera
+# telemetrię, a HTTP co chwilę pyta o metryki. Wynik: bloki, spóźnienia
+# (termin = koniec następnego okresu), xruny, p99 obciążenia i opóźnienie
+# w obie strony. Kod wyjścia 1, gdy spóźnień jest więcej niż --max-misses.
+#
+#   python soak.py                 # godzina, 200 zdarzeń/s
+#   python soak.py -t 60 -r 1000 -b 128 --jitter 0.5
+
+def hammer(client, mgr, presets, rate, stop, counts, seed=0):
+    rng = np.random.default_rng(seed)
+    pedals = [name for name in mgr.order if name != 'tuner']
+    shapers = [name for name in pedals if mgr.chain[name].shaper] + ['amp']
+    eq = list(mgr.eq_params)
+
+    def event():
+        r = rng.random()
+        name = str(rng.choice(pedals))
+        if r < 0.55:
+            param = str(rng.choice(list(mgr.chain[name].params)))
+            return 'update_effect', {'name': name, 'param': param, 'value': float(rng.random())}
+        if r < 0.75: return 'update_param', {'param': str(rng.choice(eq)), 'value': float(rng.uniform(0, 10))}
+        if r < 0.85: return 'change_gain', {'value': float(rng.uniform(0.5, 4.0))}
+        if r < 0.95: return 'toggle_effect', {'name': name, 'active': bool(rng.random() < 0.5)}
+        if r < 0.98 or not presets: return 'set_oversample', {'name': str(rng.choice(shapers)), 'factor': int(rng.choice([1, 2, 4]))}
+        return 'load_preset', {'name': str(rng.choice(presets))}
+
+    while not stop.is_set():
+        kind, data = event()
+        try:
+            client.emit(kind, data)
+            counts['events'] += 1
+        except Exception as e:
+            counts['errors'] += 1
+            counts['last_error'] = repr(e)
+        stop.wait(1.0 / rate)
+
+def soak(seconds=3600.0, rate=200.0, blocksize=None, jitter_ms=0.0, every=10.0, seed=0, log=print):
+    # Aplikacja przebudowana na własnym urządzeniu wirtualnym, niezależnie od
+    # tego, na jakim backendzie moduł app wstał przy imporcie
+    import app as server
+    backend = VirtualBackend(jitter_ms=jitter_ms, seed=seed)
+    server.setup(backend)
+    mgr = server.audio_mgr
+    if blocksize: server.latency.sizes = [blocksize]
+
+    http = server.app.test_client()
+    sio = server.socketio.test_client(server.app)
+    viewer = server.socketio.test_client(server.app)
+    viewer.emit('subscribe', {'streams': ['levels', 'stages', 'tuner']})
+    response = http.post('/api/select_devices', json={'id': 0})
+    if response.status_code != 200: raise RuntimeError(response.get_json())
+
+    stop = threading.Event()
+    counts = {'events': 0, 'errors': 0, 'last_error': None}
+    thread = threading.Thread(target=hammer, args=(sio, mgr, [p['name'] for p in server.presets.list()], rate, stop, counts, seed),
+                              name='soak-hammer', daemon=True)
+    started = time.perf_counter()
+    thread.start()
+    frames = 0
+    try:
+        while (elapsed := time.perf_counter() - started) < seconds:
+            time.sleep(min(every, seconds - elapsed))
+            frames += len(viewer.get_received())
+            metrics = http.get('/api/metrics').get_json()
+            report = http.get('/api/latency').get_json()
+            totals = backend.totals()
+            log(f"{time.perf_counter() - started:8.1f} s | bloki {totals['blocks']:>9} | spóźnione {totals['misses']:>5} "
+                f"| blok {report['blocksize']:>4} | p99 obc. {metrics['load']['p99']:.2f} "
+                f"| w obie strony {report['round_trip_ms']:.1f} ms | zdarzenia {counts['events']}")
+    finally:
+        stop.set()
+        thread.join()
+        server.latency.stop()
+        report, stream = server.latency.report(), mgr.stream
+        mgr.stop_streaming()
+        sio.disconnect()
+        viewer.disconnect()
+
+    metrics = mgr.metrics.snapshot()
+    return {
+        'seconds': time.perf_counter() - started,
+        **backend.totals(),
+        'stream': stream.stats() if stream else None,
+        'xruns': metrics['xruns'],
+        'overruns': metrics['overruns'],
+        'effect_errors': metrics['errors'],
+        'load': metrics['load'],
+        'latency': report,
+        'renegotiations': server.latency.renegotiations,
+        'events': counts['events'],
+        'event_errors': counts['errors'],
+        'last_event_error': counts['last_error'],
+        'telemetry_frames': frames,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="VintageToneLab - test wytrzymałościowy na urządzeniu wirtualnym")
+    parser.add_argument('-t', '--seconds', type=float, default=3600.0)
+    parser.add_argument('-r', '--rate', type=float, default=200.0, help="zdarzenia Socket.IO na sekundę")
+    parser.add_argument('-b', '--blocksize', type=int, default=None, help="stały rozmiar bloku (domyślnie regulator)")
+    parser.add_argument('--jitter', type=float, default=0.0, help="jitter wybudzenia zegara [ms]")
+    parser.add_argument('--every', type=float, default=10.0, help="co ile sekund raport")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-misses', type=int, default=0)
+    args = parser.parse_args()
+
+    result = soak(args.seconds, args.rate, args.blocksize, args.jitter, args.every, args.seed)
+    print(json.dumps(result, indent=2, default=str))
+    sys.exit(1 if result['misses'] > args.max_misses else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+// --- TELEMETRIA: dekoder binarnych ramek (format opisany w telemetry.py) ---
+// Telemetry.subscribe(socket, ['levels', 'stages', 'tuner'], {levels, stages, tuner})
+// Poziomy przychodzą jako {peak, rms} w skali liniowej, null = punkt nie mierzony.
+// Serwer wysyła tylko zmienione strumienie, więc handler odpala się tylko przy zmianie.
+const Telemetry = (() => {
+    const NOTES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"];
+    const NO_VALUE = 255;
+
+    const level = b => b === NO_VALUE ? null : (b === 0 ? 0 : Math.pow(10, (b / 2 - 96) / 20));
+
+    function decodeLevels(bytes) {
+        const out = [];
+        for (let i = 0; i < bytes.length; i += 2) out.push({peak: level(bytes[i]), rms: level(bytes[i + 1])});
+        return out;
+    }
+
+    function decodeTuner(view, off) {
+        const note = view.getUint8(off);
+        if (note === NO_VALUE) return null;
+        return {note: NOTES[note], cents: view.getInt8(off + 1), freq: view.getFloat32(off + 2, true)};
+    }
+
+    // dBFS -> 0..100 % (zakres -60..0 dB)
+    function percent(value) {
+        if (!value) return 0;
+        return Math.max(0, Math.min(100, (20 * Math.log10(value) + 60) / 60 * 100));
+    }
+
+    function subscribe(socket, streams, handlers) {
+        fetch('/api/telemetry').then(r => r.json()).then(layout => {
+            const ids = layout.streams;
+            socket.on('telemetry', buf => {
+                const view = new DataView(buf);
+                let off = 3; // <u8 wersja><u16 tick>
+                while (off + 2 <= view.byteLength) {
+                    const id = view.getUint8(off), len = view.getUint8(off + 1);
+                    off += 2;
+                    const bytes = new Uint8Array(buf, off, len);
+                    if (id === ids.levels && handlers.levels) {
+                        const [input, output] = decodeLevels(bytes);
+                        handlers.levels({input, output});
+                    } else if (id === ids.stages && handlers.stages) {
+                        const meters = {};
+                        decodeLevels(bytes).forEach((v, i) => meters[layout.points[i]] = v);
+                        handlers.stages(meters);
+                    } else if (id === ids.tuner && handlers.tuner) {
+                        handlers.tuner(decodeTuner(view, off));
+                    }
+                    off += len;
+                }
+            });
+            // Subskrypcja także po ponownym połączeniu (serwer zapomina klienta)
+            const send = () => socket.emit('subscribe', {streams});
+            socket.on('connect', send);
+            if (socket.connected) send();
+        });
+    }
+
+    return {subscribe, percent};
+})();
@@ -0,0 +1,90 @@
+import struct
+import threading
+
+import numpy as np
+
+# --- TELEMETRIA (binarne ramki, stały tick, subskrypcje) ---
+# Callback audio zapisuje jeden wiersz na blok: peak i suma kwadratów na
+# wejściu, po każdym kroku planu i na wyjściu (AudioManager.meter_ring).
+# Wątek monitora co tick zlewa wszystkie bloki od poprzedniego ticka
+# (peak = max, RMS z sumy kwadratów) i oddaje je tutaj. Publisher koduje
+# strumienie raz na tick, a każdy klient dostaje tylko te, które zasubskrybował
+# i tylko jeśli zmieniły się od tego, co już u niego jest - cisza przy stałym
+# sygnale to zero wiadomości.
+#
+# Ramka: <u8 wersja><u16 numer ticka>, potem rekordy <u8 strumień><u8 długość><dane>.
+#   levels (0): peak, rms dla wejścia i wyjścia
+#   stages (1): peak, rms dla każdego punktu z meter_points (kolejność z /api/telemetry)
+#   tuner  (2): <u8 nuta 0-11, 255 = brak><i8 centy><f32 częstotliwość>
+# Poziom to bajt: 2 * (dBFS + 96), 0 = cisza, 255 = brak pomiaru (etap nie liczony).
+
+VERSION = 1
+STREAMS = {'levels': 0, 'stages': 1, 'tuner': 2}
+NO_VALUE = 255
+NOTE_NAMES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
+
+def encode_levels(peak, rms):
+    # Przeplecione peak/rms jako bajty dB z krokiem 0.5 dB
+    values = np.empty(2 * len(peak))
+    values[0::2] = peak
+    values[1::2] = rms
+    missing = np.isnan(values)
+    with np.errstate(divide='ignore'):
+        db = 20 * np.log10(np.where(missing, 1.0, values))
+    codes = np.clip(np.round((db + 96) * 2), 0, NO_VALUE - 1)
+    codes[missing] = NO_VALUE
+    return codes.astype(np.uint8).tobytes()
+
+def encode_tuner(info):
+    if not info or info['note'] not in NOTE_NAMES:
+        return struct.pack('<Bbf', NO_VALUE, 0, 0.0)
+    cents = int(np.clip(info['cents'], -128, 127))
+    return struct.pack('<Bbf', NOTE_NAMES.index(info['note']), cents, info.get('freq', 0.0))
+
+class TelemetryPublisher:
+    def __init__(self, points, send):
+        # points: nazwy punktów pomiaru (pierwszy = wejście, ostatni = wyjście)
+        self.points = points
+        self.send = send
+        self.clients = {}
+        self.lock = threading.Lock()
+        self.seq = 0
+
+    # --- SUBSKRYPCJE (wątek Socket.IO) ---
+    def subscribe(self, sid, streams):
+        # Nowa subskrypcja = pełny stan przy najbliższym ticku
+        with self.lock:
+            self.clients[sid] = {STREAMS[s]: None for s in streams if s in STREAMS}
+
+    def unsubscribe(self, sid):
+        with self.lock:
+            self.clients.pop(sid, None)
+
+    def wants(self, stream):
+        with self.lock:
+            return any(STREAMS[stream] in subs for subs in self.clients.values())
+
+    # --- TICK (wątek monitora) ---
+    def encode(self, peak, rms, tuner):
+        ends = [0, len(self.points) - 1]
+        return {
+            STREAMS['levels']: encode_levels(peak[ends], rms[ends]),
+            STREAMS['stages']: encode_levels(peak, rms),
+            STREAMS['tuner']: encode_tuner(tuner),
+        }
+
+    def frames(self, records):
+        # Ramka na klienta: tylko zmienione strumienie z jego subskrypcji
+        self.seq = (self.seq + 1) & 0xFFFF
+        header = struct.pack('<BH', VERSION, self.seq)
+        with self.lock:
+            for sid, last in self.clients.items():
+                body = b''.join(struct.pack('<BB', stream, len(records[stream])) + records[stream]
+                                for stream in last if records[stream] != last[stream])
+                if not body: continue
+                for stream in last: last[stream] = records[stream]
+                yield sid, header + body
+
+    def publish(self, peak, rms, tuner):
+        for sid, frame in list(self.frames(self.encode(peak, rms, tuner))):
+            self.send(sid, frame)
@@ -0,0 +1,40 @@
+import numpy as np
+
+import soak
+from backends import VirtualBackend
+from metrics import XRUN_FLAGS
+
+def test_metrics_endpoint_schema():
+    import app
+    app.audio_mgr.process_block(np.zeros((256, 2), dtype=np.float32))
+    data = app.app.test_client().get('/api/metrics').get_json()
+    summary = {'p50', 'p99', 'max'}
+    assert set(data) == {'blocks', 'window', 'overruns', 'xruns', 'errors', 'stages_us', 'total_us', 'load'}
+    assert data['blocks'] >= 1 and set(data['xruns']) == set(XRUN_FLAGS)
+    assert set(data['stages_us']) == set(app.audio_mgr.metrics.stages)
+    assert all(set(v) == summary for v in data['stages_us'].values())
+    assert set(data['total_us']) == set(data['load']) == summary
+
+def test_socket_handlers_reject_bad_payloads():
+    import app
+    client = app.socketio.test_client(app.app)
+    for data in ({}, {'name': None}, {'name': 7}, ['x']):
+        assert client.emit('load_preset', data, callback=True)['status'] == 'error'
+    assert client.emit('load_preset', {'name': 'nie-ma-takiego'}, callback=True)['status'] == 'error'
+    # Silnik rigów dopiero przy pierwszym użyciu; zły numer rigu = błąd, nie IndexError
+    app.setup(VirtualBackend())
+    assert app.rig_engine is None
+    for kind, data in [('change_gain', {'value': 2.0}), ('update_param', {'param': 'bass', 'value': 5}),
+                       ('toggle_effect', {'name': 'drive', 'active': True}),
+                       ('update_effect', {'name': 'drive', 'param': 'drive', 'value': 0.5})]:
+        for rig in (app.rigs().rigs, -1, 'x', None):
+            assert client.emit(kind, {**data, 'rig': rig}, callback=True) == app.NO_RIG
+    assert client.emit('change_gain', {'rig': 1, 'value': 2.0}, callback=True) != app.NO_RIG
+    assert app.rig_engine.gains[1, 0] == 2.0
+    client.disconnect()
+
+def test_soak_runs_app_on_virtual_device_under_control_traffic():
+    result = soak.soak(seconds=1.5, rate=200, blocksize=512, every=0.5, log=lambda line: None)
+    assert result['blocks'] > 0.8 * 1.5 * 48000 / 512
+    assert result['events'] > 100 and result['event_errors'] == 0 and not result['effect_errors']
+    assert result['telemetry_frames'] > 0 and result['latency']['blocksize'] == 512
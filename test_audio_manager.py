@@ -0,0 +1,393 @@
+import mmap
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from scipy.io import wavfile
+
+import audio_manager
+from audio_manager import AudioManager
+from backends import CallbackFlags, VirtualBackend
+from conftest import FS, blocks, guitar_signal
+from dsp import TransferTable
+from effects import BossRV6, BossTU3
+from latency import LatencyController
+from metrics import CallbackMetrics
+from pipeline import split
+from recorder import DiskRecorder
+from ringbuffer import SPSCRing
+from telemetry import STREAMS, TelemetryPublisher
+
+def test_fused_waveshapers_match_separate_stages():
+    sig = guitar_signal(12000, seed=6)
+    fused, separate = AudioManager(), AudioManager()
+    for mgr in (fused, separate):
+        mgr.set_samplerate(FS)
+        for name in ('dist', 'drive', 'fuzz', 'boost'): mgr.chain[name].active = True
+    for name in ('dist', 'drive', 'fuzz', 'boost'): separate.chain[name].shaper = None
+
+    a = np.concatenate([fused.process_block(np.repeat(b, 2, axis=1)).copy() for b in blocks(sig, [512, 100])])
+    b = np.concatenate([separate.process_block(np.repeat(b, 2, axis=1)).copy() for b in blocks(sig, [512, 100])])
+    # clipping DS-1 sam, potem OD-1 + FZ-5 + BP-1W + wzmacniacz w jednej tablicy,
+    # liczonej w kroku wzmacniacza razem ze stosem barwy
+    assert fused.amp_run == 0 and fused.plan[-1][1] == fused.apply_amp_sim
+    assert not any(isinstance(getattr(step, '__self__', None), TransferTable) for _, step in fused.plan)
+    # Interpolacja gubi tylko ostre załamania krzywych (hard clip)
+    assert np.abs(a - b).max() < 0.01
+    assert np.sqrt(np.mean((a - b) ** 2)) < 1e-4
+
+def test_idle_chain_skips_settled_tails_and_wakes_in_same_block(monkeypatch):
+    managers = []
+    for floor in (None, -1.0): # -1 = pomijanie wyłączone (referencja)
+        mgr = AudioManager(backend=VirtualBackend(realtime=False))
+        mgr.set_samplerate(FS)
+        for name in ('comp', 'flanger', 'chorus', 'delay', 'reverb'): mgr.set_effect_state(name, True)
+        mgr.set_effect_param('delay', 'time', 0.1)
+        if floor is not None: mgr.idle_floor = floor
+        managers.append(mgr)
+    mgr, ref = managers
+    # Ile razy pogłos naprawdę liczył blok (tylko w managerze z pomijaniem)
+    rv6, calls = mgr.chain['reverb'], [0]
+    def counted(signal, out):
+        calls[0] += 1
+        return BossRV6.apply(rv6, signal, out)
+    monkeypatch.setattr(rv6, 'apply', counted)
+    note = np.repeat(guitar_signal(FS // 4, seed=6), 2, axis=1)
+    silence = np.zeros((256, 2), dtype=np.float32)
+    for blk in blocks(note, [256]): mgr.process_block(blk); ref.process_block(blk)
+
+    # Ogony wygasają (DM-2W ~0.8 s przy repeat 0.4, RV-6 ~1.1 s), potem nic się nie liczy
+    for k in range(FS * 4 // 256):
+        out, expected = mgr.process_block(silence).copy(), ref.process_block(silence)
+        assert np.abs(out - expected).max() < 10 * mgr.idle_floor
+        if mgr.idle_all: break
+    assert mgr.idle_all and 0.5 < k * 256 / FS < 3.0, k * 256 / FS
+    assert all(idle[3] and idle[0].energy() == 0.0 for idle in mgr.plan_idle)
+    calls[0] = 0
+    for _ in range(20): assert not mgr.process_block(silence).any()
+    assert calls[0] == 0
+
+    # Pobudka w tym samym bloku, a zegary (LFO) szły dalej w ciszy: wynik jak bez pomijania
+    for _ in range(20): ref.process_block(silence)
+    for blk in blocks(note[:4096], [256]):
+        np.testing.assert_allclose(mgr.process_block(blk), ref.process_block(blk), atol=10 * mgr.idle_floor)
+    assert calls[0] == 16 and not mgr.idle_all
+
+def test_start_streaming_prepares_fs_buffers_before_stream_opens(monkeypatch):
+    fs = 192000
+    mgr = AudioManager(backend=VirtualBackend(samplerate=fs, realtime=False))
+    for name in ('delay', 'reverb', 'tuner'): mgr.set_effect_state(name, True)
+    mgr.set_effect_param('delay', 'time', 1.0)
+    mgr.start_streaming(0, lambda data: None)
+    try:
+        delay, reverb, tuner = mgr.chain['delay'], mgr.chain['reverb'], mgr.chain['tuner']
+        # Bufor DM-2W pod fs strumienia: pełne 0.62 s bez obcinania
+        assert delay.coefs()[0] == int(0.62 * fs) and len(delay.line.buffer) == 2 * fs
+        assert reverb.combs[0].delay == int(fs * BossRV6.COMB_MS[0] / 1000)
+        assert tuner.built_fs == fs
+        # Callback niczego już nie buduje
+        monkeypatch.setattr(BossRV6, '_build', lambda self: pytest.fail("RV-6 przebudowany w callbacku"))
+        monkeypatch.setattr(BossTU3, '_build', lambda self: pytest.fail("TU-3 przebudowany w callbacku"))
+        mgr.stream.run(8)
+        tuner.poll()
+    finally:
+        mgr.stop_streaming()
+
+def test_telemetry_merges_blocks_and_sends_only_changes():
+    mgr = AudioManager()
+    mgr.set_samplerate(FS)
+    mgr.meter_stages = True
+    mgr.chain['drive'].active = True
+    sig = np.repeat(guitar_signal(2048, seed=14), 2, axis=1)
+    out = np.empty_like(sig[:256])
+    for blk in blocks(sig, [256]): mgr.audio_callback(blk, out, len(blk), None, None)
+    rows = np.zeros_like(mgr.meter_ring.buffer)
+    peak, rms = mgr.monitor.merge(rows[:mgr.meter_ring.pop_into(rows)])
+
+    # Wejście: peak/RMS całego sygnału z 8 bloków; wyłączone kostki nie mierzone
+    x = sig[:, 0]
+    np.testing.assert_allclose([peak[0], rms[0]], [np.abs(x).max(), np.sqrt(np.mean(x.astype(np.float64) ** 2))], rtol=1e-5)
+    points = mgr.meter_points
+    assert np.isnan(peak[points.index('fuzz')]) and not np.isnan(peak[points.index('drive')])
+
+    sent = []
+    pub = TelemetryPublisher(points, lambda sid, frame: sent.append((sid, frame)))
+    pub.subscribe('a', ['levels'])
+    pub.subscribe('b', ['stages', 'tuner'])
+    pub.publish(peak, rms, {'note': 'E', 'cents': -3, 'freq': 82.3})
+    frames = dict(sent)
+    # nagłówek 3 B + rekord: id, długość, 2 punkty x (peak, rms) / wszystkie punkty + tuner 6 B
+    assert len(frames['a']) == 3 + 2 + 4
+    assert len(frames['b']) == 3 + 2 + 2 * len(points) + 2 + 6
+    assert frames['a'][3] == STREAMS['levels']
+
+    sent.clear()
+    pub.publish(peak, rms, {'note': 'E', 'cents': -3, 'freq': 82.3})
+    assert sent == []
+    pub.publish(peak, rms, None)
+    assert [sid for sid, _ in sent] == ['b'] and len(sent[0][1]) == 3 + 2 + 6
+
+def test_preset_switch_crossfades_then_runs_prepared_chain():
+    state = {'drive': {'active': True, 'params': {'drive': 0.8}}, 'delay': {'active': True, 'params': {}},
+             'amp': {'gain': 2.0, 'eq': {'bass': 0.7}}}
+    mgr, ref = AudioManager(), AudioManager()
+    for m in (mgr, ref): m.set_samplerate(FS)
+    mgr.chain['chorus'].active = True
+    sig = np.repeat(guitar_signal(8192, seed=15), 2, axis=1)
+    for blk in blocks(sig[:1024], [256]): mgr.process_block(blk)
+
+    mgr.switch_state(state, blocksize=256, immediate=False)
+    # Referencja: ten sam preset, ta sama rozgrzewka, potem te same bloki
+    ref.load_state(state)
+    ref.process_block(np.zeros((256, 2), dtype=np.float32))
+    fade = len(mgr.incoming.fade_in)
+    got, expected = [], []
+    for blk in blocks(sig[1024:], [256]):
+        got.append(mgr.process_block(blk).copy())
+        expected.append(ref.process_block(blk).copy())
+    got, expected = np.concatenate(got), np.concatenate(expected)
+
+    assert mgr.incoming is None and mgr.chain['drive'].active and not mgr.chain['chorus'].active
+    assert all(getattr(step, '__self__', None) is not mgr.retired for _, step in mgr.plan)
+    # Po przejściu: dokładnie przygotowany łańcuch; w trakcie bez skoków
+    np.testing.assert_allclose(got[fade:], expected[fade:], atol=1e-6)
+    assert np.abs(np.diff(got[:fade + 1])).max() < 2 * np.abs(np.diff(expected)).max()
+    report = mgr.switch_report()
+    assert report['prepare_ms'] > 0 and report['total_ms'] >= report['fade_ms']
+
+def test_preset_switch_does_not_wait_for_a_callback_that_never_runs(monkeypatch):
+    mgr = AudioManager()
+    mgr.set_samplerate(FS)
+    # Przejście w drodze, ale strumień nie gra: następna zmiana przejmuje je sama
+    mgr.switch_state({'drive': {'active': True}}, blocksize=256, immediate=False)
+    assert mgr.incoming is not None
+    mgr.switch_state({'delay': {'active': True}}, blocksize=256)
+    assert mgr.incoming is None and mgr.chain['delay'].active and not mgr.chain['drive'].active
+
+    # Strumień gra, a callback stoi: błąd po SWITCH_TIMEOUT zamiast wiecznej pętli
+    mgr.switch_state({'chorus': {'active': True}}, blocksize=256, immediate=False)
+    monkeypatch.setattr(mgr, 'stream', SimpleNamespace(active=True))
+    monkeypatch.setattr(mgr, 'SWITCH_TIMEOUT', 0.05)
+    with pytest.raises(TimeoutError):
+        mgr.switch_state({}, blocksize=256)
+    assert not mgr.switch_lock.locked()
+
+def test_recorder_writes_accepted_blocks_and_counts_drops(tmp_path):
+    # Bufor na ~9 bloków, 40 bloków naraz: część musi przepaść, reszta trafia do pliku
+    rec = DiskRecorder(seconds=0.05, max_fs=FS, chunk_seconds=0.02)
+    path = str(tmp_path / 'take.wav')
+    rec.start(path, FS)
+    sig = np.concatenate([guitar_signal(40 * 256, seed=16), guitar_signal(40 * 256, seed=17)], axis=1) * 0.5
+    accepted = []
+    for blk in blocks(sig, [256]):
+        wet = np.tanh(blk[:, 0] * 3).astype(np.float32)
+        if rec.record(blk, wet): accepted.append(np.stack([blk.mean(axis=1), wet], axis=1))
+    status = rec.stop()
+
+    assert status['dropped_blocks'] == 40 - len(accepted) > 0
+    assert status['blocks'] == len(accepted) and not status['recording']
+    fs, data = wavfile.read(path)
+    assert fs == FS and data.shape == (256 * len(accepted), 2)
+    np.testing.assert_allclose(data / 2.0 ** 31, np.concatenate(accepted), atol=3e-7)
+    assert not rec.record(sig[:256], sig[:256, 0])
+
+def test_recorder_stop_while_callback_records(tmp_path):
+    rec = DiskRecorder(seconds=0.5, max_fs=FS, chunk_seconds=0.02, period=0.001)
+    blk = guitar_signal(256, seed=27)
+    wet = blk[:, 0].copy()
+    done = threading.Event()
+    # Szersze okno między sprawdzeniem armed a commit (jak wywłaszczony callback)
+    commit = rec.ring.commit
+    def slow_commit(n):
+        time.sleep(0.001)
+        commit(n)
+    rec.ring.commit = slow_commit
+
+    def callback():
+        while not done.is_set():
+            rec.record(blk, wet)
+            time.sleep(0)
+
+    t = threading.Thread(target=callback)
+    t.start()
+    try:
+        for take in range(20):
+            path = str(tmp_path / f'take{take}.wav')
+            rec.start(path, FS)
+            time.sleep(0.002 * (take % 4))
+            status = rec.stop()
+            # Każdy przyjęty blok jest w pliku, plik zamknięty z poprawnym nagłówkiem
+            assert wavfile.read(path)[1].shape == (256 * status['blocks'], 2)
+            assert round(status['seconds'] * FS) == 256 * status['blocks']
+    finally:
+        done.set()
+        t.join()
+
+def test_looper_records_plays_overdubs_and_survives_preset_switch():
+    mgr = AudioManager()
+    mgr.set_samplerate(FS)
+    looper = mgr.looper
+    looper.max_seconds = 1.0
+    x = np.repeat(guitar_signal(700, seed=18), 2, axis=1)
+    silence = np.zeros((256, 2), dtype=np.float32)
+
+    looper.command('record')
+    for blk in blocks(x, [256]): mgr.process_block(blk)
+    looper.command('press')
+    assert isinstance(looper.loop.base.obj, mmap.mmap)
+    # Pętla 700 próbek gra od początku, z zawinięciem w środku bloku
+    out = np.concatenate([mgr.process_block(silence).copy() for _ in range(4)])
+    recorded = looper.loop[:700].copy()
+    assert looper.mode == 'play' and looper.length == 700
+    np.testing.assert_allclose(out, np.tile(recorded, 2)[:1024], atol=1e-6)
+
+    # Dogrywanie: wyjście = łańcuch + pętla i dokładnie to ląduje w pętli
+    looper.command('press')
+    out = mgr.process_block(x[:256])
+    assert looper.mode == 'overdub'
+    np.testing.assert_allclose(looper.loop[324:580], out, atol=1e-6)
+
+    # Looper stoi za łańcuchem: zmiana presetu nie rusza pętli
+    mgr.switch_state({'drive': {'active': True}}, immediate=True)
+    looper.command('press')
+    out = mgr.process_block(silence)
+    assert looper.mode == 'play' and mgr.chain['drive'].active
+    np.testing.assert_allclose(out, np.tile(looper.loop[:700], 2)[580:836], atol=1e-6)
+
+    looper.command('clear')
+    assert not mgr.process_block(silence).any() and looper.mode == 'empty'
+
+def test_callback_metrics_percentiles_and_xruns():
+    m = CallbackMetrics(['input', 'amp'], capacity=4)
+    flags = CallbackFlags()
+    flags.output_underflow = True
+    # 6 bloków, w oknie zostają ostatnie 4; termin 1 ms, dwa bloki za długie
+    for k, total in enumerate([1e-4, 5e-3, 2e-4, 3e-4, 4e-4, 2e-3]):
+        m.begin_block()
+        m.record_stage(0, total / 4)
+        m.record_stage(1, total / 2)
+        m.record_stage(1, total / 4)
+        if k == 3: m.record_status(flags)
+        m.end_block(total, 1e-3)
+    m.record_error(1, ValueError('x'))
+    snap = m.snapshot()
+    window = np.array([2e-4, 3e-4, 4e-4, 2e-3])
+    assert snap['blocks'] == 6 and snap['window'] == 4 and snap['overruns'] == 2
+    assert snap['xruns']['output_underflow'] == 1 and sum(snap['xruns'].values()) == 1
+    assert snap['errors'] == {'amp': {'count': 1, 'last': "ValueError('x')"}}
+    np.testing.assert_allclose([snap['total_us'][k] for k in ('p50', 'p99', 'max')],
+                               [np.percentile(window, 50) * 1e6, np.percentile(window, 99) * 1e6, 2e3])
+    np.testing.assert_allclose(snap['stages_us']['amp']['max'], 0.75 * 2e3)
+    np.testing.assert_allclose(snap['load']['max'], 2.0)
+    m.reset()
+    assert m.snapshot()['total_us'] == {'p50': 0.0, 'p99': 0.0, 'max': 0.0}
+
+def test_spsc_ring_wraps_and_drops_on_overflow():
+    ring = SPSCRing(8, channels=2)
+    rows = np.arange(24, dtype=np.float32).reshape(12, 2)
+    out = np.zeros((8, 2), dtype=np.float32)
+    assert ring.push(rows[:5]) and ring.pop_into(out[:3]) == 3
+    np.testing.assert_array_equal(out[:3], rows[:3])
+    # Zapis przez koniec bufora: 3 wiersze na końcu, 3 od początku
+    assert ring.push(rows[5:11]) and ring.available() == 8 and ring.free() == 0
+    # Pełny: blok odrzucony w całości, dane bez zmian
+    assert not ring.push(rows[11:12]) and ring.dropped == 1
+    assert ring.pop_into(out) == 8
+    np.testing.assert_array_equal(out, rows[3:11])
+    assert ring.pop_into(out) == 0 and ring.free() == 8
+
+def test_latency_controller_picks_smallest_block_and_renegotiates(monkeypatch):
+    # Zegar callbacku sterowany z testu: jedyny koszt to RV-6 (cost ms na blok)
+    clock, cost = [0.0], [2e-3]
+    monkeypatch.setattr(audio_manager, 'perf_counter', lambda: clock[0])
+    apply = BossRV6.apply
+    def costly(self, signal, out):
+        clock[0] += cost[0]
+        return apply(self, signal, out)
+    monkeypatch.setattr(BossRV6, 'apply', costly)
+
+    mgr = AudioManager(backend=VirtualBackend(realtime=False))
+    mgr.set_samplerate(FS)
+    ctl = LatencyController(mgr, threshold=0.7)
+    assert ctl.update() and ctl.blocksize == 64
+
+    # Pogłos 2 ms: 128 próbek = 2.67 ms (0.75 > 0.7), 256 = 5.33 ms (0.375)
+    mgr.set_effect_state('reverb', True)
+    assert ctl.update() and ctl.blocksize == mgr.stream.blocksize == 256
+    assert ctl.probes[128] > 0.7 > ctl.probes[256]
+    report = ctl.report()
+    assert report['blocksize'] == 256 and report['dsp_ms'] == 0
+    assert abs(report['round_trip_ms'] - (3 * 256 / FS + 0.002) * 1e3) < 1e-9
+
+    # Na żywo drożej niż w próbie (4 ms > 0.7 * 5.33 ms): o rozmiar w górę
+    cost[0] = 4e-3
+    mgr.stream.run(32)
+    assert ctl.update() and ctl.blocksize == 512
+    mgr.stream.run(32)
+    assert not ctl.update()
+
+    # Lżejszy łańcuch = nowa próba i znowu najmniejszy blok; nadpróbkowanie dokłada opóźnienie filtrów
+    mgr.set_effect_state('reverb', False)
+    mgr.set_oversample('amp', 4)
+    assert ctl.update() and ctl.blocksize == 64
+    mgr.stream.run(2)
+    assert mgr.latency_report()['dsp_ms'] == mgr.amp_oversampler.latency / FS * 1e3 > 0
+    assert ctl.renegotiations == 4
+
+def test_virtual_device_paces_callback_and_flags_missed_deadlines(monkeypatch):
+    # 256 próbek przy 48 kHz = 5.33 ms na blok, zegar z jitterem 0.5 ms
+    backend = VirtualBackend(jitter_ms=0.5)
+    mgr = AudioManager(backend=backend)
+    mgr.select_device(0)
+    mgr.open_stream(256)
+    time.sleep(0.4)
+    stream = mgr.stream
+    stats = stream.stats()
+    assert 0.4 / 5.33e-3 * 0.7 < stats['blocks'] < 0.4 / 5.33e-3 * 1.3
+    assert stats['lateness_us']['p50'] < stats['deadline_us'] and np.abs(stream.outdata).max() > 0
+
+    # Kostka dłuższa niż dwa okresy: spóźnienie, zgubione bloki i xrun w metrykach
+    apply = BossRV6.apply
+    monkeypatch.setattr(BossRV6, 'apply', lambda self, signal, out: (time.sleep(0.012), apply(self, signal, out))[1])
+    mgr.set_effect_state('reverb', True)
+    time.sleep(0.2)
+    mgr.stop_streaming()
+    assert stream.misses > 0 and stream.skipped > 0
+    assert mgr.metrics.snapshot()['xruns']['output_underflow'] > 0
+    assert backend.totals()['misses'] == stream.misses
+
+def test_pipeline_splits_by_cost_and_delays_output_by_stages():
+    # Jeden ciężki etap wyznacza czas: dwa segmenty, trzeci nic by nie dał
+    assert split([1e-4] * 4 + [4e-4], 3) == [4]
+    assert split([2e-4] * 4, 3) == [2] and split([3e-4] * 3, 3) == [1, 2]
+    assert split([1e-5] * 4, 4) == []
+
+    def board():
+        mgr = AudioManager(devices=False)
+        mgr.set_samplerate(FS)
+        for name in ['comp', 'pitch', 'drive', 'chorus', 'delay', 'reverb']: mgr.set_effect_state(name, True)
+        return mgr
+    block = 256
+    x = guitar_signal(block * 40)
+    serial, piped = board(), board()
+    piped.set_pipeline(3, (4, 10))
+    run = lambda mgr: np.concatenate([mgr.process_block(x[i:i + block]).copy() for i in range(0, len(x), block)])
+    a, b = run(serial), run(piped)
+    # Ten sam dźwięk, dokładnie o dwa bloki później (LFO nie liczą ciszy na rozbiegu)
+    assert not b[:2 * block].any() and np.array_equal(b[2 * block:], a[:-2 * block])
+    report = piped.latency_report()
+    assert report['pipeline_stages'] == 3 and report['pipeline_ms'] == 2 * block / FS * 1e3
+
+    # Podział z czasów etapów; preset dostaje potok, stary zamykamy przy następnej zmianie
+    times = piped.metrics.times
+    times[:] = 1e-5
+    times[[3, 10, 11]] = 4e-4 # PS-6, DM-2W, RV-6
+    assert piped.rebalance() and piped.pipeline.cuts == (5, 11)
+    old = piped.pipeline
+    piped.switch_state(piped.get_state())
+    assert piped.pipeline is not old and piped.pipeline.stages == 3
+    piped.switch_state(piped.get_state())
+    assert old.closed and not any(t.is_alive() for t in old.threads)
+    piped.set_pipeline(1)
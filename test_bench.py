@@ -0,0 +1,17 @@
+import bench
+from conftest import FS
+
+def test_bench_results_share_schema_and_compare_per_mode(tmp_path, monkeypatch, capfd):
+    # Wyniki --switch/--idle/--modulation nie mają mean_us: każdy tryb porównuje swój czas bloku
+    rows = [{'target': 'chain', 'fs': FS, 'block': 256, 'mean_us': 100.0, 'p99_us': 150.0},
+            {'target': 'switch:clean', 'fs': FS, 'block': 256, 'fade_block_us': 80.0, 'prepare_ms': 3.0},
+            {'target': 'idle', 'fs': FS, 'block': 256, 'idle_us': 5.0, 'play_us': 90.0},
+            {'target': 'mod:flanger', 'fs': FS, 'block': 256, 'p50_us': 12.0, 'per_sample_us': 700.0}]
+    monkeypatch.chdir(tmp_path)
+    old = bench.save_results(str(tmp_path / 'old.json'), rows)
+    assert set(old) == {'meta', 'results'} and old['meta']['commit']
+    assert 'fatal' not in capfd.readouterr().err
+    slower = [{**r, bench._compare_key(r): r[bench._compare_key(r)] * (2.0 if r['target'] == 'idle' else 1.0)}
+              for r in rows]
+    bench.save_results(str(tmp_path / 'new.json'), slower)
+    assert bench.compare(str(tmp_path / 'old.json'), str(tmp_path / 'new.json')) == [(('idle', FS, 256), 2.0)]
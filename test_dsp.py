@@ -0,0 +1,100 @@
+import os
+
+import numpy as np
+from scipy.io import wavfile
+from scipy.signal import sosfilt, sosfreqz
+
+import bench
+from audio_manager import AudioManager
+from conftest import FS, TOL, blocks, guitar_signal, kernel_variants
+from dsp import Oversampler, SOSCascade, load_ir
+
+def test_oversampler_passes_band_with_fixed_latency():
+    t = np.arange(9600) / FS
+    x = (0.5 * np.sin(2 * np.pi * 1000 * t)).astype(np.float32)
+    copy = lambda hi, out: np.copyto(out, hi) or out
+    for factor in (2, 4, 8):
+        os = Oversampler(factor)
+        y = np.concatenate([os.process(b, np.empty_like(b), copy) for b in blocks(x, [256, 7, 1000])])
+        d = os.latency
+        np.testing.assert_allclose(y[d + 100:], x[100:len(x) - d], atol=1e-4)
+
+def test_cabinet_matches_direct_convolution_with_block_latency(tmp_path):
+    path = str(tmp_path / 'cab.wav')
+    rng = np.random.default_rng(10)
+    ir = rng.standard_normal(5000) * np.exp(-np.arange(5000) / 800.0)
+    wavfile.write(path, 44100, ir.astype(np.float32))
+
+    mgr = AudioManager()
+    mgr.set_samplerate(FS)
+    mgr.set_cabinet(path)
+    cab = mgr.cabinet
+    sig = guitar_signal(12000, seed=11)[:, 0]
+    got = np.concatenate([cab.process(b, np.empty(len(b), dtype=np.float32)).copy() for b in blocks(sig, [100, 512, 37])])
+
+    # IR przepróbkowana 44.1 -> 48 kHz, wynik opóźniony dokładnie o blok
+    h = load_ir(path, os.path.getmtime(path), FS)
+    expected = np.concatenate([np.zeros(cab.latency), np.convolve(sig, h)])[:len(sig)]
+    np.testing.assert_allclose(got, expected, atol=1e-5)
+
+    # Zmiana fs przelicza IR, powrót bierze widma z cache
+    spectra = cab.bank['spectra']
+    mgr.set_samplerate(44100)
+    assert len(cab.bank['spectra']) < len(spectra)
+    mgr.set_samplerate(FS)
+    assert cab.bank['spectra'] is spectra
+
+def test_tone_stack_matches_sosfilt_and_follows_knobs():
+    mgr = AudioManager()
+    mgr.set_samplerate(FS)
+    flat = mgr.amp_coefs()[2]
+    w, h = sosfreqz(flat, [100, 650, 3200], fs=FS)
+    np.testing.assert_allclose(np.abs(h), 1.0, atol=1e-9)
+
+    mgr.eq_params.update({'bass': 1.0, 'middle': 0.0})
+    sos = mgr.amp_coefs()[2]
+    w, h = sosfreqz(sos, [40, 650], fs=FS)
+    assert 20 * np.log10(abs(h[0])) > 10 and 20 * np.log10(abs(h[1])) < -10
+
+    sig = guitar_signal(6000, seed=12)[:, 0]
+    expected = sosfilt(sos, sig)
+    for kernel in [None, *kernel_variants('sos_cascade')]:
+        cascade = SOSCascade(len(sos))
+        cascade.kernel = kernel
+        got = np.concatenate([cascade.process(b, np.empty(len(b), dtype=np.float32), sos).copy()
+                              for b in blocks(sig, [256, 31, 1024])])
+        np.testing.assert_allclose(got, expected, **TOL)
+
+def test_tone_stack_fallback_keeps_state_in_place():
+    # Bez kernela: sosfilt alokuje tylko wynik bloku, stan wraca do tego samego zi
+    mgr = AudioManager()
+    mgr.set_samplerate(FS)
+    mgr.eq_params.update({'bass': 1.0, 'middle': 0.0, 'treble': 0.8, 'presence': 0.2})
+    mgr.tone_stack.kernel = None
+    zi = mgr.tone_stack.zi
+    sig = guitar_signal(2048 * 12, seed=25)[:, 0]
+    blks = list(blocks(sig, [2048]))
+    run = bench._mono(mgr.apply_tone_stack)
+    for blk in blks[:4]: run(blk)
+    assert bench._alloc_bytes(run, blks[4:]) < 2048 * 8 + 4096
+    assert mgr.tone_stack.zi is zi
+    np.testing.assert_allclose(zi, sosfilt(mgr.amp_coefs()[2], sig, zi=np.zeros((4, 2)))[1], atol=1e-9)
+
+def test_tone_stack_change_is_interpolated_over_one_block():
+    sig = guitar_signal(1536, seed=13)[:, 0]
+    mgr = AudioManager()
+    mgr.set_samplerate(FS)
+    out = np.empty(512, dtype=np.float32)
+    old = mgr.amp_coefs()[2]
+    for i in (0, 512): mgr.apply_tone_stack(sig[i:i + 512], out)
+    mgr.eq_params['bass'] = 1.0
+    new = mgr.amp_coefs()[2]
+
+    # Z tego samego stanu: stare współczynniki, skok na nowe, przejście
+    zi = mgr.tone_stack.zi.copy()
+    stay, _ = sosfilt(old, sig[1024:], zi=zi)
+    jump, _ = sosfilt(new, sig[1024:], zi=zi)
+    y = mgr.apply_tone_stack(sig[1024:], out)
+    head = slice(0, 64)
+    assert np.abs(y[head] - stay[head]).max() < 0.2 * np.abs(jump[head] - stay[head]).max()
+    assert mgr.tone_stack.sos is new
@@ -0,0 +1,227 @@
+import threading
+import time
+
+import numpy as np
+
+import bench
+from audio_manager import AudioManager
+from backends import VirtualBackend
+from conftest import (FS, TOL, RefDM2W, RefModDelay, apply, blocks, guitar_signal, kernel_variants, ref_cs3, ref_ds1,
+                      run_with_kernel)
+from effects import BossBF3, BossCE2W, BossCS3, BossDM2W, BossDS1, BossFZ5, BossOD1, BossPS6, BossRC1, BossRV6, BossTU3
+
+def test_cs3_matches_per_sample_loop():
+    sig = guitar_signal(8000)
+    fx = BossCS3(FS)
+    fx.params = {'level': 0.3, 'attack': 0.7, 'sustain': 0.8}
+    env = 0.0
+    for blk in blocks(sig, [256, 31, 1, 512, 100]):
+        expected, env = ref_cs3(blk, fx.params, env)
+        np.testing.assert_allclose(apply(fx, blk), expected, **TOL)
+    assert abs(fx.envelope - env) < 1e-5
+
+def test_ds1_carries_tone_state_across_blocks():
+    sig = guitar_signal(4000, seed=1)
+    fx = BossDS1(FS)
+    fx.params = {'dist': 0.4, 'tone': 0.3, 'level': 0.5}
+    curr = 0.0
+    for blk in blocks(sig, [128, 7, 300]):
+        expected, curr = ref_ds1(blk, fx.params, curr)
+        np.testing.assert_allclose(apply(fx, blk), expected, **TOL)
+
+def test_bf3_matches_per_sample_loop_with_feedback():
+    sig = guitar_signal(6000, seed=2)
+    fx = BossBF3(FS)
+    fx.params = {'rate': 0.9, 'depth': 1.0, 'res': 1.0}
+    rate = 0.1 + fx.params['rate'] * 4.0
+    ref = RefModDelay(4000)
+    for blk in blocks(sig, [256, 13, 1024, 3]):
+        delayed = ref.run(blk, lambda s: 20 + (1.0 + s) / 2.0 * 100, 2 * np.pi * rate / FS, 0.8)
+        np.testing.assert_allclose(apply(fx, blk), (blk + delayed) * 0.7, **TOL)
+
+def test_ce2w_matches_per_sample_loop():
+    sig = guitar_signal(6000, seed=3)
+    fx = BossCE2W(FS)
+    fx.params = {'rate': 0.5, 'depth': 1.0}
+    rate = 0.5 + fx.params['rate'] * 3.0
+    ref = RefModDelay(4800)
+    for blk in blocks(sig, [2048, 64, 5]):
+        delayed = ref.run(blk, lambda s: 400 + s * 250, 2 * np.pi * rate / FS, 0.0)
+        np.testing.assert_allclose(apply(fx, blk), blk + delayed * 0.8, **TOL)
+
+def test_dm2w_matches_per_sample_loop():
+    fs = 8000 # krótszy bufor = szybszy test, opóźnienie i tak krótsze niż bloki
+    sig = guitar_signal(12000, seed=4)
+    fx = BossDM2W(fs)
+    fx.params = {'time': 0.05, 'repeat': 1.0, 'intensity': 0.7}
+    delay_samples = int(0.02 * fs + fx.params['time'] * 0.6 * fs)
+    ref = RefDM2W(fs)
+    for blk in blocks(sig, [1024, 333, 2048]):
+        expected = ref.run(blk, delay_samples, 0.9, 0.7)
+        np.testing.assert_allclose(apply(fx, blk), expected, **TOL)
+
+def test_rv6_output_independent_of_block_size():
+    sig = guitar_signal(20000, seed=5)
+    outs = []
+    for sizes in ([20000], [64], [256, 17, 1000]):
+        fx = BossRV6(FS)
+        fx.params = {'time': 1.0, 'level': 1.0}
+        outs.append(np.concatenate([apply(fx, blk) for blk in blocks(sig, sizes)]))
+    np.testing.assert_allclose(outs[1], outs[0], **TOL)
+    np.testing.assert_allclose(outs[2], outs[0], **TOL)
+
+def test_ps6_shifts_octave_without_clicks_in_both_modes():
+    t = np.arange(FS) / FS
+    sig = (0.5 * np.sin(2 * np.pi * 440 * t)).astype(np.float32)[:, None]
+    for mode in (0.0, 1.0):
+        for pitch, target in ((1.0, 880), (0.0, 220)):
+            fx = BossPS6(FS)
+            fx.params = {'pitch': pitch, 'balance': 1.0, 'mode': mode}
+            out = np.concatenate([apply(fx, blk) for blk in blocks(sig, [256, 100])])[:, 0]
+            tail = out[FS // 4:]
+            # Energia w paśmie celu (okno dwóch odczytów dokłada wstęgi co ~33 Hz)
+            power = np.abs(np.fft.rfft(tail * np.hanning(len(tail)))) ** 2
+            freqs = np.fft.rfftfreq(len(tail), 1 / FS)
+            assert power[np.abs(freqs - target) < 50].sum() > 0.95 * power.sum(), (mode, pitch)
+            # Bez trzasków: krok próbka-próbka nie większy niż dla czystego sinusa
+            assert np.abs(np.diff(tail)).max() < 1.2 * 0.5 * 2 * np.pi * target / FS
+
+    # Opóźnienie ramki vocodera wchodzi do opóźnienia łańcucha
+    mgr = AudioManager(backend=VirtualBackend(realtime=False))
+    mgr.set_samplerate(FS)
+    mgr.set_effect_state('pitch', True)
+    mgr.set_effect_param('pitch', 'mode', 1.0)
+    mgr.process_block(np.zeros((256, 2), dtype=np.float32))
+    assert mgr.latency_report()['dsp_ms'] == mgr.chain['pitch'].latency / FS * 1e3 > 0
+
+def test_ps6_vocoder_does_not_allocate_per_frame():
+    # Jak bench.py: szczyt pamięci w jednym bloku. rfft/irfft z out= trzymają
+    # stały narzut (~1.4 KB), tablica binów to już 8 KB na ramkę
+    sig = guitar_signal(FS // 2, seed=7)[:, 0]
+    for pitch in (0.0, 0.8, 1.0):
+        fx = BossPS6(FS)
+        fx.active = True
+        fx.params = {'pitch': pitch, 'balance': 0.5, 'mode': 1.0}
+        run = bench._mono(fx.process)
+        blks = list(blocks(sig, [256]))
+        for blk in blks[:16]: run(blk)
+        assert bench._alloc_bytes(run, blks[16:48]) < 4096
+
+def test_tu3_detects_low_and_drop_tuned_strings():
+    for fs in (44100, 48000, 96000):
+        for freq, note in ((41.2, 'E'), (61.74, 'B'), (73.42, 'D'), (82.41, 'E'), (329.63, 'E'), (987.77, 'B')):
+            tu = BossTU3(fs)
+            tu.active = True
+            t = np.arange(int(fs * 0.3)) / fs
+            sig = 0.3 * np.sin(2 * np.pi * freq * t) + 0.1 * np.sin(2 * np.pi * 2 * freq * t + 1.0)
+            for blk in blocks(sig.astype(np.float32), [256]):
+                assert tu.process(blk) is blk
+                tu.poll()
+            result = tu._detect()
+            assert result['note'] == note
+            assert abs(1200 * np.log2(result['freq'] / freq)) < 3.0
+
+def test_tu3_poll_detects_sine_fed_through_process():
+    tu = BossTU3(FS)
+    tu.active = True
+    t = np.arange(FS // 4) / FS
+    sig = (0.3 * np.sin(2 * np.pi * 110.0 * t)).astype(np.float32)
+    # Wątek audio tylko wrzuca bloki do bufora; analiza w jednym poll()
+    for blk in blocks(sig, [256]): tu.process(blk)
+    assert tu.ring.available() == len(sig)
+    tu.poll()
+    result = tu.get_tuner_data()
+    assert result['note'] == 'A' and abs(result['cents']) <= 3 and abs(result['freq'] - 110.0) < 0.5
+    assert tu.ring.available() == 0
+
+def test_oversampling_reduces_clipping_aliases():
+    t = np.arange(FS) / FS
+    f0 = 4410.0 # harmoniczne > 24 kHz odbijają się między harmoniczne f0
+    x = (0.5 * np.sin(2 * np.pi * f0 * t)).astype(np.float32)
+    freqs = np.fft.rfftfreq(FS - 4800, 1 / FS)
+    harmonic = freqs < 30
+    for k in range(1, 6): harmonic |= np.abs(freqs - k * f0) < 30
+
+    def alias_db(factor):
+        fx = BossFZ5(FS)
+        fx.active = True
+        fx.set_oversample(factor)
+        y = np.concatenate([fx.process(b) for b in blocks(x, [256])])[4800:]
+        spec = np.abs(np.fft.rfft(y * np.hanning(len(y)))) ** 2
+        return 10 * np.log10(spec[~harmonic].sum() / spec[harmonic].sum())
+
+    base, x4 = alias_db(1), alias_db(4)
+    assert x4 < base - 20
+
+def test_coefficients_recomputed_only_after_param_change():
+    fx = BossOD1(FS)
+    calls = []
+    derive = fx.derive
+    fx.derive = lambda p: calls.append(dict(p)) or derive(p)
+    blk = guitar_signal(256)[:, 0]
+    for _ in range(5): apply(fx, blk[:, None])
+    assert len(calls) == 1
+    fx.params['drive'] = 0.9
+    for _ in range(5): apply(fx, blk[:, None])
+    assert len(calls) == 2 and calls[-1]['drive'] == 0.9
+
+def test_level_change_ramps_over_one_block():
+    fx = BossOD1(FS)
+    fx.params = {'drive': 0.5, 'level': 0.5}
+    dc = np.full((256, 1), 0.1, dtype=np.float32)
+    before = apply(fx, dc)[:, 0]
+    fx.params['level'] = 1.0
+    after = apply(fx, dc)[:, 0]
+    # Bez skoku: liniowo od starej wartości, ostatnia próbka już dokładnie nowa
+    steps = np.diff(np.concatenate([before[-1:], after]))
+    np.testing.assert_allclose(steps, steps[0], rtol=1e-3)
+    np.testing.assert_allclose(after[-1], 2 * before[-1], rtol=1e-6)
+
+def test_kernels_match_numpy_fallback():
+    sig = guitar_signal(6000, seed=8)
+    cases = [
+        ('envelope', lambda: BossCS3(FS), lambda fx: fx.follower),
+        ('feedback_delay', lambda: BossDM2W(8000), lambda fx: fx),
+        ('modulated_delay', lambda: BossBF3(FS), lambda fx: fx.line),
+        ('modulated_delay', lambda: BossCE2W(FS), lambda fx: fx.line),
+    ]
+    for name, make, kernel_of in cases:
+        expected = run_with_kernel(make, kernel_of, None, sig, [256, 31, 1024])
+        for kernel in kernel_variants(name):
+            got = run_with_kernel(make, kernel_of, kernel, sig, [256, 31, 1024])
+            np.testing.assert_allclose(got, expected, **TOL)
+
+def test_looper_commands_from_server_thread_while_callback_runs():
+    looper = BossRC1(FS, max_seconds=0.02)
+    looper.params['level'] = 1.0
+    x = guitar_signal(256, seed=24)[:, 0]
+    out = np.zeros_like(x)
+    stop = threading.Event()
+    errors = []
+
+    def server():
+        # Komendy i zmiany fs (restart strumienia) w pętli, bez synchronizacji z callbackiem
+        try:
+            for i in range(400):
+                looper.fs = (FS, 44100)[(i // 50) % 2]
+                looper.command(('record', 'press', 'press', 'press', 'stop', 'clear')[i % 6])
+                time.sleep(0)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            stop.set()
+
+    t = threading.Thread(target=server)
+    t.start()
+    try:
+        while not stop.is_set():
+            looper.process(x, out)
+            if looper.loop is not None:
+                assert len(looper.loop) == int(0.02 * looper.built_fs)
+                assert 0 <= looper.pos <= looper.length <= len(looper.loop) or looper.mode == 'record'
+                assert looper.pos <= len(looper.loop)
+    finally:
+        t.join()
+    assert not errors
+    looper.process(x, out)
+    assert not looper.commands and looper.built_fs == looper.fs
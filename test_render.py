@@ -0,0 +1,60 @@
+import json
+
+import numpy as np
+from scipy.io import wavfile
+
+import render
+import tonematch
+from audio_manager import AudioManager
+from conftest import FS, blocks, guitar_signal
+
+def test_render_file_matches_live_chain_and_process_pool(tmp_path):
+    preset = {'drive': {'active': True, 'params': {'drive': 0.6}}, 'delay': {'active': True, 'params': {'time': 0.1}},
+              'amp': {'gain': 0.8, 'eq': {'bass': 0.7}}}
+    with open(tmp_path / 'crunch.json', 'w') as f: json.dump(preset, f)
+    inputs = []
+    for k, fs in enumerate((44100, FS)):
+        sig = np.repeat(guitar_signal(fs // 2 + 123, seed=26 + k), 2, axis=1)
+        path = str(tmp_path / f'di{k}.wav')
+        wavfile.write(path, fs, (sig * 32767).astype(np.int16))
+        inputs.append((path, fs))
+
+    # Ten sam łańcuch w procesie: te same bloki z pliku, ten sam zapis PCM
+    path, fs = inputs[0]
+    r = render.render_file(path, str(tmp_path / 'one.wav'), preset, blocksize=1024)
+    _, pcm = wavfile.read(path)
+    mgr = AudioManager()
+    mgr.set_samplerate(fs)
+    mgr.load_state(preset)
+    x = render.pcm_to_float(pcm.tobytes(), 2, 2)
+    expected = np.concatenate([mgr.process_block(b).copy() for b in blocks(x, [1024])])
+    got_fs, got = wavfile.read(tmp_path / 'one.wav')
+    assert got_fs == fs and got.dtype == np.int16 and got.shape == (len(x),)
+    assert np.abs(got.astype(np.int32) - np.frombuffer(render.float_to_pcm(expected, 2), '<i2')).max() <= 1
+    assert r['seconds'] == len(x) / fs
+
+    results, summary = render.render_many([p for p, _ in inputs], str(tmp_path / 'out'), [str(tmp_path / 'crunch.json')],
+                                          blocksize=1024, workers=2)
+    assert summary['files'] == 2 and [r['input'] for r in results] == [p for p, _ in inputs]
+    for r, (path, fs) in zip(results, inputs):
+        assert r['output'].endswith('__crunch.wav')
+        out_fs, out = wavfile.read(r['output'])
+        assert out_fs == fs and out.dtype == np.int16 and len(out) == len(wavfile.read(path)[1])
+    np.testing.assert_array_equal(wavfile.read(results[0]['output'])[1], got)
+
+def test_tonematch_finds_target_settings_with_prefix_cache(tmp_path):
+    di = guitar_signal(FS, seed=19)
+    wavfile.write(tmp_path / 'di.wav', FS, (di[:, 0] * 32767).astype(np.int16))
+    _, di = wavfile.read(tmp_path / 'di.wav')
+    di = (di / 32768.0).astype(np.float32)[:, None]
+    base = {'drive': {'active': True, 'params': {'drive': 0.3}}}
+    truth = {'drive.level': 0.5, 'delay.time': 0.4, 'amp.bass': 0.7}
+    y = tonematch.render_span(di, tonematch.apply_params(base, truth), (1, tonematch.END - 1), FS)
+    wavfile.write(tmp_path / 'target.wav', FS, (y / np.abs(y).max() * 32000).astype(np.int16))
+
+    axes = {'delay.time': [0.1, 0.4, 0.7], 'amp.bass': [0.3, 0.7], 'drive.level': [0.25, 0.5]}
+    ranking, summary = tonematch.sweep(str(tmp_path / 'di.wav'), str(tmp_path / 'target.wav'), axes, base, workers=2)
+    # Fragmenty z cache dają ten sam wynik co pełny render: trafienie ~0, reszta daleko
+    assert ranking[0]['params'] == truth and ranking[0]['distance'] < 0.01 < ranking[1]['distance']
+    assert summary['candidates'] == 12 and summary['spans_reused'] > 0
+    assert summary['spans_rendered'] + summary['spans_reused'] < 12 * 3
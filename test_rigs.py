@@ -0,0 +1,43 @@
+import numpy as np
+
+from audio_manager import AudioManager
+from conftest import FS, blocks, guitar_signal
+from rigs import RigEngine
+
+def test_rig_engine_matches_separate_managers(monkeypatch):
+    # Bez tablic przejścia AudioManager liczy waveshapery dokładnie, jak RigEngine
+    monkeypatch.setattr(AudioManager, 'FUSE_MIN', 99)
+    setups = [
+        {'comp': {'sustain': 0.8}, 'dist': {'dist': 0.7}, 'delay': {'time': 0.2}, 'reverb': {}},
+        {'pitch': {'pitch': 0.8}, 'drive': {}, 'chorus': {}, 'flanger': {'res': 0.8}},
+        {'fuzz': {}, 'boost': {}, 'delay': {'time': 0.05, 'intensity': 0.9}, 'pitch': {'pitch': 0.2}},
+    ]
+    engine = RigEngine(len(setups), FS)
+    managers = []
+    for rig, setup in enumerate(setups):
+        mgr = AudioManager()
+        mgr.set_samplerate(FS)
+        managers.append(mgr)
+        for name, params in setup.items():
+            state = {'active': True, 'params': params}
+            mgr.load_state({name: state})
+            engine.load_state(rig, {name: state})
+
+    sig = guitar_signal(16000, seed=9)
+    inputs = np.concatenate([sig * (0.5 + 0.3 * rig) for rig in range(len(setups))], axis=1)
+    got, expected = [], [[] for _ in setups]
+    for k, blk in enumerate(blocks(inputs, [512, 100])):
+        if k == 10:
+            # Zmiana gałki i wyłączenie efektu w jednym rigu w trakcie grania
+            managers[0].set_effect_param('dist', 'tone', 0.9)
+            engine.set_effect_param(0, 'dist', 'tone', 0.9)
+            managers[1].set_effect_state('chorus', False)
+            engine.set_effect_state(1, 'chorus', False)
+        got.append(engine.process_block(blk).copy())
+        for rig, mgr in enumerate(managers):
+            expected[rig].append(mgr.process_block(np.repeat(blk[:, rig:rig + 1], 2, axis=1)).copy())
+
+    got = np.concatenate(got, axis=1)
+    for rig in range(len(setups)):
+        np.testing.assert_allclose(got[rig], np.concatenate(expected[rig]), atol=1e-4)
+    assert engine.get_state(1)['pitch']['params']['pitch'] == 0.8
@@ -0,0 +1,229 @@
+import argparse
+import copy
+import itertools
+import os
+import time
+import wave
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from audio_manager import AudioManager, PEDALBOARD
+from presets import PresetStore
+from render import BLOCKSIZE, pcm_to_float, load_preset
+
+# --- DOPASOWANIE BRZMIENIA (przegląd gałek offline) ---
+# Klip DI przechodzi przez łańcuch dla każdego ustawienia z siatki (albo
+# losowych punktów) wybranych gałek, a wynik porównujemy z nagraniem
+# docelowym przez cechy widmowe. Ranking = odległość cech, najlepsze na górze.
+#
+# Gałki: 'pedał.param' (np. 'delay.time'), 'amp.gain' i 'amp.<gałka EQ>'.
+# Przeglądany pedał jest włączany. Łańcuch jest liczony fragmentami między
+# kolejnymi przeglądanymi etapami (AudioManager.span): wszystko przed
+# pierwszym z nich liczymy raz, a sygnał na wejściu każdego następnego
+# trzymamy, dopóki nie zmienią się gałki przed nim. Kandydaci są posortowani
+# w kolejności łańcucha, więc np. przegląd delaya po ustawieniu drive'a liczy
+# drive raz na jego ustawienie, a nie raz na kandydata. Grupy kolejnych
+# kandydatów idą do puli procesów (jak render_many), DI i cel raz na proces.
+
+ORDER = [name for name, _ in PEDALBOARD]
+AMP = len(ORDER) + 1
+END = AMP + 2 # za kolumną
+
+# --- CECHY WIDMOWE (całe klipy, wektorowo) ---
+NFFT = 2048
+HOP = 512
+BANDS = 40
+MFCC = 13
+FMIN, FMAX = 40.0, 12000.0
+
+@lru_cache(maxsize=8)
+def mel_bank(fs, nfft=NFFT, bands=BANDS):
+    # Trójkątne pasma równomiernie na skali mel: (pasma, biny rfft)
+    mel = np.linspace(*(2595 * np.log10(1 + np.array([FMIN, min(FMAX, fs / 2)]) / 700)), bands + 2)
+    edges = 700 * (10 ** (mel / 2595) - 1)
+    freqs = np.fft.rfftfreq(nfft, 1 / fs)
+    lo, mid, hi = edges[:-2, None], edges[1:-1, None], edges[2:, None]
+    return np.maximum(0.0, np.minimum((freqs - lo) / (mid - lo), (hi - freqs) / (hi - mid)))
+
+@lru_cache(maxsize=1)
+def dct_matrix(bands=BANDS, n=MFCC):
+    # DCT-II ortonormalna: log-mel -> współczynniki cepstralne
+    k = np.arange(n)[:, None]
+    m = np.cos(np.pi * k * (2 * np.arange(bands) + 1) / (2 * bands)) * np.sqrt(2 / bands)
+    m[0] /= np.sqrt(2)
+    return m
+
+def features(x, fs):
+    # [LTAS w pasmach mel (dB, bez średniej), średnie c1..c12, rozrzut c0..c12]
+    # Głośność całego klipu nie gra roli; ramki ciszy (< -60 dB od max) pomijamy.
+    x = np.asarray(x, dtype=np.float64)
+    if len(x) < NFFT: x = np.pad(x, (0, NFFT - len(x)))
+    frames = sliding_window_view(x, NFFT)[::HOP] * np.hanning(NFFT)
+    bands = (np.abs(np.fft.rfft(frames, axis=1)) ** 2) @ mel_bank(fs).T
+    energy = bands.sum(axis=1)
+    bands = bands[energy >= energy.max() * 1e-6]
+    ltas = 10 * np.log10(bands.mean(axis=0) + 1e-12)
+    ltas -= ltas.mean()
+    mfcc = (10 * np.log10(bands + 1e-12)) @ dct_matrix().T
+    return np.concatenate([ltas, mfcc[:, 1:].mean(axis=0), mfcc.std(axis=0)])
+
+def distance(a, b):
+    return float(np.sqrt(np.mean((a - b) ** 2)))
+
+# --- GAŁKI I KANDYDACI ---
+def stage_of(key):
+    # Indeks etapu planu; 'amp.gain' to wzmocnienie wejścia, czyli cały łańcuch
+    name, _, param = key.partition('.')
+    if name == 'amp': return 1 if param == 'gain' else AMP
+    if name not in ORDER or not param: raise ValueError(f"Nieznana gałka: {key}")
+    return ORDER.index(name) + 1
+
+def apply_params(state, values):
+    state = copy.deepcopy(state)
+    for key, value in values.items():
+        name, _, param = key.partition('.')
+        if name == 'amp':
+            amp = state.setdefault('amp', {})
+            if param == 'gain': amp['gain'] = value
+            else: amp.setdefault('eq', {})[param] = value
+        else:
+            fx = state.setdefault(name, {})
+            fx['active'] = True
+            fx.setdefault('params', {})[param] = value
+    return state
+
+def parse_axis(spec):
+    # 'drive.drive=0:1:5' (siatka od:do:ile) albo 'amp.bass=0.2,0.5,0.8'
+    key, _, values = spec.partition('=')
+    stage_of(key)
+    if ':' in values:
+        lo, hi, n = values.split(':')
+        return key, np.linspace(float(lo), float(hi), int(n)).tolist()
+    return key, [float(v) for v in values.split(',')]
+
+def candidates(axes, keys, samples=None, seed=0):
+    # Krotki wartości w kolejności keys, posortowane - wspólne prefiksy obok siebie
+    if samples:
+        rng = np.random.default_rng(seed)
+        lo = np.array([min(axes[k]) for k in keys])
+        hi = np.array([max(axes[k]) for k in keys])
+        points = rng.uniform(lo, hi, (samples, len(keys)))
+        return sorted(tuple(float(v) for v in p) for p in points)
+    return sorted(itertools.product(*(axes[k] for k in keys)))
+
+# --- RENDER FRAGMENTU ŁAŃCUCHA ---
+def render_span(x, state, span, fs, blocksize=BLOCKSIZE):
+    # x: DI (n, kanały), gdy fragment zaczyna się od wejścia, inaczej mono
+    # z poprzedniego fragmentu (wzmocnienie wejścia już w nim jest)
+    mgr = AudioManager(devices=False)
+    mgr.set_samplerate(fs)
+    mgr.load_state(state)
+    mgr.span = span
+    if span[0] > 1:
+        mgr.gain = 1.0
+        x = x[:, None]
+    out = np.empty(len(x), dtype=np.float32)
+    for i in range(0, len(x), blocksize):
+        out[i:i + blocksize] = mgr.process_block(x[i:i + blocksize])
+    return out
+
+_job = {}
+
+def _init_worker(job):
+    _job.update(job)
+
+def _score_group(group):
+    job = _job
+    keys, cuts, before = job['keys'], job['cuts'], job['before']
+    cache = {} # granica -> (gałki przed nią, sygnał na wejściu etapu)
+    scores, rendered, reused = [], 0, 0
+    for values in group:
+        state = apply_params(job['state'], dict(zip(keys, values)))
+        start, x = (cuts[0], job['prefix']) if cuts[0] > 1 else (1, job['di'])
+        # Najpóźniejszy etap, przed którym nic się nie zmieniło
+        for b in reversed(cuts[1:]):
+            hit = cache.get(b)
+            if hit is not None and hit[0] == values[:before[b]]:
+                start, x = b, hit[1]
+                reused += 1
+                break
+        for b in [c for c in cuts if c > start] + [END]:
+            x = render_span(x, state, (start, b - 1), job['fs'], job['blocksize'])
+            rendered += 1
+            if b != END: cache[b] = (values[:before[b]], x)
+            start = b
+        scores.append(distance(features(x, job['fs']), job['target']))
+    return scores, rendered, reused
+
+# --- PRZEGLĄD ---
+def sweep(di_path, target_path, axes, state=None, samples=None, seed=0, workers=None, blocksize=BLOCKSIZE):
+    with wave.open(di_path, 'rb') as src:
+        fs = src.getframerate()
+        di = pcm_to_float(src.readframes(src.getnframes()), src.getsampwidth(), src.getnchannels())
+    with wave.open(target_path, 'rb') as src:
+        target = pcm_to_float(src.readframes(src.getnframes()), src.getsampwidth(), src.getnchannels())
+        target = features(target.mean(axis=1), src.getframerate())
+
+    started = time.perf_counter()
+    state = state or {}
+    keys = sorted(axes, key=stage_of)
+    combos = candidates(axes, keys, samples, seed)
+    stages = [stage_of(k) for k in keys]
+    cuts = sorted(set(stages))
+    job = {
+        'fs': fs, 'di': di, 'target': target, 'state': state, 'keys': keys, 'cuts': cuts, 'blocksize': blocksize,
+        'before': {b: sum(s < b for s in stages) for b in cuts},
+        # Wszystko przed pierwszą przeglądaną gałką - raz dla wszystkich
+        'prefix': render_span(di, state, (1, cuts[0] - 1), fs, blocksize) if cuts[0] > 1 else None,
+    }
+    workers = workers or os.cpu_count()
+    groups = [list(g) for g in np.array_split(np.arange(len(combos)), min(len(combos), workers * 4))]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(job,)) as pool:
+        done = list(pool.map(_score_group, [[combos[i] for i in g] for g in groups]))
+    elapsed = time.perf_counter() - started
+
+    scores = [s for part, _, _ in done for s in part]
+    ranking = sorted(({'params': dict(zip(keys, values)), 'distance': d} for values, d in zip(combos, scores)),
+                     key=lambda r: r['distance'])
+    seconds = len(di) / fs
+    summary = {
+        'candidates': len(combos),
+        'seconds': seconds,
+        'elapsed': elapsed,
+        'realtime_factor': len(combos) * seconds / elapsed if elapsed > 0 else float('inf'),
+        'spans_rendered': sum(r for _, r, _ in done),
+        'spans_reused': sum(r for _, _, r in done),
+    }
+    return ranking, summary
+
+def main():
+    parser = argparse.ArgumentParser(description="VintageToneLab - dopasowanie gałek do nagrania docelowego")
+    parser.add_argument('di', help="klip DI (WAV)")
+    parser.add_argument('target', help="nagranie docelowe (WAV)")
+    parser.add_argument('-s', '--sweep', action='append', required=True,
+                        help="gałka=od:do:ile albo gałka=a,b,c (np. drive.drive=0:1:6, amp.bass=0.3,0.5)")
+    parser.add_argument('-p', '--preset', help="preset JSON jako punkt wyjścia")
+    parser.add_argument('-r', '--random', type=int, default=None, help="N losowych punktów zamiast siatki")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-n', '--top', type=int, default=10)
+    parser.add_argument('-j', '--workers', type=int, default=None)
+    parser.add_argument('-b', '--blocksize', type=int, default=BLOCKSIZE)
+    parser.add_argument('--save', help="zapisz najlepsze ustawienie jako preset o tej nazwie")
+    args = parser.parse_args()
+
+    axes = dict(parse_axis(spec) for spec in args.sweep)
+    state = load_preset(args.preset)
+    ranking, summary = sweep(args.di, args.target, axes, state, args.random, args.seed, args.workers, args.blocksize)
+    for i, r in enumerate(ranking[:args.top], 1):
+        knobs = ' '.join(f"{k}={v:.3f}" for k, v in r['params'].items())
+        print(f"{i:>3}. {r['distance']:7.3f} | {knobs}")
+    print(f"RAZEM: {summary['candidates']} ustawień w {summary['elapsed']:.2f} s "
+          f"({summary['realtime_factor']:.1f}x realtime), fragmenty: {summary['spans_rendered']} liczone, "
+          f"{summary['spans_reused']} z cache")
+    if args.save:
+        PresetStore().save(args.save, apply_params(state, ranking[0]['params']), f"Dopasowanie: {os.path.basename(args.target)}")
+
+if __name__ == '__main__':
+    main()